@@ -6,3 +6,17 @@ HOOK_LOG_SUCCESS = 2
 KOBO_INTERNAL_ERROR_STATUS_CODE = None
 
 SUBMISSION_PLACEHOLDER = '%SUBMISSION%'
+
+# Cache key which queues `deliver_pending_hook_logs` only once per batch
+# (see `HookUtils.schedule_delivery()`)
+HOOK_DELIVERY_SCHEDULED_CACHE_KEY = 'hook_delivery_scheduled'
+
+# Custom Celery state of bulk retries running in the background, and key
+# which cancels them. The key is stored in the Celery result backend, which
+# web processes and workers share (see `cancel_retry_all_task()`)
+HOOK_RETRY_PROGRESS = 'PROGRESS'
+HOOK_RETRY_CANCELLED_KEY = 'hook-retry-cancelled-{retry_id}'
+
+# Cache key of the ids of the active hooks of an asset (see
+# `HookUtils.get_active_hook_ids`)
+HOOK_ACTIVE_IDS_CACHE_KEY = 'hook_active_ids:{asset_id}'
@@ -0,0 +1,405 @@
+# coding: utf-8
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.cookiejar import DefaultCookiePolicy
+from itertools import zip_longest
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+
+import constance
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+from ssrf_protect.ssrf_protect import SSRFProtectException
+
+from kpi.constants import SUBMISSION_FORMAT_TYPE_XML
+from kpi.utils.log import logging
+from .constants import (
+    HOOK_LOG_FAILED,
+    HOOK_LOG_PENDING,
+    KOBO_INTERNAL_ERROR_STATUS_CODE,
+)
+from .models.hook import Hook
+from .models.hook_log import HookLog
+from .models.hook_totals import HookTotals
+from .models.service_definition_interface import ServiceDefinitionInterface
+
+
+class TokenBucket:
+    """
+    Token bucket shared by threads. `acquire()` takes a token, and waits for
+    it if the bucket is empty. The bucket holds up to `capacity` tokens and
+    is refilled with `rate` tokens per second, i.e. bursts of `capacity`
+    calls go through at once, then `rate` calls per second. A `rate` of 0
+    means no limit.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self._rate = rate
+        self._capacity = max(capacity, 1)
+        self._tokens = self._capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self._rate:
+            return
+
+        # Take the token in advance (the count goes negative when the bucket
+        # is empty), then wait outside the lock until it is refilled
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._capacity,
+                self._tokens + (now - self._updated_at) * self._rate,
+            )
+            self._updated_at = now
+            self._tokens -= 1
+            delay = -self._tokens / self._rate
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+class HookDelivery:
+    """
+    Sends pending `HookLog`s, i.e. pairs of hook and submission, by batches:
+
+    - submissions are retrieved with one query per asset and export type;
+    - each endpoint is validated against SSRF once per batch;
+    - requests are sent concurrently by `max_workers` threads through one
+      session per host, which keeps connections alive between batches;
+    - each endpoint receives at most `max_concurrency` requests at a time,
+      and `rate_limit` requests per second after bursts of `burst` requests
+      (see `TokenBucket`);
+    - logs are updated with a single query.
+
+    Retries follow the delays of `HookLog.get_remaining_seconds()`, like
+    `service_definition_task` does, and logs are flagged as failed after
+    `constance.config.HOOK_MAX_RETRIES` retries.
+
+    Usage:
+
+        with HookDelivery() as delivery:
+            delivery.send(HookDelivery.claim(queryset, batch_size))
+    """
+
+    UPDATED_FIELDS = ['tries', 'status', 'status_code', 'message',
+                      'date_modified', 'claimed_until']
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        rate_limit: Optional[float] = None,
+        burst: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+    ):
+        self._max_workers = max_workers or settings.HOOK_DELIVERY_MAX_WORKERS
+        self._rate_limit = (
+            settings.HOOK_DELIVERY_ENDPOINT_RATE_LIMIT
+            if rate_limit is None
+            else rate_limit
+        )
+        self._burst = (
+            settings.HOOK_DELIVERY_ENDPOINT_BURST if burst is None else burst
+        )
+        self._max_concurrency = (
+            max_concurrency
+            or settings.HOOK_DELIVERY_ENDPOINT_MAX_CONCURRENCY
+            or self._max_workers
+        )
+        self._executor = ThreadPoolExecutor(max_workers=self._max_workers)
+        self._allowed_endpoints = {}
+        self._endpoint_limits = {}
+        self._sessions = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+        for session in self._sessions.values():
+            session.close()
+        self._sessions = {}
+
+    @staticmethod
+    def claim(queryset: QuerySet, limit: int) -> list:
+        """
+        Returns up to `limit` logs of `queryset` and claims them for
+        `settings.CELERY_TASK_TIME_LIMIT` seconds, i.e. until the task which
+        sends them is killed at the latest. Logs claimed (or being claimed)
+        by another task are skipped, so that concurrent tasks never send the
+        same logs. `send()` releases them.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            hook_logs = list(
+                queryset.filter(
+                    Q(claimed_until__isnull=True) | Q(claimed_until__lte=now)
+                ).select_for_update(skip_locked=True, of=('self',))[:limit]
+            )
+            HookLog.objects.filter(
+                pk__in=[hook_log.pk for hook_log in hook_logs]
+            ).update(
+                claimed_until=now
+                + timedelta(seconds=settings.CELERY_TASK_TIME_LIMIT)
+            )
+        return hook_logs
+
+    @staticmethod
+    def get_due_hook_logs() -> QuerySet:
+        """
+        Returns pending logs of active hooks which have never been sent, or
+        whose last try failed long enough ago, sorted by primary key
+        """
+        now = timezone.now()
+        due = Q(tries=0)
+        for tries in range(1, constance.config.HOOK_MAX_RETRIES + 1):
+            seconds = HookLog.get_remaining_seconds(tries - 1)
+            due |= Q(
+                tries=tries,
+                date_modified__lte=now - timedelta(seconds=seconds),
+            )
+
+        return HookLog.objects.filter(
+            due, status=HOOK_LOG_PENDING, hook__active=True
+        ).order_by('pk')
+
+    @staticmethod
+    def get_retryable_hook_logs(hook_id: int) -> QuerySet:
+        """
+        Returns failed logs of the hook `hook_id`, and pending ones which
+        should have been sent for long (see `HookLog.can_retry()`), sorted by
+        primary key
+        """
+        seconds = HookLog.get_elapsed_seconds(
+            constance.config.HOOK_MAX_RETRIES
+        )
+        threshold = timezone.now() - timedelta(seconds=seconds)
+        return HookLog.objects.filter(
+            Q(date_modified__lte=threshold, status=HOOK_LOG_PENDING)
+            | Q(status=HOOK_LOG_FAILED),
+            hook_id=hook_id,
+        ).order_by('pk')
+
+    def send(self, hook_logs: list) -> int:
+        """
+        Sends the data of `hook_logs` to the endpoints of their hooks,
+        updates the logs and returns how many of them succeeded
+        """
+        if not hook_logs:
+            return 0
+
+        self._allowed_endpoints = {}
+        hooks = Hook.objects.select_related('asset__owner').in_bulk(
+            {hook_log.hook_id for hook_log in hook_logs}
+        )
+        logs_by_endpoint = defaultdict(list)
+        for hook_log in hook_logs:
+            hook_log.hook = hooks[hook_log.hook_id]
+            logs_by_endpoint[hook_log.hook.endpoint].append(hook_log)
+
+        submissions = self._get_submissions(hook_logs)
+
+        # Interleave endpoints, so that threads are not all held by the rate
+        # limit of the same endpoint
+        results = []
+        for hook_logs_ in zip_longest(*logs_by_endpoint.values()):
+            for hook_log in hook_logs_:
+                if hook_log is None:
+                    continue
+                hook = hook_log.hook
+                submission = submissions.get(
+                    (hook.asset_id, hook.export_type, hook_log.submission_id)
+                )
+                if submission is None:
+                    result = (
+                        KOBO_INTERNAL_ERROR_STATUS_CODE,
+                        'No data available',
+                        False,
+                    )
+                elif not self._is_allowed(hook.endpoint):
+                    result = (
+                        KOBO_INTERNAL_ERROR_STATUS_CODE,
+                        f'{hook.endpoint} is not allowed',
+                        False,
+                    )
+                else:
+                    result = self._executor.submit(
+                        self._post,
+                        hook_log,
+                        submission,
+                        self._get_session(hook.endpoint),
+                        *self._get_endpoint_limits(hook.endpoint),
+                    )
+                results.append((hook_log, result))
+
+        max_retries = constance.config.HOOK_MAX_RETRIES
+        now = timezone.now()
+        success_count = 0
+        # Variations of the number of logs per hook and status
+        totals_deltas = defaultdict(Counter)
+        for hook_log, result in results:
+            if not isinstance(result, tuple):
+                result = result.result()
+            status_code, message, success = result
+            previous_status = hook_log.status
+            ServiceDefinitionInterface.update_log(
+                hook_log, status_code, message, success, max_retries
+            )
+            hook_log.tries += 1
+            hook_log.date_modified = now
+            hook_log.claimed_until = None
+            success_count += success
+            if hook_log.status != previous_status:
+                totals_deltas[hook_log.hook_id][previous_status] -= 1
+                totals_deltas[hook_log.hook_id][hook_log.status] += 1
+
+        HookLog.objects.bulk_update(
+            hook_logs, self.UPDATED_FIELDS, batch_size=500
+        )
+        for hook_id, deltas in totals_deltas.items():
+            HookTotals.update(hook_id, deltas)
+
+        return success_count
+
+    def _get_endpoint_limits(
+        self, endpoint: str
+    ) -> Tuple[TokenBucket, threading.BoundedSemaphore]:
+        """
+        Returns the token bucket and the semaphore which limit the rate and
+        the concurrency of the requests sent to `endpoint`
+        """
+        try:
+            return self._endpoint_limits[endpoint]
+        except KeyError:
+            limits = (
+                TokenBucket(self._rate_limit, self._burst),
+                threading.BoundedSemaphore(self._max_concurrency),
+            )
+            self._endpoint_limits[endpoint] = limits
+            return limits
+
+    def _get_session(self, endpoint: str) -> requests.Session:
+        """
+        Returns the session of the host of `endpoint`, which keeps up to
+        `max_workers` connections alive
+        """
+        host = urlsplit(endpoint).netloc
+        try:
+            return self._sessions[host]
+        except KeyError:
+            pass
+
+        session = requests.Session()
+        # Hooks of different users can share the same host, none of them
+        # must receive the cookies of another one
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=self._max_workers
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        self._sessions[host] = session
+        return session
+
+    def _get_submissions(self, hook_logs: list) -> dict:
+        """
+        Retrieves the submissions of `hook_logs` with one query per asset and
+        export type. Returns them by `(asset id, export type, submission id)`
+        """
+        submission_ids = defaultdict(set)
+        assets = {}
+        for hook_log in hook_logs:
+            hook = hook_log.hook
+            assets[hook.asset_id] = hook.asset
+            submission_ids[(hook.asset_id, hook.export_type)].add(
+                hook_log.submission_id
+            )
+
+        submissions = {}
+        for (asset_id, export_type), ids in submission_ids.items():
+            asset = assets[asset_id]
+            ids = sorted(ids)
+            params = {
+                'submission_ids': ids,
+                'limit': len(ids),
+                'skip_count': True,
+            }
+            try:
+                if export_type == SUBMISSION_FORMAT_TYPE_XML:
+                    # XML submissions come without their ids
+                    matches = asset.deployment.get_xml_submissions_with_ids(
+                        asset.owner, **params
+                    )
+                else:
+                    matches = (
+                        (submission['_id'], submission)
+                        for submission in asset.deployment.get_submissions(
+                            asset.owner, format_type=export_type, **params
+                        )
+                    )
+                for submission_id, submission in matches:
+                    submissions[
+                        (asset_id, export_type, submission_id)
+                    ] = submission
+            except Exception as e:
+                logging.error(
+                    f'HookDelivery._get_submissions: Asset #{asset.uid} - '
+                    f'{str(e)}',
+                    exc_info=True,
+                )
+
+        return submissions
+
+    def _is_allowed(self, endpoint: str) -> bool:
+        """
+        Returns whether `endpoint` passes the SSRF protection. It is checked
+        once per batch.
+        """
+        try:
+            return self._allowed_endpoints[endpoint]
+        except KeyError:
+            pass
+
+        try:
+            ServiceDefinitionInterface.validate_endpoint(endpoint)
+        except SSRFProtectException as e:
+            logging.error(
+                f'HookDelivery._is_allowed: {endpoint} - {str(e)}',
+                exc_info=True,
+            )
+            allowed = False
+        else:
+            allowed = True
+
+        self._allowed_endpoints[endpoint] = allowed
+        return allowed
+
+    @staticmethod
+    def _post(
+        hook_log: HookLog,
+        submission,
+        session: requests.Session,
+        token_bucket: TokenBucket,
+        semaphore: threading.BoundedSemaphore,
+    ) -> Tuple[Optional[int], str, bool]:
+        # Runs in a worker thread: it must not query the database
+        hook = hook_log.hook
+        ServiceDefinition = hook.get_service_definition()
+        service_definition = ServiceDefinition(
+            hook, hook_log.submission_id, submission
+        )
+        with semaphore:
+            token_bucket.acquire()
+            return service_definition.post(
+                session=session, validate_endpoint=False
+            )
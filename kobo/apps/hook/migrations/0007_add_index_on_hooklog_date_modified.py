@@ -0,0 +1,17 @@
+# coding: utf-8
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hook', '0006_rename_instance_id_to_submission_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='hooklog',
+            name='date_modified',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
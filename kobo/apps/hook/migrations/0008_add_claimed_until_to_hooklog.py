@@ -0,0 +1,18 @@
+# Generated by Django 2.2.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hook', '0007_add_index_on_hooklog_date_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hooklog',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hook', '0008_add_claimed_until_to_hooklog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HookTotals',
+            fields=[
+                ('hook', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='totals', serialize=False, to='hook.Hook')),
+                ('success_count', models.IntegerField(default=0)),
+                ('failed_count', models.IntegerField(default=0)),
+                ('pending_count', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
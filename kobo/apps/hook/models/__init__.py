@@ -1,3 +1,4 @@
 # coding: utf-8
 from .hook import Hook
 from .hook_log import HookLog
+from .hook_totals import HookTotals
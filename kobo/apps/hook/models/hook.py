@@ -3,11 +3,18 @@ from importlib import import_module
 
 from django.contrib.postgres.fields import ArrayField
 from django.contrib.postgres.fields import JSONField as JSONBField
+from django.core.cache import cache
 from django.db import models
 from django.utils import timezone
 
 from kpi.fields import KpiUidField
-from ..constants import HOOK_LOG_PENDING, HOOK_LOG_FAILED, HOOK_LOG_SUCCESS
+from ..constants import (
+    HOOK_ACTIVE_IDS_CACHE_KEY,
+    HOOK_LOG_PENDING,
+    HOOK_LOG_FAILED,
+    HOOK_LOG_SUCCESS,
+)
+from .hook_totals import HookTotals
 
 
 class Hook(models.Model):
@@ -61,6 +68,11 @@ class Hook(models.Model):
         # Update date_modified each time object is saved
         self.date_modified = timezone.now()
         super().save(*args, **kwargs)
+        self.invalidate_active_ids()
+
+    def delete(self, *args, **kwargs):
+        super().delete(*args, **kwargs)
+        self.invalidate_active_ids()
 
     def __str__(self):
         return "%s:%s - %s" % (self.asset, self.name, self.endpoint)
@@ -88,19 +100,14 @@ class Hook(models.Model):
         return self.__totals.get(HOOK_LOG_PENDING)
 
     def _get_totals(self):
-        # TODO add some cache
-        queryset = self.logs.values("status").annotate(values_count=models.Count("status"))
-        queryset.query.clear_ordering(True)
-
-        # Initialize totals
-        self.__totals = {
-            HOOK_LOG_SUCCESS: 0,
-            HOOK_LOG_FAILED: 0,
-            HOOK_LOG_PENDING: 0
-        }
-        for record in queryset:
-            self.__totals[record.get("status")] = record.get("values_count")
+        self.__totals = HookTotals.get(self.pk)
 
     def reset_totals(self):
-        # TODO remove cache when it's enabled
         self.__totals = {}
+
+    def invalidate_active_ids(self):
+        """
+        Drop the cached ids of the active hooks of `self.asset` (see
+        `HookUtils.get_active_hook_ids()`)
+        """
+        cache.delete(HOOK_ACTIVE_IDS_CACHE_KEY.format(asset_id=self.asset_id))
@@ -7,6 +7,7 @@ from django.utils import timezone
 from kpi.fields import KpiUidField
 from kpi.utils.log import logging
 from ..constants import HOOK_LOG_PENDING, HOOK_LOG_FAILED, HOOK_LOG_SUCCESS, KOBO_INTERNAL_ERROR_STATUS_CODE
+from .hook_totals import HookTotals
 
 
 class HookLog(models.Model):
@@ -19,11 +20,27 @@ class HookLog(models.Model):
     status_code = models.IntegerField(default=KOBO_INTERNAL_ERROR_STATUS_CODE, null=True, blank=True)
     message = models.TextField(default="")
     date_created = models.DateTimeField(auto_now_add=True)
-    date_modified = models.DateTimeField(auto_now_add=True)
+    date_modified = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Set while a task sends the log, so that concurrent tasks skip it (see
+    # `HookDelivery.claim()`)
+    claimed_until = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ["-date_created"]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Status stored in the database, to keep the totals of the hook in
+        # sync (see `HookTotals`)
+        self.__saved_status = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'status' in field_names:
+            instance.__saved_status = instance.status
+        return instance
+
     def can_retry(self) -> bool:
         """
         Return whether instance can be resent to external endpoint.
@@ -106,6 +123,17 @@ class HookLog(models.Model):
             self.hook.reset_totals()
         super().save(*args, **kwargs)
 
+        if self.status != self.__saved_status:
+            HookTotals.update(
+                self.hook_id, {self.__saved_status: -1, self.status: 1}
+            )
+            self.__saved_status = self.status
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        HookTotals.update(self.hook_id, {self.__saved_status: -1})
+        return result
+
     @property
     def status_str(self):
         if self.status == HOOK_LOG_PENDING:
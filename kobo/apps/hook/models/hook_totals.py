@@ -0,0 +1,131 @@
+# coding: utf-8
+from typing import Dict, Iterable, Optional
+
+from django.db import models, transaction
+from django.db.models import Count, F, Q
+
+from ..constants import HOOK_LOG_FAILED, HOOK_LOG_PENDING, HOOK_LOG_SUCCESS
+
+
+class HookTotals(models.Model):
+    """
+    Number of logs of a hook per status (see `Hook.success_count`,
+    `Hook.failed_count` and `Hook.pending_count`).
+
+    Counts are calculated once with a `GROUP BY status` query, then
+    incremented and decremented with `F()` expressions as logs change status
+    (see `update()`), so that every process reads the same counts. Changes
+    made without going through `update()` (e.g. `QuerySet.update()` or
+    `QuerySet.delete()` on logs) must call `invalidate()`. Counts of deleted
+    hooks are deleted along with them. Counts which may have drifted anyway
+    are recalculated by the `reconcile_hook_totals` periodic task.
+    """
+
+    FIELDS_BY_STATUS = {
+        HOOK_LOG_SUCCESS: 'success_count',
+        HOOK_LOG_FAILED: 'failed_count',
+        HOOK_LOG_PENDING: 'pending_count',
+    }
+
+    hook = models.OneToOneField(
+        'Hook',
+        primary_key=True,
+        related_name='totals',
+        on_delete=models.CASCADE,
+    )
+    success_count = models.IntegerField(default=0)
+    failed_count = models.IntegerField(default=0)
+    pending_count = models.IntegerField(default=0)
+
+    def to_dict(self) -> Dict[int, int]:
+        return {
+            status: getattr(self, field)
+            for status, field in self.FIELDS_BY_STATUS.items()
+        }
+
+    @classmethod
+    def get(cls, hook_id: int) -> Dict[int, int]:
+        """
+        Return the number of logs of `hook_id` per status
+        """
+        try:
+            return cls.objects.get(hook_id=hook_id).to_dict()
+        except cls.DoesNotExist:
+            pass
+
+        cls.reconcile([hook_id])
+        # Read the counts again, another process may have stored (and
+        # updated) them first
+        try:
+            return cls.objects.get(hook_id=hook_id).to_dict()
+        except cls.DoesNotExist:
+            # The hook has been deleted
+            return dict.fromkeys(cls.FIELDS_BY_STATUS, 0)
+
+    @classmethod
+    def invalidate(cls, hook_id: int):
+        cls.objects.filter(hook_id=hook_id).delete()
+
+    @classmethod
+    def reconcile(cls, hook_ids: Iterable[int]) -> Dict[int, Dict[int, int]]:
+        """
+        Count the logs of each of `hook_ids` per status with a single query,
+        store the counts and return them by hook id. Deleted hooks are left
+        out. Counts stored concurrently by another process are kept.
+        """
+        # Avoid circular import
+        from .hook import Hook
+
+        # Annotations must not clash with the properties of `Hook`
+        counts = {
+            f'total_{field}': Count('logs', filter=Q(logs__status=status))
+            for status, field in cls.FIELDS_BY_STATUS.items()
+        }
+        hook_totals = [
+            cls(
+                hook_id=record['pk'],
+                **{
+                    field: record[f'total_{field}']
+                    for field in cls.FIELDS_BY_STATUS.values()
+                },
+            )
+            for record in Hook.objects.filter(pk__in=list(hook_ids))
+            .annotate(**counts)
+            .values('pk', *counts)
+            .order_by()
+        ]
+        with transaction.atomic():
+            cls.objects.filter(
+                hook_id__in=[totals.hook_id for totals in hook_totals]
+            ).delete()
+            # Another process may insert the counts of the same hooks
+            # between the `DELETE` and the `INSERT`
+            cls.objects.bulk_create(hook_totals, ignore_conflicts=True)
+
+        return {totals.hook_id: totals.to_dict() for totals in hook_totals}
+
+    @classmethod
+    def update(cls, hook_id: int, deltas: Dict[Optional[int], int]):
+        """
+        Add `deltas`, i.e. the variations of the number of logs per status, to
+        the counts of `hook_id` with a single query. Counts which have not
+        been calculated yet are left alone, they are calculated when they are
+        read.
+        """
+        cls.update_many([hook_id], deltas)
+
+    @classmethod
+    def update_many(
+        cls, hook_ids: Iterable[int], deltas: Dict[Optional[int], int]
+    ):
+        """
+        Same as `update()` for several hooks at once, with a single query
+        """
+        changes = {
+            cls.FIELDS_BY_STATUS[status]: F(cls.FIELDS_BY_STATUS[status])
+            + delta
+            for status, delta in deltas.items()
+            if status is not None and delta
+        }
+        if changes:
+            cls.objects.filter(hook_id__in=list(hook_ids)).update(**changes)
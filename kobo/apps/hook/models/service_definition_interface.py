@@ -3,6 +3,7 @@ import json
 import os
 import re
 from abc import ABCMeta, abstractmethod
+from typing import Optional, Tuple
 
 import constance
 import requests
@@ -20,21 +21,24 @@ from ..constants import (
 
 class ServiceDefinitionInterface(metaclass=ABCMeta):
 
-    def __init__(self, hook, submission_id):
+    def __init__(self, hook, submission_id, submission=None):
         self._hook = hook
         self._submission_id = submission_id
-        self._data = self._get_data()
+        self._data = self._get_data(submission)
 
-    def _get_data(self):
+    def _get_data(self, submission=None):
         """
-        Retrieves data from deployment backend of the asset.
+        Retrieves data from deployment backend of the asset, unless
+        `submission` has already been retrieved (e.g. in bulk by
+        `HookDelivery`).
         """
         try:
-            submission = self._hook.asset.deployment.get_submission(
-                self._submission_id,
-                user=self._hook.asset.owner,
-                format_type=self._hook.export_type,
-            )
+            if submission is None:
+                submission = self._hook.asset.deployment.get_submission(
+                    self._submission_id,
+                    user=self._hook.asset.owner,
+                    format_type=self._hook.export_type,
+                )
             return self._parse_data(submission, self._hook.subset_fields)
         except Exception as e:
             logging.error(
@@ -73,92 +77,98 @@ class ServiceDefinitionInterface(metaclass=ABCMeta):
 
     def send(self):
         """
-        Sends data to external endpoint
+        Sends data to external endpoint and saves the result in the log
         :return: bool
         """
+        status_code, message, success = self.post()
+        self.save_log(status_code, message, success)
+        return success
+
+    def post(
+        self,
+        session: Optional[requests.Session] = None,
+        validate_endpoint: bool = True,
+    ) -> Tuple[Optional[int], str, bool]:
+        """
+        Sends data to external endpoint through `session` if any, and returns
+        the status code and the content of the response, and whether it
+        succeeded. The log is not saved.
+
+        `validate_endpoint` can be False if the endpoint has already been
+        validated against SSRF (see `validate_endpoint()`).
+        """
+        if not self._data:
+            return KOBO_INTERNAL_ERROR_STATUS_CODE, 'No data available', False
 
-        success = False
         # Need to declare response before requests.post assignment in case of
         # RequestException
         response = None
-        if self._data:
-            try:
-                request_kwargs = self._prepare_request_kwargs()
-
-                # Add custom headers
-                request_kwargs.get("headers").update(
-                    self._hook.settings.get("custom_headers", {}))
-
-                # Add user agent
-                public_domain = "- {} ".format(os.getenv("PUBLIC_DOMAIN_NAME")) \
-                    if os.getenv("PUBLIC_DOMAIN_NAME") else ""
-                request_kwargs.get("headers").update({
-                    "User-Agent": "KoBoToolbox external service {}#{}".format(
-                        public_domain,
-                        self._hook.uid)
+        try:
+            request_kwargs = self._prepare_request_kwargs()
+
+            # Add custom headers
+            request_kwargs.get("headers").update(
+                self._hook.settings.get("custom_headers", {}))
+
+            # Add user agent
+            public_domain = "- {} ".format(os.getenv("PUBLIC_DOMAIN_NAME")) \
+                if os.getenv("PUBLIC_DOMAIN_NAME") else ""
+            request_kwargs.get("headers").update({
+                "User-Agent": "KoBoToolbox external service {}#{}".format(
+                    public_domain,
+                    self._hook.uid)
+            })
+
+            # If the request needs basic authentication with username and
+            # password, let's provide them
+            if self._hook.auth_level == Hook.BASIC_AUTH:
+                request_kwargs.update({
+                    "auth": (self._hook.settings.get("username"),
+                             self._hook.settings.get("password"))
                 })
 
-                # If the request needs basic authentication with username and
-                # password, let's provide them
-                if self._hook.auth_level == Hook.BASIC_AUTH:
-                    request_kwargs.update({
-                        "auth": (self._hook.settings.get("username"),
-                                 self._hook.settings.get("password"))
-                    })
-
-                ssrf_protect_options = {}
-                if constance.config.SSRF_ALLOWED_IP_ADDRESS.strip():
-                    ssrf_protect_options['allowed_ip_addresses'] = constance.\
-                        config.SSRF_ALLOWED_IP_ADDRESS.strip().split('\r\n')
-
-                if constance.config.SSRF_DENIED_IP_ADDRESS.strip():
-                    ssrf_protect_options['denied_ip_addresses'] = constance.\
-                        config.SSRF_DENIED_IP_ADDRESS.strip().split('\r\n')
-
-                SSRFProtect.validate(self._hook.endpoint,
-                                     options=ssrf_protect_options)
-
-                response = requests.post(self._hook.endpoint, timeout=30,
-                                         **request_kwargs)
-                response.raise_for_status()
-                self.save_log(response.status_code, response.text, True)
-                success = True
-            except requests.exceptions.RequestException as e:
-                # If request fails to communicate with remote server.
-                # Exception is raised before request.post can return something.
-                # Thus, response equals None
-                status_code = KOBO_INTERNAL_ERROR_STATUS_CODE
-                text = str(e)
-                if response is not None:
-                    text = response.text
-                    status_code = response.status_code
-                self.save_log(status_code, text)
-            except SSRFProtectException as e:
-                logging.error(
-                    'service_json.ServiceDefinition.send: '
-                    f'Hook #{self._hook.uid} - '
-                    f'Data #{self._submission_id} - '
-                    f'{str(e)}',
-                    exc_info=True)
-                self.save_log(
-                    KOBO_INTERNAL_ERROR_STATUS_CODE,
-                    f'{self._hook.endpoint} is not allowed')
-            except Exception as e:
-                logging.error(
-                    'service_json.ServiceDefinition.send: '
-                    f'Hook #{self._hook.uid} - '
-                    f'Data #{self._submission_id} - '
-                    f'{str(e)}',
-                    exc_info=True)
-                self.save_log(
-                    KOBO_INTERNAL_ERROR_STATUS_CODE,
-                    "An error occurred when sending data to external endpoint")
-        else:
-            self.save_log(
-                KOBO_INTERNAL_ERROR_STATUS_CODE,
-                "No data available")
+            if validate_endpoint:
+                self.validate_endpoint(self._hook.endpoint)
 
-        return success
+            response = (session or requests).post(
+                self._hook.endpoint, timeout=30, **request_kwargs
+            )
+            response.raise_for_status()
+            return response.status_code, response.text, True
+        except requests.exceptions.RequestException as e:
+            # If request fails to communicate with remote server.
+            # Exception is raised before request.post can return something.
+            # Thus, response equals None
+            status_code = KOBO_INTERNAL_ERROR_STATUS_CODE
+            text = str(e)
+            if response is not None:
+                text = response.text
+                status_code = response.status_code
+            return status_code, text, False
+        except SSRFProtectException as e:
+            logging.error(
+                'service_json.ServiceDefinition.send: '
+                f'Hook #{self._hook.uid} - '
+                f'Data #{self._submission_id} - '
+                f'{str(e)}',
+                exc_info=True)
+            return (
+                KOBO_INTERNAL_ERROR_STATUS_CODE,
+                f'{self._hook.endpoint} is not allowed',
+                False,
+            )
+        except Exception as e:
+            logging.error(
+                'service_json.ServiceDefinition.send: '
+                f'Hook #{self._hook.uid} - '
+                f'Data #{self._submission_id} - '
+                f'{str(e)}',
+                exc_info=True)
+            return (
+                KOBO_INTERNAL_ERROR_STATUS_CODE,
+                'An error occurred when sending data to external endpoint',
+                False,
+            )
 
     def save_log(self, status_code: int, message: str, success: bool = False):
         """
@@ -178,9 +188,34 @@ class ServiceDefinitionInterface(metaclass=ABCMeta):
         except HookLog.DoesNotExist:
             log = HookLog(**fields)
 
+        self.update_log(log, status_code, message, success)
+
+        try:
+            log.save()
+        except Exception as e:
+            logging.error(
+                f'ServiceDefinitionInterface.save_log - {str(e)}',
+                exc_info=True,
+            )
+
+    @staticmethod
+    def update_log(
+        log: HookLog,
+        status_code: int,
+        message: str,
+        success: bool = False,
+        max_retries: Optional[int] = None,
+    ):
+        """
+        Sets the status, the status code and the message of `log` after a
+        try, without saving it (nor incrementing its tries)
+        """
+        if max_retries is None:
+            max_retries = constance.config.HOOK_MAX_RETRIES
+
         if success:
             log.status = HOOK_LOG_SUCCESS
-        elif log.tries >= constance.config.HOOK_MAX_RETRIES:
+        elif log.tries >= max_retries:
             log.status = HOOK_LOG_FAILED
 
         log.status_code = status_code
@@ -195,10 +230,19 @@ class ServiceDefinitionInterface(metaclass=ABCMeta):
 
         log.message = message
 
-        try:
-            log.save()
-        except Exception as e:
-            logging.error(
-                f'ServiceDefinitionInterface.save_log - {str(e)}',
-                exc_info=True,
-            )
+    @staticmethod
+    def validate_endpoint(endpoint: str):
+        """
+        Raises `SSRFProtectException` if `endpoint` resolves to an IP address
+        which is not allowed
+        """
+        ssrf_protect_options = {}
+        if constance.config.SSRF_ALLOWED_IP_ADDRESS.strip():
+            ssrf_protect_options['allowed_ip_addresses'] = constance.\
+                config.SSRF_ALLOWED_IP_ADDRESS.strip().split('\r\n')
+
+        if constance.config.SSRF_DENIED_IP_ADDRESS.strip():
+            ssrf_protect_options['denied_ip_addresses'] = constance.\
+                config.SSRF_DENIED_IP_ADDRESS.strip().split('\r\n')
+
+        SSRFProtect.validate(endpoint, options=ssrf_protect_options)
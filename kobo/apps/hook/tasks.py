@@ -1,23 +1,76 @@
 # coding: utf-8
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from operator import itemgetter
 
 import constance
 from celery import shared_task
 from django.conf import settings
+from django.core.cache import cache
 from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection
+from django.db.models import Count, F, QuerySet, Window
+from django.db.models.functions import RowNumber, Substr
 from django.template.loader import get_template
 from django.utils import translation, timezone
 from django_celery_beat.models import PeriodicTask
 
 from kpi.utils.log import logging
-from .constants import HOOK_LOG_FAILED
-from .models import Hook, HookLog
+from .constants import (
+    HOOK_DELIVERY_SCHEDULED_CACHE_KEY,
+    HOOK_LOG_FAILED,
+    HOOK_RETRY_CANCELLED_KEY,
+    HOOK_RETRY_PROGRESS,
+)
+from .delivery import HookDelivery
+from .models import Hook, HookLog, HookTotals
+
+
+@shared_task
+def deliver_pending_hook_logs():
+    """
+    Sends pending `HookLog`s by batches (see `HookDelivery`) until none is
+    due. It is queued when new submissions come (see
+    `HookUtils.schedule_delivery()`) and runs every minute to retry failed
+    tries. Several tasks can run at the same time: each batch is claimed in
+    the database first (see `HookDelivery.claim()`).
+
+    :return: bool
+    """
+    # New logs queue another task from now on
+    cache.delete(HOOK_DELIVERY_SCHEDULED_CACHE_KEY)
+
+    start = time.time()
+    last_pk = 0
+    with HookDelivery() as delivery:
+        while True:
+            # Follow primary keys, so that each log is sent at most once per
+            # task, even if it stays due
+            hook_logs = HookDelivery.claim(
+                HookDelivery.get_due_hook_logs().filter(pk__gt=last_pk),
+                settings.HOOK_DELIVERY_BATCH_SIZE,
+            )
+            if not hook_logs:
+                break
+            delivery.send(hook_logs)
+            last_pk = hook_logs[-1].pk
+
+            # Leave some time before the soft time limit and let a new task
+            # carry on
+            if time.time() - start > settings.CELERY_TASK_SOFT_TIME_LIMIT / 2:
+                deliver_pending_hook_logs.delay()
+                break
+
+    return True
 
 
 @shared_task(bind=True)
 def service_definition_task(self, hook_id, submission_id):
     """
     Tries to send data to the endpoint of the hook
+    Deliveries are now sent by batches by `deliver_pending_hook_logs`, this
+    task only remains for the ones queued beforehand.
     It retries n times (n = `constance.config.HOOK_MAX_RETRIES`)
 
     - after 1 minutes,
@@ -43,18 +96,127 @@ def service_definition_task(self, hook_id, submission_id):
 
 
 @shared_task
-def retry_all_task(hooklogs_ids):
+def reconcile_hook_totals():
     """
-    :param list: <int>.
+    Recalculates the stored totals of hooks whose logs changed since the
+    previous run (see `HookTotals`), in case some increments got lost.
+    :return: bool
     """
-    hook_logs = HookLog.objects.filter(id__in=hooklogs_ids)
-    for hook_log in hook_logs:
-        hook_log.retry()
-        time.sleep(0.2)
+    beat_schedule = settings.CELERY_BEAT_SCHEDULE.get('reconcile-hook-totals')
+    # Use `.first()` instead of `.get()`, because task can be duplicated in
+    # admin section
+    periodic_task = PeriodicTask.objects.filter(
+        enabled=True, task=beat_schedule.get('task')
+    ).order_by('-last_run_at').first()
+    last_run_at = periodic_task.last_run_at if periodic_task else None
+
+    # Store the time of this run in the database, so that every worker
+    # carries on from it. Beat only updates it every 3 minutes (default)
+    PeriodicTask.objects.filter(task=beat_schedule.get('task')).update(
+        last_run_at=timezone.now()
+    )
+
+    queryset = HookLog.objects.all()
+    if last_run_at:
+        # Overlap runs a bit, to catch logs saved during the previous one
+        queryset = queryset.filter(
+            date_modified__gte=last_run_at - timedelta(minutes=5)
+        )
+    hook_ids = list(
+        queryset.values_list('hook_id', flat=True).order_by().distinct()
+    )
+    # Count the logs of 1000 hooks at most per query
+    for start in range(0, len(hook_ids), 1000):
+        HookTotals.reconcile(hook_ids[start:start + 1000])
 
     return True
 
 
+@shared_task(bind=True)
+def retry_all_task(
+    self, hook_id, max_pk, min_pk=0, retry_id=None, progress=None
+):
+    """
+    Sends again the failed (or stuck) logs of the hook `hook_id`, after the
+    log `min_pk` and up to the log `max_pk`, by chunks sorted by primary key.
+    Each chunk goes through `HookDelivery`, i.e. concurrently within the
+    limits of the endpoint.
+
+    The progress is stored in the state of the task. Before the soft time
+    limit, the task queues another one which carries on from the last log
+    sent, and returns its id as `next_task_id` (see
+    `HookViewSet.retry_status()`). Once cancelled, the task stops before the
+    next chunk (see `cancel_retry_all_task()`).
+
+    :param self: Celery.Task.
+    :param hook_id: int. Hook PK
+    :param max_pk: int. PK of the last log to retry
+    :param min_pk: int. PK of the last log already retried
+    :param retry_id: str. Id of the first task of the retry
+    :param progress: dict. Progress of the previous tasks of the retry
+    :return: dict
+    """
+    queryset = HookDelivery.get_retryable_hook_logs(hook_id).filter(
+        pk__lte=max_pk
+    )
+    retry_id = retry_id or self.request.id
+    if progress is None:
+        progress = {'done': 0, 'success': 0, 'total': queryset.count()}
+    cancelled_key = HOOK_RETRY_CANCELLED_KEY.format(retry_id=retry_id)
+
+    start = time.time()
+    last_pk = min_pk
+    with HookDelivery() as delivery:
+        while True:
+            if self.backend.get(cancelled_key):
+                progress['cancelled'] = True
+                break
+
+            hook_logs = HookDelivery.claim(
+                queryset.filter(pk__gt=last_pk),
+                settings.HOOK_DELIVERY_BATCH_SIZE,
+            )
+            if not hook_logs:
+                break
+
+            progress['success'] += delivery.send(hook_logs)
+            progress['done'] += len(hook_logs)
+            last_pk = hook_logs[-1].pk
+            # Results of eager tasks are not stored
+            if not self.request.is_eager:
+                self.update_state(state=HOOK_RETRY_PROGRESS, meta=progress)
+
+            # Leave some time before the soft time limit and let a new task
+            # carry on. Its id keeps the prefix checked by
+            # `HookViewSet.retry_status()`
+            if time.time() - start > settings.CELERY_TASK_SOFT_TIME_LIMIT / 2:
+                next_task_id = f'{retry_id}-{progress["done"]}'
+                retry_all_task.apply_async(
+                    args=(hook_id, max_pk),
+                    kwargs={
+                        'min_pk': last_pk,
+                        'retry_id': retry_id,
+                        'progress': progress,
+                    },
+                    task_id=next_task_id,
+                )
+                return {**progress, 'next_task_id': next_task_id}
+
+    return progress
+
+
+def cancel_retry_all_task(retry_id: str):
+    """
+    Flags the retry started by the task `retry_id` as cancelled. The flag is
+    stored in the Celery result backend, not in the default cache which is
+    local to each process, so that the workers running `retry_all_task` see
+    it. It expires along with the results of the tasks.
+    """
+    retry_all_task.backend.set(
+        HOOK_RETRY_CANCELLED_KEY.format(retry_id=retry_id), 1
+    )
+
+
 @shared_task
 def failures_reports():
     """
@@ -76,10 +238,6 @@ def failures_reports():
         if last_run_at:
             queryset = queryset.filter(date_modified__gte=last_run_at)
 
-        queryset = queryset.order_by('hook__asset__name',
-                                     'hook__uid',
-                                     '-date_modified')
-
         # PeriodicTask are updated every 3 minutes (default).
         # It means, if this task interval is less than 3 minutes, some data can be duplicated in emails.
         # Setting `beat-sync-every` to 1, makes PeriodicTask to be updated before running the task.
@@ -88,76 +246,158 @@ def failures_reports():
         PeriodicTask.objects.filter(task=beat_schedule.get("task")). \
             update(last_run_at=timezone.now())
 
-        records = {}
-        max_length = 0
-
-        # Prepare data for templates.
-        # All logs will be grouped under their respective asset and user.
-        for record in queryset:
-            # if users don't exist in dict, add them
-            if record.hook.asset.owner.id not in records:
-                records[record.hook.asset.owner.id] = {
-                    'username': record.hook.asset.owner.username,
-                    # language is not implemented yet.
-                    # TODO add language to user table in registration process
-                    'language': getattr(record.hook.asset.owner, 'language', 'en'),
-                    'email': record.hook.asset.owner.email,
-                    'assets': {}
-                }
-
-            # if asset doesn't exist in user's asset dict, add it
-            if record.hook.asset.uid not in records[record.hook.asset.owner.id]['assets']:
-                max_length = 0
-                records[record.hook.asset.owner.id]['assets'][record.hook.asset.uid] = {
-                    'name': record.hook.asset.name,
-                    'hook_uid': record.hook.uid,
-                    'max_length': 0,
-                    'logs': []
-                }
-
-            # Add log to corresponding asset and user
-            records[record.hook.asset.owner.id]['assets'][record.hook.asset.uid]['logs'].append({
-                'hook_name': record.hook.name,
-                'uid': record.uid,
-                'date_modified': record.date_modified,
-                'status_code': record.status_code,
-                'message': record.message
-            })
-            hook_name_length = len(record.hook.name)
-
-            # Max Length is used for plain text template. To display fixed size columns.
-            max_length = max(max_length, hook_name_length)
-            records[record.hook.asset.owner.id]['assets'][record.hook.asset.uid]['max_length'] = max_length
-
-        # Get templates
-        plain_text_template = get_template('reports/failures_email_body.txt')
-        html_template = get_template('reports/failures_email_body.html')
-        email_messages = []
-
-        for owner_id, record in records.items():
-            variables = {
-                'username': record.get('username'),
-                'assets': record.get('assets'),
-                'kpi_base_url': settings.KOBOFORM_URL
-            }
-            # Localize templates
-            translation.activate(record.get("language"))
-            text_content = plain_text_template.render(variables)
-            html_content = html_template.render(variables)
-
-            msg = EmailMultiAlternatives(translation.ugettext('REST Services Failure Report'), text_content,
-                                         constance.config.SUPPORT_EMAIL,
-                                         [record.get('email')])
-            msg.attach_alternative(html_content, 'text/html')
-            email_messages.append(msg)
-
-        # Send email messages
-        if len(email_messages) > 0:
-            try:
-                with get_connection() as connection:
-                    connection.send_messages(email_messages)
-            except Exception as e:
-                logging.error('failures_reports - {}'.format(str(e)), exc_info=True)
-                return False
+        records = _get_failures_records(queryset)
+
+        # Render and send emails by batches, each of them through its own
+        # connection
+        records = list(records.values())
+        batch_size = settings.HOOK_FAILURES_REPORT_BATCH_SIZE
+        batches = [
+            records[start:start + batch_size]
+            for start in range(0, len(records), batch_size)
+        ]
+        support_email = constance.config.SUPPORT_EMAIL
+        with ThreadPoolExecutor(
+            max_workers=settings.HOOK_FAILURES_REPORT_MAX_WORKERS
+        ) as executor:
+            return all(executor.map(
+                lambda batch: _send_failures_reports(batch, support_email),
+                batches,
+            ))
+
+    return True
+
+
+def _get_failures_records(queryset: QuerySet) -> dict:
+    """
+    Groups the failed logs of `queryset` under their respective asset and
+    user, with one query. Only the latest
+    `settings.HOOK_FAILURES_REPORT_MAX_LOGS_PER_ASSET` logs of each asset are
+    kept, the others are only counted.
+    """
+    max_logs = settings.HOOK_FAILURES_REPORT_MAX_LOGS_PER_ASSET
+    asset_id = F('hook__asset_id')
+    queryset = (
+        queryset.annotate(
+            owner_id=F('hook__asset__owner'),
+            username=F('hook__asset__owner__username'),
+            email=F('hook__asset__owner__email'),
+            asset_uid=F('hook__asset__uid'),
+            asset_name=F('hook__asset__name'),
+            hook_uid=F('hook__uid'),
+            hook_name=F('hook__name'),
+            # Templates truncate messages anyway
+            message_excerpt=Substr('message', 1, 100),
+            asset_logs_count=Window(Count('pk'), partition_by=[asset_id]),
+            asset_row_number=Window(
+                RowNumber(),
+                partition_by=[asset_id],
+                order_by=F('date_modified').desc(),
+            ),
+        )
+        .values(
+            'uid',
+            'status_code',
+            'date_modified',
+            'owner_id',
+            'username',
+            'email',
+            'asset_uid',
+            'asset_name',
+            'hook_uid',
+            'hook_name',
+            'message_excerpt',
+            'asset_logs_count',
+            'asset_row_number',
+        )
+        .order_by()
+    )
+
+    # Window functions cannot be filtered with the ORM
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT * FROM ({sql}) AS failures '
+            f'WHERE asset_row_number <= %s',
+            [*params, max_logs],
+        )
+        columns = [column[0] for column in cursor.description]
+        logs = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    logs.sort(key=itemgetter('date_modified'), reverse=True)
+    logs.sort(key=itemgetter('asset_name', 'hook_uid'))
+
+    records = {}
+    for log in logs:
+        # if users don't exist in dict, add them
+        record = records.setdefault(log['owner_id'], {
+            'username': log['username'],
+            # language is not implemented yet.
+            # TODO add language to user table in registration process
+            'language': 'en',
+            'email': log['email'],
+            'assets': {}
+        })
+
+        # if asset doesn't exist in user's asset dict, add it
+        asset = record['assets'].setdefault(log['asset_uid'], {
+            'name': log['asset_name'],
+            'hook_uid': log['hook_uid'],
+            'max_length': 0,
+            'hidden_count': max(log['asset_logs_count'] - max_logs, 0),
+            'logs': []
+        })
+
+        # Add log to corresponding asset and user
+        asset['logs'].append({
+            'hook_name': log['hook_name'],
+            'uid': log['uid'],
+            'date_modified': log['date_modified'],
+            'status_code': log['status_code'],
+            'message': log['message_excerpt']
+        })
+
+        # Max Length is used for plain text template. To display fixed size columns.
+        asset['max_length'] = max(asset['max_length'], len(log['hook_name']))
+
+    return records
+
+
+def _send_failures_reports(records: list, from_email: str) -> bool:
+    """
+    Renders the reports of `records` (see `_get_failures_records()`) and sends
+    them through one connection. It runs in a worker thread: it must not
+    query the database.
+    """
+    # Get templates
+    plain_text_template = get_template('reports/failures_email_body.txt')
+    html_template = get_template('reports/failures_email_body.html')
+    email_messages = []
+
+    for record in records:
+        variables = {
+            'username': record.get('username'),
+            'assets': record.get('assets'),
+            'kpi_base_url': settings.KOBOFORM_URL
+        }
+        # Localize templates
+        translation.activate(record.get("language"))
+        text_content = plain_text_template.render(variables)
+        html_content = html_template.render(variables)
+
+        msg = EmailMultiAlternatives(translation.ugettext('REST Services Failure Report'), text_content,
+                                     from_email,
+                                     [record.get('email')])
+        msg.attach_alternative(html_content, 'text/html')
+        email_messages.append(msg)
+
+    # Send email messages
+    if len(email_messages) > 0:
+        try:
+            with get_connection() as email_connection:
+                email_connection.send_messages(email_messages)
+        except Exception as e:
+            logging.error('failures_reports - {}'.format(str(e)), exc_info=True)
+            return False
 
     return True
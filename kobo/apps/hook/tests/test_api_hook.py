@@ -1,15 +1,33 @@
 # coding: utf-8
 import json
+from datetime import timedelta
 
 import constance
 import responses
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
 from django.urls import reverse
+from django.utils import timezone
 from mock import patch
 from rest_framework import status
 
-from kobo.apps.hook.constants import SUBMISSION_PLACEHOLDER
+from kobo.apps.hook.constants import (
+    HOOK_LOG_FAILED,
+    HOOK_LOG_PENDING,
+    HOOK_LOG_SUCCESS,
+    SUBMISSION_PLACEHOLDER,
+)
+from kobo.apps.hook.delivery import HookDelivery
 from kobo.apps.hook.models.hook import Hook
+from kobo.apps.hook.models.hook_log import HookLog
+from kobo.apps.hook.models.hook_totals import HookTotals
+from kobo.apps.hook.tasks import (
+    deliver_pending_hook_logs,
+    reconcile_hook_totals,
+    retry_all_task,
+)
+from kobo.apps.hook.utils import HookUtils
 from kpi.constants import SUBMISSION_FORMAT_TYPE_JSON
 from kpi.constants import (
     PERM_VIEW_SUBMISSIONS,
@@ -86,6 +104,190 @@ class ApiHookTestCase(HookTestCase):
         response = self.client.post(hook_signal_url, data=data, format='json')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    @patch('ssrf_protect.ssrf_protect.SSRFProtect._get_ip_address',
+           new=MockSSRFProtect._get_ip_address)
+    @responses.activate
+    def test_deliver_pending_hook_logs(self):
+        hook = self._create_hook(name='dummy external service',
+                                 endpoint='http://dummy.service.local/',
+                                 settings={})
+        submissions = self.asset.deployment.get_submissions(self.asset.owner)
+        submission_id = submissions[0]['_id']
+
+        # First try fails
+        responses.add(responses.POST, hook.endpoint,
+                      status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                      body='<h1>Server Error</h1>')
+        responses.add(responses.POST, hook.endpoint,
+                      status=status.HTTP_200_OK,
+                      content_type='application/json')
+
+        # `deliver_pending_hook_logs` runs eagerly
+        self.assertTrue(HookUtils.call_services(self.asset, submission_id))
+        hook_log = hook.logs.get(submission_id=submission_id)
+        self.assertEqual(hook_log.tries, 1)
+        self.assertEqual(hook_log.status, HOOK_LOG_PENDING)
+        self.assertEqual(hook_log.status_code,
+                         status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertEqual(hook_log.message, 'Server Error')
+
+        # Not due before `HookLog.get_remaining_seconds(0)`
+        self.assertFalse(HookDelivery.get_due_hook_logs().exists())
+        HookLog.objects.filter(pk=hook_log.pk).update(
+            date_modified=hook_log.date_modified - timedelta(
+                seconds=HookLog.get_remaining_seconds(0)
+            )
+        )
+        self.assertTrue(HookDelivery.get_due_hook_logs().exists())
+
+        deliver_pending_hook_logs.delay()
+        hook_log.refresh_from_db()
+        self.assertEqual(hook_log.tries, 2)
+        self.assertEqual(hook_log.status, HOOK_LOG_SUCCESS)
+        self.assertEqual(hook_log.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(responses.calls), 2)
+        self.assertEqual(
+            json.loads(responses.calls[0].request.body)['_id'], submission_id
+        )
+
+        # Already sent
+        self.assertFalse(HookUtils.call_services(self.asset, submission_id))
+
+    def test_call_services_queries(self):
+        hook = Hook.objects.create(
+            asset=self.asset,
+            name='some external service',
+            endpoint='http://external.service.local/',
+        )
+        other_hook = Hook.objects.create(
+            asset=self.asset,
+            name='other external service',
+            endpoint='http://other.service.local/',
+        )
+        HookLog.objects.create(hook=hook, submission_id=1)
+        HookLog.objects.create(hook=other_hook, submission_id=1)
+        # Calculate the totals of both hooks
+        self.assertEqual(hook.pending_count, 1)
+        self.assertEqual(other_hook.pending_count, 1)
+
+        with patch.object(HookUtils, 'schedule_delivery') as schedule_delivery:
+            self.assertFalse(HookUtils.call_services(self.asset, 1))
+            # Active hooks and existing logs are looked up, new logs are
+            # created and the totals of the hooks are updated, with one query
+            # each
+            with self.assertNumQueries(4):
+                self.assertTrue(HookUtils.call_services(self.asset, 2))
+            self.assertEqual(schedule_delivery.call_count, 1)
+            self.assertEqual(
+                sorted(hook.logs.values_list('submission_id', flat=True)),
+                [1, 2],
+            )
+            for hook_ in (hook, other_hook):
+                self.assertEqual(
+                    Hook.objects.get(pk=hook_.pk).pending_count, 2
+                )
+
+    @override_settings(HOOK_ACTIVE_IDS_CACHE_TIMEOUT=60)
+    def test_active_hook_ids_cache(self):
+        hook = Hook.objects.create(
+            asset=self.asset,
+            name='some external service',
+            endpoint='http://external.service.local/',
+        )
+        self.assertEqual(HookUtils.get_active_hook_ids(self.asset.pk), [hook.pk])
+        with self.assertNumQueries(0):
+            HookUtils.get_active_hook_ids(self.asset.pk)
+
+        # Saving a hook drops the cached ids of the active hooks
+        hook.active = False
+        hook.save()
+        self.assertEqual(HookUtils.get_active_hook_ids(self.asset.pk), [])
+
+
+    def test_active_hook_ids_changed_by_another_process(self):
+        hook = Hook.objects.create(
+            asset=self.asset,
+            name='some external service',
+            endpoint='http://external.service.local/',
+        )
+        self.assertEqual(HookUtils.get_active_hook_ids(self.asset.pk), [hook.pk])
+
+        # Another process only drops the ids cached in its own cache
+        with patch.object(Hook, 'invalidate_active_ids'):
+            hook.active = False
+            hook.save()
+            self.assertEqual(HookUtils.get_active_hook_ids(self.asset.pk), [])
+
+            new_hook = Hook.objects.create(
+                asset=self.asset,
+                name='another external service',
+                endpoint='http://another.service.local/',
+            )
+            self.assertEqual(
+                HookUtils.get_active_hook_ids(self.asset.pk), [new_hook.pk]
+            )
+
+            # No logs are created for deleted hooks
+            new_hook.delete()
+            self.assertFalse(HookUtils.call_services(self.asset, 1))
+
+    def test_claim_hook_logs(self):
+        hook = Hook.objects.create(
+            asset=self.asset,
+            name='some external service',
+            endpoint='http://external.service.local/',
+        )
+        HookLog.objects.bulk_create(
+            [HookLog(hook=hook, submission_id=id_) for id_ in (1, 2, 3)]
+        )
+        due_hook_logs = HookDelivery.get_due_hook_logs()
+
+        def claim(limit):
+            return [
+                hook_log.submission_id
+                for hook_log in HookDelivery.claim(due_hook_logs, limit)
+            ]
+
+        self.assertEqual(claim(2), [1, 2])
+        # Other tasks skip claimed logs
+        self.assertEqual(claim(10), [3])
+        self.assertEqual(claim(10), [])
+        # Claims expire anyway
+        HookLog.objects.update(claimed_until=timezone.now())
+        self.assertEqual(claim(10), [1, 2, 3])
+
+    @patch('ssrf_protect.ssrf_protect.SSRFProtect._get_ip_address',
+           new=MockSSRFProtect._get_ip_address)
+    @responses.activate
+    def test_hook_totals(self):
+        def get_totals():
+            hook = Hook.objects.get(pk=self.hook.pk)
+            # Totals are read at once
+            with self.assertNumQueries(1):
+                return (
+                    hook.success_count,
+                    hook.failed_count,
+                    hook.pending_count,
+                )
+
+        first_log_response = self._send_and_fail()
+        self.assertEqual(get_totals(), (0, 1, 0))
+
+        # Totals follow status changes without counting logs again
+        hook_log = HookLog.objects.get(uid=first_log_response['uid'])
+        hook_log.change_status(HOOK_LOG_PENDING)
+        self.assertEqual(get_totals(), (0, 0, 1))
+
+        # Lost increments are fixed by the reconciliation
+        HookTotals.update(self.hook.pk, {HOOK_LOG_SUCCESS: 3})
+        self.assertEqual(get_totals(), (3, 0, 1))
+        reconcile_hook_totals.delay()
+        self.assertEqual(get_totals(), (0, 0, 1))
+
+        # Deleted logs are not counted anymore
+        hook_log.delete()
+        self.assertEqual(get_totals(), (0, 0, 0))
+
     def test_editor_access(self):
         hook = self._create_hook()
 
@@ -227,6 +429,95 @@ class ApiHookTestCase(HookTestCase):
         response = self.client.get(detail_url, format=SUBMISSION_FORMAT_TYPE_JSON)
         self.assertEqual(response.data.get("tries"), 2)
 
+    @patch('ssrf_protect.ssrf_protect.SSRFProtect._get_ip_address',
+           new=MockSSRFProtect._get_ip_address)
+    @responses.activate
+    def test_retry_all(self):
+        first_log_response = self._send_and_fail()
+
+        retry_url = reverse('hook-retry', kwargs={
+            'parent_lookup_asset': self.asset.uid,
+            'uid': self.hook.uid,
+        })
+        response = self.client.patch(retry_url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['pending_uids'],
+                         [first_log_response['uid']])
+        self.assertTrue(
+            response.data['task_id'].startswith(f'{self.hook.uid}-')
+        )
+
+        # `retry_all_task` runs eagerly
+        hook_log = HookLog.objects.get(uid=first_log_response['uid'])
+        self.assertEqual(hook_log.status, HOOK_LOG_SUCCESS)
+        self.assertEqual(hook_log.status_code, status.HTTP_200_OK)
+
+        # Nothing left to retry
+        response = self.client.patch(retry_url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Tasks of other hooks are not reported
+        status_url = reverse('hook-retry-status', kwargs={
+            'parent_lookup_asset': self.asset.uid,
+            'uid': self.hook.uid,
+            'task_id': 'hAnotherHookUid-1234',
+        })
+        response = self.client.get(status_url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @patch('ssrf_protect.ssrf_protect.SSRFProtect._get_ip_address',
+           new=MockSSRFProtect._get_ip_address)
+    @responses.activate
+    def test_cancel_retry_all(self):
+        first_log_response = self._send_and_fail()
+        hook_log = HookLog.objects.get(uid=first_log_response['uid'])
+
+        task_id = f'{self.hook.uid}-1234'
+        status_url = reverse('hook-retry-status', kwargs={
+            'parent_lookup_asset': self.asset.uid,
+            'uid': self.hook.uid,
+            'task_id': task_id,
+        })
+        response = self.client.delete(status_url)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        # The worker does not share the cache of the web process
+        cache.clear()
+        result = retry_all_task.apply(
+            args=(self.hook.pk, hook_log.pk), task_id=task_id
+        )
+        self.assertEqual(
+            result.result,
+            {'done': 0, 'success': 0, 'total': 1, 'cancelled': True},
+        )
+        hook_log.refresh_from_db()
+        self.assertEqual(hook_log.status, HOOK_LOG_FAILED)
+
+    @patch('ssrf_protect.ssrf_protect.SSRFProtect._get_ip_address',
+           new=MockSSRFProtect._get_ip_address)
+    @responses.activate
+    def test_retry_all_hands_off_before_time_limit(self):
+        first_log_response = self._send_and_fail()
+        hook_log = HookLog.objects.get(uid=first_log_response['uid'])
+
+        # Hand off after each chunk
+        task_id = f'{self.hook.uid}-1234'
+        with override_settings(CELERY_TASK_SOFT_TIME_LIMIT=0):
+            result = retry_all_task.apply(
+                args=(self.hook.pk, hook_log.pk), task_id=task_id
+            )
+        self.assertEqual(
+            result.result,
+            {
+                'done': 1,
+                'success': 1,
+                'total': 1,
+                'next_task_id': f'{task_id}-1',
+            },
+        )
+        hook_log.refresh_from_db()
+        self.assertEqual(hook_log.status, HOOK_LOG_SUCCESS)
+
     @patch('ssrf_protect.ssrf_protect.SSRFProtect._get_ip_address',
            new=MockSSRFProtect._get_ip_address)
     @responses.activate
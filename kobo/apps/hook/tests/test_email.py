@@ -2,12 +2,16 @@
 import responses
 from django.conf import settings
 from django.core import mail
+from django.test import override_settings
 from django.template.loader import get_template
 from django.utils import translation, dateparse
 from django_celery_beat.models import PeriodicTask
 from mock import patch
+from rest_framework import status
 
 from .hook_test_case import HookTestCase, MockSSRFProtect
+from ..constants import HOOK_LOG_FAILED
+from ..models.hook_log import HookLog
 from ..tasks import failures_reports
 
 
@@ -61,3 +65,23 @@ class EmailTestCase(HookTestCase):
         text_content = plain_text_template.render(variables)
 
         self.assertEqual(mail.outbox[0].body, text_content)
+
+    @override_settings(HOOK_FAILURES_REPORT_MAX_LOGS_PER_ASSET=1)
+    @patch('ssrf_protect.ssrf_protect.SSRFProtect._get_ip_address',
+           new=MockSSRFProtect._get_ip_address)
+    @responses.activate
+    def test_notifications_max_logs_per_asset(self):
+        self._create_periodic_task()
+        first_log_response = self._send_and_fail()
+        HookLog.objects.create(
+            hook=self.hook,
+            submission_id=first_log_response['submission_id'] + 1,
+            status=HOOK_LOG_FAILED,
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            message='Internal server error',
+        )
+        failures_reports.delay()
+        self.assertEqual(len(mail.outbox), 1)
+        body = mail.outbox[0].body
+        self.assertNotIn(first_log_response['uid'], body)
+        self.assertIn('... and 1 more failure', body)
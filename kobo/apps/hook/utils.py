@@ -1,6 +1,18 @@
 # coding: utf-8
+from typing import List
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .constants import (
+    HOOK_ACTIVE_IDS_CACHE_KEY,
+    HOOK_DELIVERY_SCHEDULED_CACHE_KEY,
+    HOOK_LOG_PENDING,
+)
+from .models.hook import Hook
 from .models.hook_log import HookLog
-from .tasks import service_definition_task
+from .models.hook_totals import HookTotals
+from .tasks import deliver_pending_hook_logs
 
 
 class HookUtils:
@@ -8,23 +20,75 @@ class HookUtils:
     @staticmethod
     def call_services(asset: 'kpi.models.asset.Asset', submission_id: int):
         """
-        Delegates to Celery data submission to remote servers
+        Creates a pending log per active hook of `asset` for `submission_id`
+        and delegates to Celery data submission to remote servers, by batches
+        (see `deliver_pending_hook_logs`)
+
+        Returns `False` if every active hook already has a log for
+        `submission_id`
         """
-        # Retrieve `Hook` ids, to send data to their respective endpoint.
-        hooks_ids = (
-            asset.hooks.filter(active=True)
-            .values_list('id', flat=True)
-            .distinct()
+        hook_ids = HookUtils.get_active_hook_ids(asset.pk)
+        if not hook_ids:
+            return False
+
+        # Hooks must not send the same submission twice
+        existing_hook_ids = set(
+            HookLog.objects.filter(
+                hook_id__in=hook_ids, submission_id=submission_id
+            ).values_list('hook_id', flat=True)
         )
-        # At least, one of the hooks must not have a log that corresponds to
-        # `submission_id`
-        # to make success equal True
-        success = False
-        for hook_id in hooks_ids:
-            if not HookLog.objects.filter(
-                submission_id=submission_id, hook_id=hook_id
-            ).exists():
-                success = True
-                service_definition_task.delay(hook_id, submission_id)
-
-        return success
+        hook_logs = [
+            HookLog(hook_id=hook_id, submission_id=submission_id)
+            for hook_id in hook_ids
+            if hook_id not in existing_hook_ids
+        ]
+        if not hook_logs:
+            return False
+
+        HookLog.objects.bulk_create(hook_logs)
+        # One log per hook
+        HookTotals.update_many(
+            [hook_log.hook_id for hook_log in hook_logs], {HOOK_LOG_PENDING: 1}
+        )
+        HookUtils.schedule_delivery()
+        return True
+
+    @staticmethod
+    def get_active_hook_ids(asset_id: int) -> List[int]:
+        """
+        Returns the ids of the active hooks of `asset_id`. The cache is
+        disabled unless `settings.HOOK_ACTIVE_IDS_CACHE_TIMEOUT` is set. Ids
+        are then cached until one of the hooks of the asset is saved or
+        deleted (see `Hook.invalidate_active_ids()`).
+        """
+        timeout = settings.HOOK_ACTIVE_IDS_CACHE_TIMEOUT
+        key = HOOK_ACTIVE_IDS_CACHE_KEY.format(asset_id=asset_id)
+        hook_ids = cache.get(key) if timeout else None
+        if hook_ids is None:
+            hook_ids = list(
+                Hook.objects.filter(asset_id=asset_id, active=True)
+                .order_by('pk')
+                .values_list('pk', flat=True)
+            )
+            if timeout:
+                cache.set(key, hook_ids, timeout)
+        return hook_ids
+
+    @staticmethod
+    def schedule_delivery():
+        """
+        Queues `deliver_pending_hook_logs` in
+        `settings.HOOK_DELIVERY_BATCH_DELAY` seconds to let pending logs pile
+        up in the meantime, unless it has already been queued within that
+        delay. Unless the cache is shared, this only holds per process:
+        extra tasks are harmless since logs are claimed in the database
+        before they are sent (see `HookDelivery.claim()`).
+        """
+        if cache.add(
+            HOOK_DELIVERY_SCHEDULED_CACHE_KEY,
+            True,
+            settings.HOOK_DELIVERY_BATCH_DELAY,
+        ):
+            deliver_pending_hook_logs.apply_async(
+                countdown=settings.HOOK_DELIVERY_BATCH_DELAY
+            )
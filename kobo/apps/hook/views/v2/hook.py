@@ -1,19 +1,20 @@
 # coding: utf-8
-from datetime import timedelta
+import uuid
 
-import constance
-from django.db.models import Q
-from django.utils import timezone
+from celery.result import AsyncResult
+from django.http import Http404
 from django.utils.translation import ugettext as _
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework_extensions.mixins import NestedViewSetMixin
 
-from kobo.apps.hook.constants import HOOK_LOG_FAILED, HOOK_LOG_PENDING
-from kobo.apps.hook.models import Hook, HookLog
+from kobo.apps.hook.constants import HOOK_RETRY_PROGRESS
+from kobo.apps.hook.delivery import HookDelivery
+from kobo.apps.hook.models import Hook
 from kobo.apps.hook.serializers.v2.hook import HookSerializer
-from kobo.apps.hook.tasks import retry_all_task
+from kobo.apps.hook.tasks import cancel_retry_all_task, retry_all_task
 from kpi.permissions import AssetEditorSubmissionViewerPermission
 from kpi.utils.viewset_mixins import AssetNestedObjectViewsetMixin
 
@@ -146,7 +147,32 @@ class HookViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
     >
     >       curl -X PATCH https://[kpi-url]/api/v2/assets/a9PkXcgVgaDXuwayVeAuY5/hooks/hfgha2nxBdoTVcwohdYNzb/retry/
 
-    It returns all logs `uid`s that are being retried.
+    It returns all logs `uid`s that are being retried, and the URL of the
+    status of the task:
+
+    <pre class="prettyprint">
+    <b>GET</b> /api/v2/assets/<code>{asset_uid}</code>/hooks/<code>{hook_uid}</code>/retry/<code>{task_id}</code>/
+    </pre>
+
+    > Response
+    >
+    >       HTTP 200 Ok
+    >        {
+    >           "status": "PROGRESS",
+    >           "progress": {
+    >               "done": 2000,
+    >               "success": 1950,
+    >               "total": 50000
+    >           }
+    >        }
+
+    `status` can be `PENDING`, `PROGRESS`, `SUCCESS` or `FAILURE`. Logs are
+    sent again by chunks, within the rate and concurrency limits of the
+    endpoint.
+
+    Long retries are carried on by new tasks, the status of the latest one
+    is reported. A `DELETE` request to the same URL cancels the retry before
+    its next chunk. Its final `progress` then contains `"cancelled": true`.
 
     ### CURRENT ENDPOINT
     """
@@ -174,13 +200,8 @@ class HookViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
         response = {"detail": _("Task successfully scheduled")}
         status_code = status.HTTP_200_OK
         if hook.active:
-            seconds = HookLog.get_elapsed_seconds(constance.config.HOOK_MAX_RETRIES)
-            threshold = timezone.now() - timedelta(seconds=seconds)
-
-            records = hook.logs.filter(Q(date_modified__lte=threshold,
-                                         status=HOOK_LOG_PENDING) |
-                                       Q(status=HOOK_LOG_FAILED)). \
-                values_list("id", "uid").distinct()
+            records = HookDelivery.get_retryable_hook_logs(hook.pk). \
+                values_list("id", "uid")
             # Prepare lists of ids
             hooklogs_ids = []
             hooklogs_uids = []
@@ -189,12 +210,24 @@ class HookViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
                 hooklogs_uids.append(record[1])
 
             if len(records) > 0:
-                # Mark all logs as PENDING
-                HookLog.objects.filter(id__in=hooklogs_ids).update(status=HOOK_LOG_PENDING)
-                # Delegate to Celery
-                retry_all_task.delay(hooklogs_ids)
+                # Delegate to Celery. Prefix the task id with the hook uid to
+                # make sure `retry_status()` only reports tasks of this hook
+                task_id = f'{hook.uid}-{uuid.uuid4()}'
+                retry_all_task.apply_async(
+                    args=(hook.pk, hooklogs_ids[-1]), task_id=task_id
+                )
                 response.update({
-                    "pending_uids": hooklogs_uids
+                    "pending_uids": hooklogs_uids,
+                    "task_id": task_id,
+                    "status_url": reverse(
+                        'hook-retry-status',
+                        kwargs={
+                            'parent_lookup_asset': self.asset.uid,
+                            'uid': hook.uid,
+                            'task_id': task_id,
+                        },
+                        request=request,
+                    ),
                 })
 
             else:
@@ -205,3 +238,33 @@ class HookViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
             status_code = status.HTTP_400_BAD_REQUEST
 
         return Response(response, status=status_code)
+
+    @action(detail=True, methods=['GET', 'DELETE'],
+            url_path=r'retry/(?P<task_id>[\w\-]+)')
+    def retry_status(self, request, task_id, uid=None, *args, **kwargs):
+        hook = self.get_object()
+        if not task_id.startswith(f'{hook.uid}-'):
+            raise Http404
+
+        if request.method == 'DELETE':
+            # The task stops before its next chunk of logs
+            cancel_retry_all_task(task_id)
+            return Response(
+                {'detail': _('Task is being cancelled')},
+                status=status.HTTP_202_ACCEPTED,
+            )
+
+        # Celery reports unknown tasks as pending
+        result = AsyncResult(task_id)
+        # Follow the tasks which carried on the retry (see `retry_all_task`)
+        while result.successful() and result.result.get('next_task_id'):
+            result = AsyncResult(result.result['next_task_id'])
+        response = {'status': result.state}
+        if result.state == HOOK_RETRY_PROGRESS:
+            response['progress'] = result.info
+        elif result.successful():
+            response['progress'] = result.result
+        elif result.failed():
+            response['detail'] = str(result.result)
+
+        return Response(response)
@@ -8,7 +8,9 @@ from rest_framework_extensions.mixins import NestedViewSetMixin
 
 
 from kobo.apps.hook.utils import HookUtils
+from kobo.apps.reports.report_store import ReportStore
 from kpi.models import Asset
+from kpi.utils.submission_count_cache import SubmissionCountCache
 from kpi.utils.viewset_mixins import AssetNestedObjectViewsetMixin
 
 
@@ -63,6 +65,10 @@ class HookSignalViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
         if not (submission and int(submission['_id']) == submission_id):
             raise Http404
 
+        # KoBoCAT notifies us of a new submission
+        SubmissionCountCache.invalidate(self.asset.deployment.mongo_userform_id)
+        ReportStore.schedule_refresh(self.asset)
+
         if HookUtils.call_services(self.asset, submission_id):
             # Follow Open Rosa responses by default
             response_status_code = status.HTTP_202_ACCEPTED
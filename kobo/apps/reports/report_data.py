@@ -1,13 +1,22 @@
 # coding: utf-8
-from collections import OrderedDict
+from collections import Counter, OrderedDict
 from copy import deepcopy
 
 from django.utils.translation import ugettext as _
+from pymongo.errors import OperationFailure
 from rest_framework import serializers
 
 from formpack import FormPack
+from kpi.utils.formpack_cache import FormPackCache
 from kpi.utils.log import logging
 
+# Types of questions whose values are counted by Mongo when possible (see
+# `data_by_identifiers()`)
+AGGREGATED_DATA_TYPES = ('select_one', 'select_multiple', 'integer', 'decimal')
+FUZZY_VERSION_ID_KEY = '_version_'
+INFERRED_VERSION_ID_KEY = '__inferred_version__'
+VERSION_ID_KEY = '__version__'
+
 
 def build_formpack(asset, submission_stream=None, use_all_form_versions=True):
     """
@@ -16,21 +25,101 @@ def build_formpack(asset, submission_stream=None, use_all_form_versions=True):
     then only the newest version of the form is considered, and all submissions
     are assumed to have been collected with that version of the form.
     """
-    FUZZY_VERSION_ID_KEY = '_version_'
-    INFERRED_VERSION_ID_KEY = '__inferred_version__'
+    pack, version_ids_newest_first, _reversion_ids, _ = _get_compiled_formpack(
+        asset, use_all_form_versions
+    )
 
-    if asset.has_deployment:
-        if use_all_form_versions:
-            _versions = asset.deployed_versions
+    _infer_version_id = get_version_id_inferrer(
+        version_ids_newest_first, _reversion_ids, use_all_form_versions
+    )
+
+    if submission_stream is None:
+        _userform_id = asset.deployment.mongo_userform_id
+        if not _userform_id.startswith(asset.owner.username):
+            raise Exception('asset has unexpected `mongo_userform_id`')
+
+        submission_stream = asset.deployment.get_submissions(user=asset.owner)
+
+    submission_stream = (
+        _infer_version_id(submission) for submission in submission_stream
+    )
+
+    return pack, submission_stream
+
+
+def get_version_id_inferrer(
+    version_ids_newest_first, reversion_ids, use_all_form_versions=True
+):
+    """
+    Return a function which sets `INFERRED_VERSION_ID_KEY` on a submission,
+    and returns it.
+
+    A submission often contains many version keys, e.g. `__version__`,
+    `_version_`, `_version__001`, `_version__002`, each with a different
+    version id (see https://github.com/kobotoolbox/kpi/issues/1465). To cope,
+    assume that the newest version whose id appears in the submission is the
+    proper one to use. Deprecated reversion IDs in `reversion_ids` stand for
+    the uids of their corresponding versions.
+    """
+    latest_version_id = version_ids_newest_first[0]
+
+    # Rank of each version id, 0 being the newest, to find the newest version
+    # of a submission without scanning `version_ids_newest_first`
+    version_ranks = {}
+    for rank, version_id in enumerate(version_ids_newest_first):
+        version_ranks.setdefault(version_id, rank)
+    for reversion_id, version_uid in reversion_ids.items():
+        if version_uid in version_ranks:
+            version_ranks[reversion_id] = version_ranks[version_uid]
         else:
-            _versions = [asset.deployed_versions.first()]
-    else:
-        # Use the newest version only if the asset was never deployed
-        _versions = [asset.asset_versions.first()]
+            version_ranks.pop(reversion_id, None)
 
+    def _infer_version_id(submission):
+        if not use_all_form_versions:
+            submission[INFERRED_VERSION_ID_KEY] = latest_version_id
+            return submission
+
+        # Fast path: nothing can be newer than the latest version
+        version_id = submission.get(VERSION_ID_KEY)
+        if (
+            isinstance(version_id, str)
+            and version_ranks.get(version_id) == 0
+        ):
+            submission[INFERRED_VERSION_ID_KEY] = latest_version_id
+            return submission
+
+        newest_rank = None
+        for key, value in submission.items():
+            if FUZZY_VERSION_ID_KEY not in key or not isinstance(value, str):
+                continue
+            rank = version_ranks.get(value)
+            if rank is not None and (newest_rank is None or rank < newest_rank):
+                newest_rank = rank
+                if rank == 0:
+                    break
+
+        # Fall back on the latest version
+        # TODO: log a warning?
+        submission[INFERRED_VERSION_ID_KEY] = version_ids_newest_first[
+            newest_rank or 0
+        ]
+        return submission
+
+    return _infer_version_id
+
+
+def _compile_formpack(asset, versions, version_id_key):
+    """
+    Return a tuple containing a `FormPack` instance built from `versions`
+    (newest first), the ids of these versions, newest first, including their
+    aliases, a dictionary of the deprecated reversion IDs to the uids of
+    their corresponding versions, and the names of the questions which
+    belong to a repeat group in any of these versions
+    """
     schemas = []
     version_ids_newest_first = []
-    for v in _versions:
+    repeated_field_names = set()
+    for v in versions:
         try:
             fp_schema = v.to_formpack_schema()
         # FIXME: should FormPack validation errors have their own
@@ -43,8 +132,11 @@ def build_formpack(asset, submission_stream=None, use_all_form_versions=True):
                  exc_info=True
             )
         else:
-            fp_schema['version_id_key'] = INFERRED_VERSION_ID_KEY
+            fp_schema['version_id_key'] = version_id_key
             schemas.append(fp_schema)
+            repeated_field_names.update(
+                _get_repeated_field_names(fp_schema['content'])
+            )
             version_ids_newest_first.append(v.uid)
             if v.uid_aliases:
                 version_ids_newest_first.extend(v.uid_aliases)
@@ -58,53 +150,100 @@ def build_formpack(asset, submission_stream=None, use_all_form_versions=True):
     # Find the AssetVersion UID for each deprecated reversion ID
     _reversion_ids = dict([
         (str(v._reversion_version_id), v.uid)
-            for v in _versions if v._reversion_version_id
+            for v in versions if v._reversion_version_id
     ])
 
-    # A submission often contains many version keys, e.g. `__version__`,
-    # `_version_`, `_version__001`, `_version__002`, each with a different
-    # version id (see https://github.com/kobotoolbox/kpi/issues/1465). To cope,
-    # assume that the newest version of this asset whose id appears in the
-    # submission is the proper one to use
-    def _infer_version_id(submission):
-        if not use_all_form_versions:
-            submission[INFERRED_VERSION_ID_KEY] = version_ids_newest_first[0]
-            return submission
+    return (
+        pack,
+        version_ids_newest_first,
+        _reversion_ids,
+        frozenset(repeated_field_names),
+    )
 
-        submission_version_ids = [
-            val for key, val in submission.items()
-                if FUZZY_VERSION_ID_KEY in key
-        ]
-        # Replace any deprecated reversion IDs with the UIDs of their
-        # corresponding AssetVersions
-        submission_version_ids = [
-            _reversion_ids[x] if x in _reversion_ids
-                else x for x in submission_version_ids
-        ]
-        inferred_version_id = None
-        for extant_version_id in version_ids_newest_first:
-            if extant_version_id in submission_version_ids:
-                inferred_version_id = extant_version_id
-                break
-        if not inferred_version_id:
-            # Fall back on the latest version
-            # TODO: log a warning?
-            inferred_version_id = version_ids_newest_first[0]
-        submission[INFERRED_VERSION_ID_KEY] = inferred_version_id
-        return submission
 
-    if submission_stream is None:
-        _userform_id = asset.deployment.mongo_userform_id
-        if not _userform_id.startswith(asset.owner.username):
-            raise Exception('asset has unexpected `mongo_userform_id`')
+def _get_aggregated_metrics(field, counts):
+    """
+    Return the metrics formpack's `AutoReport` collects for `field`, i.e. a
+    `Counter` of its parsed values plus the number of submissions which
+    provide it (`'__submissions__'`) or not (`None`), built from `counts`, a
+    list of `(value, count)` tuples as returned by
+    `MongoHelper.get_value_counts()`.
 
-        submission_stream = asset.deployment.get_submissions(user=asset.owner)
+    Each value is parsed once and weighted by its count, instead of once per
+    submission.
+    """
+    metrics = Counter()
+    for value, count in counts:
+        if value is None:
+            metrics[None] += count
+            continue
+        metrics['__submissions__'] += count
+        for parsed_value in field.parse_values(value):
+            metrics[parsed_value] += count
+    return metrics
 
-    submission_stream = (
-        _infer_version_id(submission) for submission in submission_stream
+
+def _get_streamed_metrics(fields, submissions):
+    """
+    Return the metrics of each of `fields` (see `_get_aggregated_metrics()`)
+    collected from `submissions` the way formpack's `AutoReport` does
+    """
+    metrics = {field.name: Counter() for field in fields}
+    for submission in submissions:
+        for field in fields:
+            counter = metrics[field.name]
+            raw_value = submission.get(field.path)
+            if raw_value is not None:
+                counter.update(field.parse_values(raw_value))
+                counter['__submissions__'] += 1
+            else:
+                counter[None] += 1
+    return metrics
+
+
+def _get_compiled_formpack(asset, use_all_form_versions=True):
+    """
+    Return the tuple returned by `_compile_formpack()` for the versions of
+    `asset`, reusing the one built from the same versions if any
+    """
+    if asset.has_deployment:
+        _versions = asset.deployed_versions
+        if not use_all_form_versions:
+            _versions = _versions[:1]
+    else:
+        # Use the newest version only if the asset was never deployed
+        _versions = asset.asset_versions.all()[:1]
+
+    # Compiling schemas is expensive
+    cache_key = FormPackCache.get_key(
+        asset.name,
+        _versions.values_list('uid', 'uid_aliases', '_reversion_version_id'),
     )
+    compiled = FormPackCache.get(cache_key)
+    if not compiled:
+        compiled = _compile_formpack(asset, _versions, INFERRED_VERSION_ID_KEY)
+        FormPackCache.set(cache_key, compiled)
+    return compiled
 
-    return pack, submission_stream
+
+def _get_repeated_field_names(content):
+    """
+    Return the names of the questions of `content` which belong to a repeat
+    group. Their values are nested in the submissions.
+    """
+    names = set()
+    repeat_depth = 0
+    for row in content.get('survey', []):
+        row_type = str(row.get('type', '')).replace(' ', '_')
+        if row_type == 'begin_repeat':
+            repeat_depth += 1
+        elif row_type == 'end_repeat':
+            repeat_depth -= 1
+        elif repeat_depth > 0:
+            name = row.get('name') or row.get('$autoname')
+            if name:
+                names.add(name)
+    return names
 
 
 def _vnames(asset, cache=False):
@@ -119,10 +258,24 @@ def _vnames(asset, cache=False):
 
 def data_by_identifiers(asset, field_names=None, submission_stream=None,
                         report_styles=None, lang=None, fields=None,
-                        split_by=None):
-    pack, submission_stream = build_formpack(asset, submission_stream)
+                        split_by=None, user=None, metrics=None):
+    """
+    Return the statistics of the questions `field_names` (all questions by
+    default) of `asset`, computed from `submission_stream`.
+
+    If `submission_stream` is not provided, the statistics are computed from
+    `metrics` (see `get_report_metrics()`), or from the metrics of the
+    submissions `user` (the owner of `asset` by default) is allowed to
+    access. Reports split by a question are always computed from the
+    submissions.
+    """
+    if submission_stream is None:
+        pack, _version_ids, _reversion_ids, _repeated_field_names = (
+            _get_compiled_formpack(asset)
+        )
+    else:
+        pack, submission_stream = build_formpack(asset, submission_stream)
     _all_versions = pack.versions.keys()
-    report = pack.autoreport(versions=_all_versions)
     fields_by_name = OrderedDict([
             (field.name, field) for field in
                 pack.get_fields_for_versions(versions=_all_versions)
@@ -172,10 +325,125 @@ def data_by_identifiers(asset, field_names=None, submission_stream=None,
             'style': specified_styles.get(identifier, {}),
         }
 
-    return [
-        _package_stat(*stat_tup, split_by=split_by) for
-        stat_tup in report.get_stats(submission_stream,
-                                     fields=field_names,
-                                     lang=lang,
-                                     split_by=split_by)
+    def _get_stats(stream, names):
+        report = pack.autoreport(versions=_all_versions)
+        return [
+            _package_stat(*stat_tup, split_by=split_by) for
+            stat_tup in report.get_stats(stream,
+                                         fields=names,
+                                         lang=lang,
+                                         split_by=split_by)
+        ]
+
+    if submission_stream is not None:
+        return _get_stats(submission_stream, field_names)
+
+    if split_by:
+        _pack, submission_stream = build_formpack(
+            asset, asset.deployment.get_submissions(user or asset.owner)
+        )
+        return _get_stats(submission_stream, field_names)
+
+    if metrics is None:
+        metrics = get_report_metrics(asset, field_names, user=user)
+    stats = [
+        _package_stat(
+            fields_by_name[name],
+            fields_by_name[name].get_labels(lang)[0],
+            fields_by_name[name].get_stats(field_metrics, lang=lang),
+            split_by=None,
+        )
+        for name, field_metrics in metrics.items()
+    ]
+    field_positions = {name: index for index, name in enumerate(fields_by_name)}
+    stats.sort(key=lambda stat: field_positions[stat['name']])
+    return stats
+
+
+def get_report_metrics(asset, field_names=None, user=None, query=None):
+    """
+    Return the metrics formpack's `AutoReport` collects for the questions
+    `field_names` (all questions by default) of `asset`, i.e. a `Counter`
+    per question name (see `_get_aggregated_metrics()`), from the
+    submissions `user` (the owner of `asset` by default) is allowed to access
+    which match `query`.
+
+    Values of the questions of `AGGREGATED_DATA_TYPES` are counted by Mongo
+    instead of being sent back to be counted here. Metrics of distinct sets
+    of submissions add up, e.g. to update a report with new submissions only
+    (see `ReportStore`).
+    """
+    pack, _version_ids, _reversion_ids, repeated_field_names = (
+        _get_compiled_formpack(asset)
+    )
+    # Same questions as `data_by_identifiers()`, i.e. one per name
+    fields_by_name = OrderedDict([
+        (field.name, field) for field in
+        pack.get_fields_for_versions(versions=pack.versions.keys())
+    ])
+    fields = [
+        field for name, field in fields_by_name.items()
+        if field.has_stats and (field_names is None or name in field_names)
+    ]
+    if user is None:
+        user = asset.owner
+    if query is None:
+        query = {}
+
+    # Values of questions in repeat groups are nested in submissions; leave
+    # them to be counted here
+    aggregated_fields = [
+        field for field in fields
+        if field.name not in repeated_field_names
+        and field.data_type in AGGREGATED_DATA_TYPES
     ]
+
+    metrics = {}
+    if aggregated_fields:
+        try:
+            value_counts = asset.deployment.get_submission_value_counts(
+                user, [field.path for field in aggregated_fields], query=query
+            )
+        except (NotImplementedError, OperationFailure) as e:
+            # e.g. results exceed the maximum size of a Mongo document
+            logging.warning(
+                f'Cannot aggregate submissions of {asset.uid}: {repr(e)}'
+            )
+        else:
+            for field in aggregated_fields:
+                metrics[field.name] = _get_aggregated_metrics(
+                    field, value_counts[field.path]
+                )
+
+    # Do not fetch submissions if every question has been aggregated
+    streamed_fields = [
+        field for field in fields if field.name not in metrics
+    ]
+    if streamed_fields:
+        metrics.update(
+            _get_streamed_metrics(
+                streamed_fields,
+                asset.deployment.get_submissions(user, query=query),
+            )
+        )
+
+    return {field.name: metrics[field.name] for field in fields}
+
+
+def apply_report_styles(asset, stats, report_styles=None):
+    """
+    Return a copy of `stats`, as returned by `data_by_identifiers()`, whose
+    items have the `kuid` and `style` of the current report styles of
+    `asset`. `stats` itself is left untouched, since it may be shared (e.g.
+    stored by `ReportStore`)
+    """
+    if report_styles is None:
+        report_styles = asset.report_styles
+    specified_styles = report_styles.get('specified', {})
+    kuids = report_styles.get('kuid_names', {})
+    styled_stats = deepcopy(stats)
+    for stat in styled_stats:
+        identifier = kuids.get(stat['name'])
+        stat['kuid'] = identifier
+        stat['style'] = deepcopy(specified_styles.get(identifier, {}))
+    return styled_stats
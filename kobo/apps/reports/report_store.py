@@ -0,0 +1,248 @@
+# coding: utf-8
+import json
+from collections import Counter
+from datetime import timedelta
+from hashlib import md5
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from kpi.models.asset_report import AssetReport
+from . import report_data
+
+
+class ReportStore:
+    """
+    Store of precomputed reports (see `report_data.data_by_identifiers()`),
+    shared by every process through the `AssetReport` model.
+
+    Reports are keyed by asset, deployed versions, partial permission filters
+    of the requesting user and report parameters: deploying a new version
+    starts a new report. Each report is stored along with a watermark of the
+    submissions it was computed from, i.e. their count, the greatest
+    submission id and the last time KoBoCAT saved one of them, which changes
+    whenever submissions are edited, through KPI or not (e.g. through
+    Enketo). A stored report is served as long as its watermark matches the
+    current one.
+
+    Otherwise, if the submissions the report was computed from are unchanged
+    (i.e. their watermark still matches), only the new submissions are
+    counted and added to the stored metrics of the report (see
+    `report_data.get_report_metrics()`). Reports are computed again from all
+    submissions when some of them have been edited or deleted, and when
+    they are split by a question, whose statistics cannot be added up.
+
+    When KoBoCAT notifies KPI of new submissions, the default report of the
+    asset is refreshed in the background (see `schedule_refresh()`), so that
+    it is ready when someone opens it.
+
+    Report styles are not part of the stored reports; they are applied when
+    reports are read.
+    """
+
+    KEY_PREFIX = 'report'
+
+    @classmethod
+    def get_report(
+        cls,
+        asset: 'kpi.Asset',
+        user: 'auth.User',
+        field_names: Optional[list] = None,
+        split_by: Optional[str] = None,
+        lang: Optional[str] = None,
+    ) -> list:
+        if field_names is not None:
+            field_names = list(field_names)
+
+        params_hash = cls._get_params_hash(
+            asset, user, field_names, split_by, lang
+        )
+        watermark = cls._get_watermark(asset, user)
+        expiry_date = timezone.now() - timedelta(
+            seconds=settings.REPORT_STORE_TIMEOUT
+        )
+        stored_report = AssetReport.objects.filter(
+            asset=asset,
+            params_hash=params_hash,
+            date_modified__gte=expiry_date,
+        ).first()
+        if stored_report and stored_report.watermark == watermark:
+            stats = stored_report.stats
+        else:
+            metrics = None
+            if not split_by:
+                metrics = cls._get_metrics(
+                    asset, user, field_names, watermark, stored_report
+                )
+            stats = report_data.data_by_identifiers(
+                asset,
+                field_names,
+                split_by=split_by,
+                lang=lang,
+                user=user,
+                metrics=metrics,
+            )
+            # Return the same values whether the report is stored or not
+            stats = json.loads(json.dumps(stats, cls=DjangoJSONEncoder))
+            AssetReport.objects.update_or_create(
+                asset=asset,
+                params_hash=params_hash,
+                defaults={
+                    'watermark': watermark,
+                    'stats': stats,
+                    'metrics': (
+                        None if metrics is None else cls._dump_metrics(metrics)
+                    ),
+                    'date_modified': timezone.now(),
+                },
+            )
+            # Drop reports nobody asked for lately, e.g. the ones of previous
+            # deployed versions
+            AssetReport.objects.filter(
+                asset=asset, date_modified__lt=expiry_date
+            ).delete()
+
+        return report_data.apply_report_styles(asset, stats)
+
+    @classmethod
+    def refresh(cls, asset: 'kpi.Asset'):
+        """
+        Compute the default report of `asset`, as seen by its owner, if it is
+        not up to date
+        """
+        cls.get_report(asset, asset.owner)
+
+    @classmethod
+    def schedule_refresh(cls, asset: 'kpi.Asset'):
+        """
+        Refresh the default report of `asset` in the background. Refreshes are
+        delayed by `settings.REPORT_STORE_REFRESH_DELAY` seconds to process
+        bursts of submissions at once.
+        """
+        from kpi.tasks import refresh_report  # avoid circular imports
+
+        delay = settings.REPORT_STORE_REFRESH_DELAY
+        if cache.add(f'{cls.KEY_PREFIX}:refresh:{asset.uid}', True, delay):
+            refresh_report.apply_async(args=(asset.uid,), countdown=delay)
+
+    @classmethod
+    def _get_metrics(
+        cls, asset, user, field_names, watermark, stored_report
+    ) -> dict:
+        """
+        Return the metrics of the submissions of `watermark`, adding the new
+        ones to the metrics of `stored_report` if the submissions it was
+        computed from are unchanged. Metrics go through JSON, so that they
+        are the same whether they are stored or not.
+        """
+        _count, max_submission_id, _last_edit_time = watermark
+        if max_submission_id is None:
+            # No submissions
+            return cls._load_metrics(
+                cls._dump_metrics(
+                    report_data.get_report_metrics(asset, field_names, user)
+                )
+            )
+
+        query = {'_id': {'$lte': max_submission_id}}
+        metrics = {}
+        if stored_report and stored_report.metrics is not None:
+            stored_max_submission_id = stored_report.watermark[1]
+            if (
+                stored_max_submission_id is not None
+                and stored_max_submission_id < max_submission_id
+                and cls._get_watermark(asset, user, stored_max_submission_id)
+                == stored_report.watermark
+            ):
+                metrics = cls._load_metrics(stored_report.metrics)
+                query['_id']['$gt'] = stored_max_submission_id
+
+        new_metrics = cls._load_metrics(
+            cls._dump_metrics(
+                report_data.get_report_metrics(
+                    asset, field_names, user, query=query
+                )
+            )
+        )
+        for name, field_metrics in new_metrics.items():
+            metrics.setdefault(name, Counter()).update(field_metrics)
+        return metrics
+
+    @staticmethod
+    def _dump_metrics(metrics: dict) -> dict:
+        # Values are not always strings, keep them as they are
+        return {
+            name: list(field_metrics.items())
+            for name, field_metrics in metrics.items()
+        }
+
+    @staticmethod
+    def _load_metrics(metrics: dict) -> dict:
+        return {
+            name: Counter({
+                # JSON turns tuples into lists, which cannot be keys
+                tuple(value) if isinstance(value, list) else value: count
+                for value, count in field_metrics
+            })
+            for name, field_metrics in json.loads(
+                json.dumps(metrics, cls=DjangoJSONEncoder)
+            ).items()
+        }
+
+    @staticmethod
+    def _get_params_hash(asset, user, field_names, split_by, lang) -> str:
+        deployed_version_uids = list(
+            asset.deployed_versions.values_list('uid', flat=True)
+        )
+        permission_filters = asset.get_filters_for_partial_perm(user.pk)
+        return md5(
+            json.dumps(
+                [
+                    deployed_version_uids,
+                    permission_filters,
+                    field_names,
+                    split_by,
+                    lang,
+                ],
+                sort_keys=True,
+                default=str,
+            ).encode()
+        ).hexdigest()
+
+    @staticmethod
+    def _get_watermark(asset, user, max_submission_id=None) -> list:
+        """
+        Return the watermark of the submissions `user` is allowed to access
+        whose id is at most `max_submission_id` (the greatest one by
+        default)
+        """
+        deployment = asset.deployment
+        if max_submission_id is None:
+            last_submissions = list(
+                deployment.get_submissions(
+                    user,
+                    fields=['_id'],
+                    sort={'_id': -1},
+                    limit=1,
+                    skip_count=True,
+                )
+            )
+            if last_submissions:
+                max_submission_id = last_submissions[0]['_id']
+
+        # Ignore submissions added in the meantime
+        query = {}
+        if max_submission_id is not None:
+            query = {'_id': {'$lte': max_submission_id}}
+        last_edit_time = deployment.get_last_submission_edit_time(
+            max_submission_id
+        )
+        # Same JSON representation as `AssetReport.watermark`
+        return [
+            deployment.calculated_submission_count(user, query=query),
+            max_submission_id,
+            last_edit_time.isoformat() if last_edit_time else None,
+        ]
@@ -273,9 +273,115 @@ CAN_LOGIN_AS = lambda request, target_user: request.user.is_superuser
 # endpoint. This overrides any `?limit=` query parameter sent by a client
 SUBMISSION_LIST_LIMIT = 30000
 
+# Number of seconds the counts of submissions matching a query are cached.
+# Counts are invalidated when submissions are altered through KPI, so this
+# requires a cache back end shared by every process (e.g. Redis or
+# memcached). KoBoCAT does not notify KPI of every new submission anyway.
+# `0` disables the cache
+SUBMISSION_COUNT_CACHE_TIMEOUT = int(
+    os.environ.get('SUBMISSION_COUNT_CACHE_TIMEOUT', 0)
+)
+
+# Number of seconds object-level and partial permissions are shared between
+# requests. Entries are invalidated whenever permissions change, so this
+# requires a cache back end shared by every process (e.g. Redis or memcached).
+# `0` disables the cache
+PERMISSION_CACHE_TIMEOUT = int(os.environ.get('PERMISSION_CACHE_TIMEOUT', 0))
+
+# Number of seconds the metadata of asset lists (`?metadata=on`) are cached
+# per user and filters. Entries are invalidated whenever assets or
+# permissions change, so this requires a cache back end shared by every
+# process (e.g. Redis or memcached). `0` disables the cache
+ASSET_LIST_METADATA_CACHE_TIMEOUT = int(
+    os.environ.get('ASSET_LIST_METADATA_CACHE_TIMEOUT', 0)
+)
+
 # REMOVE the oldest if a user exceeds this many exports for a particular form
 MAXIMUM_EXPORTS_PER_USER_PER_FORM = 10
 
+# Maximum size, in bytes, of the compiled `FormPack` objects kept in memory by
+# each process to speed up reports and exports. `0` disables the cache
+FORMPACK_CACHE_MAX_SIZE = int(
+    os.environ.get('FORMPACK_CACHE_MAX_SIZE', 64 * 1024 * 1024)
+)
+# Share compiled `FormPack` objects between processes through the default
+# Django cache
+FORMPACK_CACHE_USE_SHARED_CACHE = (
+    os.environ.get('FORMPACK_CACHE_USE_SHARED_CACHE', 'False') == 'True'
+)
+FORMPACK_CACHE_TIMEOUT = int(
+    os.environ.get('FORMPACK_CACHE_TIMEOUT', 24 * 60 * 60)
+)
+
+# Number of seconds precomputed reports are kept. They are computed again
+# sooner if submissions are added, edited or deleted
+REPORT_STORE_TIMEOUT = int(os.environ.get('REPORT_STORE_TIMEOUT', 60 * 60))
+# Delay, in seconds, before refreshing the report of an asset in the
+# background once KoBoCAT notifies KPI of a new submission
+REPORT_STORE_REFRESH_DELAY = int(
+    os.environ.get('REPORT_STORE_REFRESH_DELAY', 60)
+)
+
+# Split CSV and GeoJSON exports of at least `EXPORT_SHARDING_THRESHOLD`
+# submissions into `EXPORT_SHARDS` ranges rendered in parallel by Celery
+# workers. `1` disables sharding
+EXPORT_SHARDS = int(os.environ.get('EXPORT_SHARDS', 1))
+EXPORT_SHARDING_THRESHOLD = int(
+    os.environ.get('EXPORT_SHARDING_THRESHOLD', 100000)
+)
+
+# Number of edited submissions sent concurrently to KoBoCAT by bulk updates
+BULK_UPDATE_SUBMISSIONS_MAX_WORKERS = int(
+    os.environ.get('BULK_UPDATE_SUBMISSIONS_MAX_WORKERS', 5)
+)
+
+# REST Services: pending deliveries (pairs of hook and submission) are sent by
+# batches of `HOOK_DELIVERY_BATCH_SIZE`, gathered for up to
+# `HOOK_DELIVERY_BATCH_DELAY` seconds, by `HOOK_DELIVERY_MAX_WORKERS` threads.
+# Each endpoint receives at most `HOOK_DELIVERY_ENDPOINT_MAX_CONCURRENCY`
+# requests at a time, and `HOOK_DELIVERY_ENDPOINT_RATE_LIMIT` requests per
+# second (0 means no limit) after bursts of `HOOK_DELIVERY_ENDPOINT_BURST`
+# requests. Bulk retries (`retry_all_task`) go through the same limits
+HOOK_DELIVERY_BATCH_SIZE = int(os.environ.get('HOOK_DELIVERY_BATCH_SIZE', 1000))
+HOOK_DELIVERY_BATCH_DELAY = float(
+    os.environ.get('HOOK_DELIVERY_BATCH_DELAY', 1)
+)
+HOOK_DELIVERY_MAX_WORKERS = int(
+    os.environ.get('HOOK_DELIVERY_MAX_WORKERS', 50)
+)
+HOOK_DELIVERY_ENDPOINT_RATE_LIMIT = float(
+    os.environ.get('HOOK_DELIVERY_ENDPOINT_RATE_LIMIT', 100)
+)
+HOOK_DELIVERY_ENDPOINT_BURST = float(
+    os.environ.get('HOOK_DELIVERY_ENDPOINT_BURST', 10)
+)
+HOOK_DELIVERY_ENDPOINT_MAX_CONCURRENCY = int(
+    os.environ.get('HOOK_DELIVERY_ENDPOINT_MAX_CONCURRENCY', 10)
+)
+
+# REST Services failures reports (`failures_reports`) list the latest
+# `HOOK_FAILURES_REPORT_MAX_LOGS_PER_ASSET` failures of each asset. They are
+# rendered and sent by batches of `HOOK_FAILURES_REPORT_BATCH_SIZE` emails,
+# `HOOK_FAILURES_REPORT_MAX_WORKERS` batches at a time
+HOOK_FAILURES_REPORT_MAX_LOGS_PER_ASSET = int(
+    os.environ.get('HOOK_FAILURES_REPORT_MAX_LOGS_PER_ASSET', 100)
+)
+HOOK_FAILURES_REPORT_BATCH_SIZE = int(
+    os.environ.get('HOOK_FAILURES_REPORT_BATCH_SIZE', 50)
+)
+HOOK_FAILURES_REPORT_MAX_WORKERS = int(
+    os.environ.get('HOOK_FAILURES_REPORT_MAX_WORKERS', 5)
+)
+
+# Number of seconds the ids of the active hooks of each asset are cached.
+# Entries are invalidated whenever one of its hooks is saved or deleted, so
+# this requires a cache back end shared by every process (e.g. Redis or
+# memcached), and hooks must not be changed with `QuerySet.update()` or
+# `QuerySet.delete()`. `0` disables the cache
+HOOK_ACTIVE_IDS_CACHE_TIMEOUT = int(
+    os.environ.get('HOOK_ACTIVE_IDS_CACHE_TIMEOUT', 0)
+)
+
 # Private media file configuration
 PRIVATE_STORAGE_ROOT = os.path.join(BASE_DIR, 'media')
 PRIVATE_STORAGE_AUTH_FUNCTION = \
@@ -443,6 +549,18 @@ CELERY_BEAT_SCHEDULE = {
         "schedule": crontab(hour=0, minute=0),
         'options': {'queue': 'kpi_queue'}
     },
+    # Recalculate the totals of REST Services logs (see `HookTotals`)
+    'reconcile-hook-totals': {
+        'task': 'kobo.apps.hook.tasks.reconcile_hook_totals',
+        'schedule': timedelta(hours=1),
+        'options': {'queue': 'kpi_queue'},
+    },
+    # Send again REST Services data whose previous try failed
+    'deliver-pending-hook-logs': {
+        'task': 'kobo.apps.hook.tasks.deliver_pending_hook_logs',
+        'schedule': timedelta(minutes=1),
+        'options': {'queue': 'kpi_queue', 'expires': 60},
+    },
 }
 
 CELERY_BROKER_TRANSPORT_OPTIONS = {
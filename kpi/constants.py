@@ -99,11 +99,14 @@ ASSET_STATUS_SHARED = 'shared'
 
 # Terms that can be used to search and filter return values
 # from a query `q`
+# `Asset.search_text` gathers name, uid, owner's username, description,
+# summary and tags of assets in one (indexed) column
 ASSET_SEARCH_DEFAULT_FIELD_LOOKUPS = [
-    'name__icontains',
-    'owner__username__icontains',
-    'settings__description__icontains',
-    'summary__icontains',
-    'tags__name__icontains',
-    'uid__icontains',
+    'search_text__icontains',
 ]
+
+# Export setting not handled by formpack. See `ExportTask`
+EXPORT_SETTING_INCREMENTAL = 'incremental'
+
+# Custom Celery state of bulk updates of submissions running in the background
+BULK_UPDATE_SUBMISSIONS_PROGRESS = 'PROGRESS'
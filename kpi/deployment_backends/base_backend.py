@@ -2,7 +2,7 @@
 import abc
 import copy
 import json
-from typing import Union, Iterator
+from typing import Callable, Iterator, Optional, Union
 
 from bson import json_util
 from django.db.models.query import QuerySet
@@ -53,7 +53,10 @@ class BaseDeploymentBackend(abc.ABC):
 
     @abc.abstractmethod
     def bulk_update_submissions(
-        self, data: dict, user: 'auth.User'
+        self,
+        data: dict,
+        user: 'auth.User',
+        progress_callback: Optional[Callable[[int, int], None]] = None,
     ) -> dict:
         pass
 
@@ -198,6 +201,19 @@ class BaseDeploymentBackend(abc.ABC):
         """
         pass
 
+    @abc.abstractmethod
+    def get_submission_value_counts(
+        self,
+        user: 'auth.User',
+        fields: list,
+        **kwargs
+    ) -> dict:
+        """
+        Count the submissions `user` is allowed to access for each value of
+        each of `fields` (see `MongoHelper.get_value_counts()`)
+        """
+        pass
+
     @abc.abstractmethod
     def get_validation_status(self, submission_id: int, user: 'auth.User') -> dict:
         """
@@ -205,10 +221,35 @@ class BaseDeploymentBackend(abc.ABC):
         """
         pass
 
+    @abc.abstractmethod
+    def get_xml_submissions_with_ids(
+        self,
+        user: 'auth.User',
+        submission_ids: list = [],
+        **mongo_query_params
+    ) -> Iterator[tuple]:
+        """
+        Work like `get_submissions()` with the XML format, but return
+        `(submission id, XML)` tuples, since the XML of a submission does not
+        contain its id
+        """
+        pass
+
     @property
     def identifier(self):
         return self.get_data('identifier')
 
+    def get_last_submission_edit_time(
+        self, max_submission_id: Optional[int] = None
+    ):
+        """
+        Return when a submission was last added or edited, even without
+        going through KPI (e.g. through Enketo). Only submissions whose id is
+        at most `max_submission_id` are considered, if provided. `None` if
+        unknown
+        """
+        return self._last_submission_edit_time(max_submission_id)
+
     @property
     def last_submission_time(self):
         return self._last_submission_time()
@@ -319,8 +360,9 @@ class BaseDeploymentBackend(abc.ABC):
             - fields
             - query
             - submission_ids
-        If `validate_count` is True,`start`, `limit`, `fields` and `sort` are
-        ignored.
+            - skip_count
+        If `validate_count` is True,`start`, `limit`, `fields`, `sort` and
+        `skip_count` are ignored.
         If `user` has partial permissions, conditions are
         applied to the query to narrow down results to what they are allowed
         to see. Partial permissions are validated with 'view_submissions' by
@@ -433,6 +475,11 @@ class BaseDeploymentBackend(abc.ABC):
         if limit:
             params['limit'] = limit
 
+        # Skip the (costly) count of matching submissions when it is not used.
+        # `current_submissions_count` is then `None`.
+        if mongo_query_params.get('skip_count'):
+            params['skip_count'] = True
+
         return params
 
     def validate_write_access_with_partial_perms(
@@ -7,6 +7,7 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ImproperlyConfigured
 from django.db import IntegrityError, ProgrammingError, transaction
+from django.db.models import Max
 from rest_framework.authtoken.models import Token
 
 from kpi.exceptions import KobocatProfileException
@@ -23,6 +24,7 @@ from .shadow_models import (
     KobocatUserPermission,
     KobocatUserProfile,
     KobocatXForm,
+    ReadOnlyKobocatInstance,
 )
 
 
@@ -53,6 +55,19 @@ def instance_count(xform_id_string, user_id):
         return 0
 
 
+@safe_kc_read
+def last_submission_edit_time(xform_id, max_submission_id=None):
+    """
+    Return when a submission of `xform_id` was last saved by KoBoCAT, i.e.
+    added or edited (e.g. through Enketo). Only submissions whose id is at
+    most `max_submission_id` are considered, if provided
+    """
+    queryset = ReadOnlyKobocatInstance.objects.filter(xform_id=xform_id)
+    if max_submission_id is not None:
+        queryset = queryset.filter(pk__lte=max_submission_id)
+    return queryset.aggregate(Max('date_modified'))['date_modified__max']
+
+
 @safe_kc_read
 def last_submission_time(xform_id_string, user_id):
     return KobocatXForm.objects.get(
@@ -6,8 +6,9 @@ import posixpath
 import re
 import uuid
 from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
-from typing import Generator, Optional, Union
+from typing import Callable, Generator, Optional, Union
 from urllib.parse import urlparse
 from xml.etree import ElementTree as ET
 
@@ -35,6 +36,7 @@ from kpi.models.paired_data import PairedData
 from kpi.utils.log import logging
 from kpi.utils.mongo_helper import MongoHelper
 from kpi.utils.permissions import is_user_anonymous
+from kpi.utils.submission_count_cache import SubmissionCountCache
 from kpi.utils.datetime import several_minutes_from_now
 from .base_backend import BaseDeploymentBackend
 from .kc_access.shadow_models import (
@@ -45,7 +47,8 @@ from .kc_access.shadow_models import (
 from .kc_access.utils import (
     assign_applicable_kc_permissions,
     instance_count,
-    last_submission_time
+    last_submission_edit_time,
+    last_submission_time,
 )
 from ..exceptions import (
     BadFormatException,
@@ -91,7 +94,10 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
             assign_applicable_kc_permissions(self.asset, user, perms)
 
     def bulk_update_submissions(
-        self, data: dict, user: 'auth.User'
+        self,
+        data: dict,
+        user: 'auth.User',
+        progress_callback: Optional[Callable[[int, int], None]] = None,
     ) -> dict:
         """
         Allows for bulk updating of submissions proxied through KoBoCAT. A
@@ -101,10 +107,17 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
         submission's XML tree, or the existing value is replaced by the updated
         value.
 
+        Submissions are rewritten one at a time, as they are sent to
+        KoBoCAT, and up to `settings.BULK_UPDATE_SUBMISSIONS_MAX_WORKERS` of
+        them are sent concurrently through a pooled HTTP session.
+
         Args:
             data (dict): must contain a list of `submission_ids` and at
                 least one other key:value field for updating the submissions
             user (User)
+            progress_callback (callable): called with the number of
+                submissions sent so far and the total number of submissions
+                each time KoBoCAT responds
 
         Returns:
             dict: formatted dict to be passed to a Response object
@@ -139,89 +152,72 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
                 detail=_('No submissions match the given `submission_ids`')
             )
 
+        total = self.current_submissions_count
         update_data = self.__prepare_bulk_update_data(data['data'])
-        kc_responses = []
-        for submission in submissions:
-            xml_parsed = ET.fromstring(submission)
-
-            _uuid, uuid_formatted = self.generate_new_instance_id()
-
-            # Updating xml fields for submission. In order to update an existing
-            # submission, the current `instanceID` must be moved to the value
-            # for `deprecatedID`.
-            instance_id = xml_parsed.find('meta/instanceID')
-            # If the submission has been edited before, it will already contain
-            # a deprecatedID element - otherwise create a new element
-            deprecated_id = xml_parsed.find('meta/deprecatedID')
-            deprecated_id_or_new = (
-                deprecated_id
-                if deprecated_id is not None
-                else ET.SubElement(xml_parsed.find('meta'), 'deprecatedID')
-            )
-            deprecated_id_or_new.text = instance_id.text
-            instance_id.text = uuid_formatted
-
-            # If the form has been updated with new fields and earlier
-            # submissions have been selected as part of the bulk update,
-            # a new element has to be created before a value can be set.
-            # However, with this new power, arbitrary fields can be added
-            # to the XML tree through the API.
-            for k, v in update_data.items():
-                # A potentially clunky way of taking groups and nested groups
-                # into account when the elements don't exist on the XML tree
-                # (which could be the case if the form has been updated). They
-                # are iteratively attached to the tree since we can only
-                # append one element deep per iteration
-                if '/' in k:
-                    accumulated_elements = []
-                    for i, element in enumerate(k.split('/')):
-                        if i == 0:
-                            ET.SubElement(xml_parsed, element)
-                            accumulated_elements.append(element)
-                        else:
-                            updated_xml_path = '/'.join(accumulated_elements)
-                            ET.SubElement(
-                                xml_parsed.find(updated_xml_path), element
-                            )
-                            accumulated_elements.append(element)
-
-                element_to_update = xml_parsed.find(k)
-                element_to_update_or_new = (
-                    element_to_update
-                    if element_to_update is not None
-                    else ET.SubElement(xml_parsed, k)
+        auth_headers = self.__get_auth_headers(user)
+
+        def _prepare_requests():
+            # Database queries stay in the calling thread; workers only send
+            # the prepared requests
+            for submission in submissions:
+                _uuid, xml = self.__rewrite_submission_xml(
+                    submission, update_data
                 )
-                element_to_update_or_new.text = v
-
-            # TODO: Might be worth refactoring this as it is also used when
-            # duplicating a submission
-            file_tuple = (_uuid, io.BytesIO(ET.tostring(xml_parsed)))
-            files = {'xml_submission_file': file_tuple}
-            # `POST` is required by OpenRosa spec https://docs.getodk.org/openrosa-form-submission
-            headers = {}
-            if partial_perms:
-                headers.update(
-                    KobocatOneTimeAuthToken.create_token(user, method='POST').get_header()
+                # TODO: Might be worth refactoring this as it is also used
+                # when duplicating a submission
+                file_tuple = (_uuid, io.BytesIO(xml))
+                files = {'xml_submission_file': file_tuple}
+                # `POST` is required by OpenRosa spec https://docs.getodk.org/openrosa-form-submission
+                headers = dict(auth_headers)
+                if partial_perms:
+                    headers.update(
+                        KobocatOneTimeAuthToken.create_token(
+                            user, method='POST'
+                        ).get_header()
+                    )
+                kc_request = requests.Request(
+                    method='POST',
+                    url=self.submission_url,
+                    files=files,
+                    headers=headers,
                 )
+                yield _uuid, kc_request.prepare()
 
-            kc_request = requests.Request(
-                method='POST',
-                url=self.submission_url,
-                files=files,
-                headers=headers,
-            )
-            kc_response = self.__kobocat_proxy_request(
-                kc_request, user=user
-            )
+        max_workers = settings.BULK_UPDATE_SUBMISSIONS_MAX_WORKERS
+        kc_responses = []
+        pending = {}
 
-            kc_responses.append(
-                {
-                    'uuid': _uuid,
-                    'response': kc_response,
-                }
-            )
+        def _collect(futures):
+            for future in futures:
+                index, _uuid = pending.pop(future)
+                kc_responses.append(
+                    (index, {'uuid': _uuid, 'response': future.result()})
+                )
+                if progress_callback:
+                    progress_callback(len(kc_responses), total)
 
-        return self.__prepare_bulk_update_response(kc_responses)
+        with self.__get_pooled_session(max_workers) as session, \
+                ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for index, (_uuid, prepared_request) in enumerate(
+                _prepare_requests()
+            ):
+                # Bound the number of submissions rewritten ahead of being
+                # sent
+                if len(pending) >= max_workers * 2:
+                    done, _not_done = wait(
+                        pending, return_when=FIRST_COMPLETED
+                    )
+                    _collect(done)
+                future = executor.submit(session.send, prepared_request)
+                pending[future] = (index, _uuid)
+            _collect(list(pending))
+
+        SubmissionCountCache.invalidate(self.mongo_userform_id)
+        # Keep the order of submissions in the response
+        kc_responses.sort(key=lambda indexed_response: indexed_response[0])
+        return self.__prepare_bulk_update_response(
+            [kc_response for _, kc_response in kc_responses]
+        )
 
     def calculated_submission_count(self, user: 'auth.User', **kwargs) -> int:
         params = self.validate_submission_list_params(user,
@@ -360,6 +356,7 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
             method='DELETE', url=kc_url, headers=headers
         )
         kc_response = self.__kobocat_proxy_request(kc_request, user)
+        SubmissionCountCache.invalidate(self.mongo_userform_id)
 
         return self.__prepare_as_drf_response_signature(kc_response)
 
@@ -400,6 +397,7 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
             method='DELETE', url=kc_url, json=data, headers=headers
         )
         kc_response = self.__kobocat_proxy_request(kc_request, user)
+        SubmissionCountCache.invalidate(self.mongo_userform_id)
 
         return self.__prepare_as_drf_response_signature(kc_response)
 
@@ -463,6 +461,7 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
         kc_response = self.__kobocat_proxy_request(
             kc_request, user=user
         )
+        SubmissionCountCache.invalidate(self.mongo_userform_id)
 
         if kc_response.status_code == status.HTTP_201_CREATED:
             return next(self.get_submissions(user, query={'_uuid': _uuid}))
@@ -669,6 +668,19 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
             )
         return submissions
 
+    def get_submission_value_counts(
+        self,
+        user: 'auth.User',
+        fields: list,
+        **kwargs
+    ) -> dict:
+        params = self.validate_submission_list_params(user,
+                                                      validate_count=True,
+                                                      **kwargs)
+        return MongoHelper.get_value_counts(
+            self.mongo_userform_id, fields, **params
+        )
+
     def get_validation_status(self, submission_id: int, user: 'auth.User') -> dict:
         url = self.get_submission_validation_status_url(submission_id)
         kc_request = requests.Request(method='GET', url=url)
@@ -676,6 +688,18 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
 
         return self.__prepare_as_drf_response_signature(kc_response)
 
+    def get_xml_submissions_with_ids(
+        self,
+        user: 'auth.User',
+        submission_ids: list = [],
+        **mongo_query_params
+    ) -> Generator[tuple, None, None]:
+        mongo_query_params['submission_ids'] = submission_ids
+        params = self.validate_submission_list_params(
+            user, format_type=SUBMISSION_FORMAT_TYPE_XML, **mongo_query_params
+        )
+        return self.__get_submissions_in_xml(with_ids=True, **params)
+
     @staticmethod
     def internal_to_external_url(url):
         """
@@ -902,6 +926,7 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
 
         kc_request = requests.Request(**kc_request_params)
         kc_response = self.__kobocat_proxy_request(kc_request, user)
+        SubmissionCountCache.invalidate(self.mongo_userform_id)
         return self.__prepare_as_drf_response_signature(kc_response)
 
     def set_validation_statuses(self, user: 'auth.User', data: dict) -> dict:
@@ -941,6 +966,7 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
             method='PATCH', url=url, headers=headers, json=data
         )
         kc_response = self.__kobocat_proxy_request(kc_request, user)
+        SubmissionCountCache.invalidate(self.mongo_userform_id)
         return self.__prepare_as_drf_response_signature(kc_response)
 
     @property
@@ -1137,6 +1163,11 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
 
         return json_response
 
+    def _last_submission_edit_time(self, max_submission_id=None):
+        return last_submission_edit_time(
+            xform_id=self.xform_id, max_submission_id=max_submission_id
+        )
+
     def _last_submission_time(self):
         id_string = self.backend_response['id_string']
         return last_submission_time(
@@ -1187,10 +1218,11 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
             for submission in mongo_cursor
         )
 
-    def __get_submissions_in_xml(self, **params):
+    def __get_submissions_in_xml(self, with_ids=False, **params):
         """
         Retrieves submissions directly from PostgreSQL.
 
+        :param with_ids: bool. Whether to return `(id, XML)` tuples
         :param params: dict. Filter params
         :return: list<XML>
         """
@@ -1236,8 +1268,38 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
             limit = offset + params.get('limit')
             queryset = queryset[offset:limit]
 
+        if with_ids:
+            return (
+                (lazy_instance.pk, lazy_instance.xml)
+                for lazy_instance in queryset
+            )
         return (lazy_instance.xml for lazy_instance in queryset)
 
+    @staticmethod
+    def __get_auth_headers(user: 'auth.User') -> dict:
+        """
+        Return the headers authenticating `user` against KoBoCAT, the same
+        way `__kobocat_proxy_request()` does
+        """
+        if is_user_anonymous(user):
+            return {}
+        token, created = Token.objects.get_or_create(user=user)
+        return {'Authorization': 'Token %s' % token.key}
+
+    @staticmethod
+    def __get_pooled_session(pool_size: int) -> requests.Session:
+        """
+        Return a session keeping up to `pool_size` connections alive, to be
+        shared by as many threads
+        """
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
     @staticmethod
     def __kobocat_proxy_request(kc_request, user=None):
         """
@@ -1373,6 +1435,66 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
             },
         }
 
+    def __rewrite_submission_xml(
+        self, submission: str, update_data: dict
+    ) -> (str, bytes):
+        """
+        Apply `update_data` to `submission` and give it a new `instanceID`.
+        Return the new uuid and the updated XML.
+        """
+        xml_parsed = ET.fromstring(submission)
+
+        _uuid, uuid_formatted = self.generate_new_instance_id()
+
+        # Updating xml fields for submission. In order to update an existing
+        # submission, the current `instanceID` must be moved to the value
+        # for `deprecatedID`.
+        instance_id = xml_parsed.find('meta/instanceID')
+        # If the submission has been edited before, it will already contain
+        # a deprecatedID element - otherwise create a new element
+        deprecated_id = xml_parsed.find('meta/deprecatedID')
+        deprecated_id_or_new = (
+            deprecated_id
+            if deprecated_id is not None
+            else ET.SubElement(xml_parsed.find('meta'), 'deprecatedID')
+        )
+        deprecated_id_or_new.text = instance_id.text
+        instance_id.text = uuid_formatted
+
+        # If the form has been updated with new fields and earlier
+        # submissions have been selected as part of the bulk update,
+        # a new element has to be created before a value can be set.
+        # However, with this new power, arbitrary fields can be added
+        # to the XML tree through the API.
+        for k, v in update_data.items():
+            # A potentially clunky way of taking groups and nested groups
+            # into account when the elements don't exist on the XML tree
+            # (which could be the case if the form has been updated). They
+            # are iteratively attached to the tree since we can only
+            # append one element deep per iteration
+            if '/' in k:
+                accumulated_elements = []
+                for i, element in enumerate(k.split('/')):
+                    if i == 0:
+                        ET.SubElement(xml_parsed, element)
+                        accumulated_elements.append(element)
+                    else:
+                        updated_xml_path = '/'.join(accumulated_elements)
+                        ET.SubElement(
+                            xml_parsed.find(updated_xml_path), element
+                        )
+                        accumulated_elements.append(element)
+
+            element_to_update = xml_parsed.find(k)
+            element_to_update_or_new = (
+                element_to_update
+                if element_to_update is not None
+                else ET.SubElement(xml_parsed, k)
+            )
+            element_to_update_or_new.text = v
+
+        return _uuid, ET.tostring(xml_parsed)
+
     def __save_kc_metadata(self, file_: SyncBackendMediaInterface):
         """
         Prepares request and data corresponding to the kind of media file
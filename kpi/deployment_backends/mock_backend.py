@@ -2,7 +2,8 @@
 import copy
 import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Callable, Optional
 
 import pytz
 from deepmerge import always_merger
@@ -22,6 +23,7 @@ from kpi.constants import (
 from kpi.interfaces.sync_backend_media import SyncBackendMediaInterface
 from kpi.models.asset_file import AssetFile
 from kpi.utils.mongo_helper import MongoHelper, drop_mock_only
+from kpi.utils.submission_count_cache import SubmissionCountCache
 from .base_backend import BaseDeploymentBackend
 
 
@@ -30,11 +32,18 @@ class MockDeploymentBackend(BaseDeploymentBackend):
     Only used for unit testing and interface testing.
     """
 
+    # Mongo collection of the times mock submissions were last saved (see
+    # `_last_submission_edit_time()`)
+    EDIT_TIMES_COLLECTION = 'mock_submission_edit_times'
+
     def bulk_assign_mapped_perms(self):
         pass
 
     def bulk_update_submissions(
-        self, data: dict, user: 'auth.User'
+        self,
+        data: dict,
+        user: 'auth.User',
+        progress_callback: Optional[Callable[[int, int], None]] = None,
     ) -> dict:
 
         submission_ids = self.validate_write_access_with_partial_perms(
@@ -72,6 +81,8 @@ class MockDeploymentBackend(BaseDeploymentBackend):
                         'message': 'Successful submission'
                     }
                 )
+                if progress_callback:
+                    progress_callback(len(responses), len(submissions))
 
         self.mock_submissions(submissions)
         return self.__prepare_bulk_update_response(responses)
@@ -115,6 +126,8 @@ class MockDeploymentBackend(BaseDeploymentBackend):
             }
 
         settings.MONGO_DB.instances.delete_one({'_id': submission_id})
+        self.__forget_edit_times([submission_id])
+        SubmissionCountCache.invalidate(self.mongo_userform_id)
 
         return {
             'content_type': 'application/json',
@@ -164,6 +177,10 @@ class MockDeploymentBackend(BaseDeploymentBackend):
             settings.MONGO_DB.instances.delete_one(
                 {'_id': submission_id}
             )
+        self.__forget_edit_times(
+            [submission['_id'] for submission in submissions]
+        )
+        SubmissionCountCache.invalidate(self.mongo_userform_id)
 
         return {
             'content_type': 'application/json',
@@ -198,6 +215,8 @@ class MockDeploymentBackend(BaseDeploymentBackend):
         })
         
         settings.MONGO_DB.instances.insert_one(duplicated_submission)
+        self.__touch_edit_times([next_id])
+        SubmissionCountCache.invalidate(self.mongo_userform_id)
         return duplicated_submission
 
     def get_data_download_links(self):
@@ -300,14 +319,20 @@ class MockDeploymentBackend(BaseDeploymentBackend):
         if format_type != SUBMISSION_FORMAT_TYPE_XML:
             return submissions
 
-        return [
-            dicttoxml(
-                self.__prepare_xml(submission),
-                attr_type=False,
-                custom_root=self.asset.uid,
-            ).decode()
-            for submission in submissions
-        ]
+        return [self.__to_xml(submission) for submission in submissions]
+
+    def get_submission_value_counts(
+        self,
+        user: 'auth.User',
+        fields: list,
+        **kwargs
+    ) -> dict:
+        params = self.validate_submission_list_params(user,
+                                                      validate_count=True,
+                                                      **kwargs)
+        return MongoHelper.get_value_counts(
+            self.mongo_userform_id, fields, **params
+        )
 
     def get_validation_status(self, submission_id: int, user: 'auth.User') -> dict:
 
@@ -317,6 +342,19 @@ class MockDeploymentBackend(BaseDeploymentBackend):
             'data': submission.get('_validation_status')
         }
 
+    def get_xml_submissions_with_ids(
+        self,
+        user: 'auth.User',
+        submission_ids: list = [],
+        **mongo_query_params
+    ) -> list:
+        return [
+            (submission['_id'], self.__to_xml(submission))
+            for submission in self.get_submissions(
+                user, submission_ids=submission_ids, **mongo_query_params
+            )
+        ]
+
     @drop_mock_only
     def mock_submissions(self, submissions: list, flush_db: bool = True):
         """
@@ -324,6 +362,8 @@ class MockDeploymentBackend(BaseDeploymentBackend):
         """
         if flush_db:
             settings.MONGO_DB.instances.drop()
+            settings.MONGO_DB[self.EDIT_TIMES_COLLECTION].drop()
+            SubmissionCountCache.invalidate()
         count = settings.MONGO_DB.instances.count_documents({})
 
         for idx, submission in enumerate(submissions):
@@ -338,6 +378,11 @@ class MockDeploymentBackend(BaseDeploymentBackend):
             # Do not add `MongoHelper.USERFORM_ID` to original `submissions`
             del submission[MongoHelper.USERFORM_ID]
 
+        self.__touch_edit_times(
+            [submission['_id'] for submission in submissions]
+        )
+        SubmissionCountCache.invalidate(self.mongo_userform_id)
+
     @property
     def mongo_userform_id(self):
         return f'{self.asset.owner.username}_{self.asset.uid}'
@@ -414,6 +459,8 @@ class MockDeploymentBackend(BaseDeploymentBackend):
             {'_id': submission_id},
             {'$set': {'_validation_status': validation_status}},
         )
+        self.__touch_edit_times([submission_id])
+        SubmissionCountCache.invalidate(self.mongo_userform_id)
         return {
             'content_type': 'application/json',
             'status': status_code,
@@ -454,7 +501,7 @@ class MockDeploymentBackend(BaseDeploymentBackend):
             fields=['_id'],
         )
 
-        submissions_count = 0
+        submission_ids = []
 
         for submission in submissions:
             if not data['validation_status.uid']:
@@ -470,7 +517,11 @@ class MockDeploymentBackend(BaseDeploymentBackend):
                 {'$set': {'_validation_status': validation_status}},
             )
 
-            submissions_count += 1
+            submission_ids.append(submission['_id'])
+
+        submissions_count = len(submission_ids)
+        self.__touch_edit_times(submission_ids)
+        SubmissionCountCache.invalidate(self.mongo_userform_id)
 
         return {
             'content_type': 'application/json',
@@ -496,6 +547,48 @@ class MockDeploymentBackend(BaseDeploymentBackend):
         for obj in queryset:
             assert issubclass(obj.__class__, SyncBackendMediaInterface)
 
+    def _last_submission_edit_time(self, max_submission_id=None):
+        edit_times = [
+            edit_time
+            for submission_id, edit_time in self.__get_edit_times().items()
+            if max_submission_id is None
+            or int(submission_id) <= max_submission_id
+        ]
+        return max(edit_times, default=None)
+
+    def __get_edit_times(self) -> dict:
+        """
+        Return when each mock submission was last saved, by submission id.
+        They stand for the `date_modified` of KoBoCAT instances.
+        """
+        document = settings.MONGO_DB[self.EDIT_TIMES_COLLECTION].find_one(
+            {'_id': self.mongo_userform_id}
+        )
+        return document['edit_times'] if document else {}
+
+    def __forget_edit_times(self, submission_ids: list):
+        if submission_ids:
+            settings.MONGO_DB[self.EDIT_TIMES_COLLECTION].update_one(
+                {'_id': self.mongo_userform_id},
+                {'$unset': {f'edit_times.{id_}': '' for id_ in submission_ids}},
+            )
+
+    def __touch_edit_times(self, submission_ids: list):
+        if not submission_ids:
+            return
+        # Mongo stores naive datetimes, to the millisecond. Make sure each
+        # save changes the last edit time, however quick
+        now = datetime.now(tz=pytz.UTC).replace(tzinfo=None)
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        last_edit_time = self._last_submission_edit_time()
+        if last_edit_time and now <= last_edit_time:
+            now = last_edit_time + timedelta(milliseconds=1)
+        settings.MONGO_DB[self.EDIT_TIMES_COLLECTION].update_one(
+            {'_id': self.mongo_userform_id},
+            {'$set': {f'edit_times.{id_}': now for id_ in submission_ids}},
+            upsert=True,
+        )
+
     @staticmethod
     def __prepare_bulk_update_response(kc_responses: list) -> dict:
         total_update_attempts = len(kc_responses)
@@ -510,6 +603,13 @@ class MockDeploymentBackend(BaseDeploymentBackend):
             },
         }
 
+    def __to_xml(self, submission: dict) -> str:
+        return dicttoxml(
+            self.__prepare_xml(submission),
+            attr_type=False,
+            custom_root=self.asset.uid,
+        ).decode()
+
     @staticmethod
     def __prepare_xml(submission: dict) -> dict:
         submission_copy = copy.deepcopy(submission)
@@ -1,7 +1,11 @@
 # coding: utf-8
+import operator
+from functools import reduce
+
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.core.exceptions import FieldError
+from django.db import connection
 from django.db.models import Case, Count, F, IntegerField, Q, Value, When
 from django.db.models.query import QuerySet
 from rest_framework import filters
@@ -20,6 +24,7 @@ from kpi.constants import (
 )
 from kpi.exceptions import SearchQueryTooShortException
 from kpi.models.asset import UserAssetSubscription
+from kpi.utils.asset_search import WordSimilarity
 from kpi.utils.query_parser import get_parsed_parameters, parse, ParseError
 from kpi.utils.object_permission import (
     get_objects_for_user,
@@ -346,8 +351,15 @@ class SearchFilter(filters.BaseFilterBackend):
     parseable, references a field that does not exist, or specifies an invalid
     value for a field (e.g. text for an integer field), return an empty
     queryset to make the problem obvious.
+
+    On PostgreSQL, results can be sorted by relevance with
+    `ordering=relevance` if the view defines `search_rank_field`, the field
+    of its default field lookups. Terms without a specified field are then
+    compared to that field with trigram similarity.
     """
 
+    RELEVANCE_ORDERING = 'relevance'
+
     def filter_queryset(self, request, queryset, view):
         try:
             q = request.query_params['q']
@@ -370,10 +382,41 @@ class SearchFilter(filters.BaseFilterBackend):
             # If no search field is specified, the search term is compared
             # to several default fields and therefore may return a copies
             # of the same match, therefore the `distinct()` method is required
-            return queryset.filter(q_obj).distinct()
+            queryset = queryset.filter(q_obj).distinct()
         except (FieldError, ValueError):
             return queryset.model.objects.none()
 
+        if request.query_params.get('ordering') == self.RELEVANCE_ORDERING:
+            queryset = self._order_by_relevance(queryset, q_obj, view)
+
+        return queryset
+
+    @staticmethod
+    def _order_by_relevance(
+        queryset: QuerySet, q_obj: Q, view
+    ) -> QuerySet:
+        rank_field = getattr(view, 'search_rank_field', None)
+        if rank_field is None or connection.vendor != 'postgresql':
+            return queryset
+
+        terms = [
+            term
+            for term in get_parsed_parameters(q_obj).get(
+                f'{rank_field}__icontains', []
+            )
+            if isinstance(term, str)
+        ]
+        if not terms:
+            return queryset
+
+        relevance = reduce(
+            operator.add,
+            (WordSimilarity(rank_field, term) for term in terms),
+        )
+        return queryset.annotate(relevance=relevance).order_by(
+            '-relevance', *queryset.model._meta.ordering
+        )
+
 
 class KpiAssignedObjectPermissionsFilter(filters.BaseFilterBackend):
     """
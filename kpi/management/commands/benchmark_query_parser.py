@@ -0,0 +1,80 @@
+# coding: utf-8
+import time
+
+from django.core.management.base import BaseCommand
+
+from kpi.constants import ASSET_SEARCH_DEFAULT_FIELD_LOOKUPS
+from kpi.utils.query_parser import parse
+from kpi.utils.query_parser.canopy_autogenerated_parser import (
+    parse as grammar_parse,
+)
+from kpi.utils.query_parser.query_parser import QueryParseActions
+from kpi.utils.query_parser.recursive_descent_parser import (
+    parse as recursive_descent_parse,
+)
+
+QUERIES = [
+    'asset_type:survey',
+    'parent:null',
+    'asset_type:survey AND status:deployed',
+    '(asset_type:question OR asset_type:block OR asset_type:template) '
+    'AND NOT asset_type:collection',
+    'settings__country__codes:"AFG" AND settings__sector__value:Health',
+    'health survey',
+    '"household survey" NOT tags__name__icontains:archived',
+    'owner__username:kobo AND (name__icontains:water OR '
+    'name__icontains:sanitation) AND NOT _deployment_data__active:false',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure how fast asset search queries are parsed by the parser '
+        'generated by canopy, with and without the cache of `parse()`, and '
+        'by a hand-written recursive descent parser'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=10000,
+            help='Number of times each query is parsed',
+        )
+
+    def handle(self, *args, **options):
+        default_field_lookups = ASSET_SEARCH_DEFAULT_FIELD_LOOKUPS
+
+        def canopy_parse(query):
+            return grammar_parse(
+                query, QueryParseActions(default_field_lookups)
+            )
+
+        parsers = [
+            ('canopy', canopy_parse),
+            ('canopy (cached)', lambda q: parse(q, default_field_lookups)),
+            (
+                'recursive descent',
+                lambda q: recursive_descent_parse(q, default_field_lookups),
+            ),
+        ]
+
+        # Every parser must build the same `Q` objects
+        for query in QUERIES:
+            expected = canopy_parse(query)
+            for name, parse_ in parsers:
+                assert parse_(query) == expected, f'{name}: {query}'
+
+        iterations = options['iterations']
+        count = iterations * len(QUERIES)
+        for name, parse_ in parsers:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                for query in QUERIES:
+                    parse_(query)
+            duration = time.perf_counter() - start
+
+            self.stdout.write(
+                f'{name}: {count} queries in {duration:.2f}s '
+                f'({count / duration:,.0f} queries/s)'
+            )
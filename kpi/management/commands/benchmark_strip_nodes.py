@@ -0,0 +1,148 @@
+# coding: utf-8
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from lxml import etree
+
+from kpi.utils.xml import NodeFilter
+
+
+def legacy_strip_nodes(source, nodes_to_keep, use_xpath=False):
+    """
+    Former implementation of `kpi.utils.xml.strip_nodes()`, which computes
+    the path of every node and compares it with every path to keep
+    """
+    if isinstance(source, str):
+        source = source.encode()
+
+    xml_doc = etree.fromstring(source)
+    tree = etree.ElementTree(xml_doc)
+    root_element = tree.getroot()
+    root_path = tree.getpath(root_element)
+
+    def remove_root_path(path_):
+        return path_.replace(root_path, '')
+
+    def get_xpath_matches():
+        if use_xpath:
+            return [f"/{xpath_.strip('/')}/" for xpath_ in nodes_to_keep]
+
+        xpath_matches_ = []
+        for node_to_keep in nodes_to_keep:
+            for node in tree.iter(node_to_keep):
+                xpath_match = remove_root_path(tree.getpath(node))
+                xpath_matches_.append(f'{xpath_match}/')
+        return xpath_matches_
+
+    def process_node(node_, xpath_matches_):
+        for child in node_.getchildren():
+            process_node(child, xpath_matches_)
+
+        node_xpath = remove_root_path(tree.getpath(node_))
+        if (
+            not f'{node_xpath}/'.startswith(tuple(xpath_matches_))
+            and node_.get('do_not_delete') != 'true'
+        ):
+            if node_ != root_element:
+                node_.getparent().remove(node_)
+        elif node_xpath != '':
+            node_.getparent().set('do_not_delete', 'true')
+
+        if node_.attrib.get('do_not_delete'):
+            del node_.attrib['do_not_delete']
+
+    if len(nodes_to_keep):
+        process_node(root_element, get_xpath_matches())
+
+    return etree.tostring(tree, pretty_print=True, encoding='utf-8').decode()
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure how fast nodes of large synthetic submissions are stripped '
+        'by `strip_nodes()`, compared with its former implementation'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--groups',
+            type=int,
+            default=100,
+            help='Number of groups of the synthetic submission',
+        )
+        parser.add_argument(
+            '--questions',
+            type=int,
+            default=1000,
+            help='Number of questions per group',
+        )
+        parser.add_argument(
+            '--fields',
+            type=int,
+            default=50,
+            help='Number of questions to keep',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=3,
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+        )
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        groups = options['groups']
+        questions = options['questions']
+        submission = self._generate_submission(groups, questions)
+        node_count = groups * (questions + 1)
+        xpaths = [
+            f'group_{random.randrange(groups)}/'
+            f'question_{random.randrange(questions)}'
+            for _ in range(options['fields'])
+        ]
+        names = [xpath.split('/')[1] for xpath in xpaths]
+
+        for use_xpath, nodes_to_keep in [(True, xpaths), (False, names)]:
+            node_filter = NodeFilter(nodes_to_keep, use_xpath=use_xpath)
+            implementations = [
+                (
+                    'legacy',
+                    lambda: legacy_strip_nodes(
+                        submission, nodes_to_keep, use_xpath=use_xpath
+                    ),
+                ),
+                ('node filter', lambda: node_filter.strip(submission)),
+            ]
+
+            # Both implementations must strip the same nodes
+            assert implementations[0][1]() == implementations[1][1]()
+
+            mode = 'xpaths' if use_xpath else 'names'
+            for name, strip in implementations:
+                start = time.perf_counter()
+                for _ in range(options['iterations']):
+                    strip()
+                duration = (
+                    time.perf_counter() - start
+                ) / options['iterations']
+                self.stdout.write(
+                    f'{name} ({mode}): {node_count} nodes in {duration:.3f}s '
+                    f'({node_count / duration:,.0f} nodes/s)'
+                )
+
+    @staticmethod
+    def _generate_submission(groups, questions):
+        root = etree.Element('root')
+        for group_index in range(groups):
+            group = etree.SubElement(root, f'group_{group_index}')
+            for question_index in range(questions):
+                question = etree.SubElement(
+                    group, f'question_{question_index}'
+                )
+                question.text = f'Answer {group_index}.{question_index}'
+        return etree.tostring(root)
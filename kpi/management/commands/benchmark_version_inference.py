@@ -0,0 +1,104 @@
+# coding: utf-8
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from kobo.apps.reports.report_data import (
+    INFERRED_VERSION_ID_KEY,
+    get_version_id_inferrer,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure how fast the version of synthetic submissions is inferred '
+        'when building formpacks, for forms with few and many versions'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--submissions',
+            type=int,
+            default=1000000,
+            help='Number of synthetic submissions',
+        )
+        parser.add_argument(
+            '--versions',
+            type=int,
+            default=200,
+            help='Number of versions of the form with many versions',
+        )
+        parser.add_argument(
+            '--latest-ratio',
+            type=float,
+            default=0.8,
+            help='Ratio of submissions collected with the latest version',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+        )
+
+    def handle(self, *args, **options):
+        for version_count in sorted({1, options['versions']}):
+            random.seed(options['seed'])
+            version_ids_newest_first = [
+                f'v{index:05d}' for index in range(version_count)
+            ]
+            # Pretend the oldest versions come from reversion
+            reversion_ids = {
+                str(index): version_id
+                for index, version_id in enumerate(
+                    version_ids_newest_first[version_count // 2:]
+                )
+            }
+            submissions = self._generate_submissions(
+                options['submissions'],
+                version_ids_newest_first,
+                list(reversion_ids),
+                options['latest_ratio'],
+            )
+            infer_version_id = get_version_id_inferrer(
+                version_ids_newest_first, reversion_ids
+            )
+
+            start = time.perf_counter()
+            for submission in submissions:
+                infer_version_id(submission)
+            duration = time.perf_counter() - start
+
+            assert all(INFERRED_VERSION_ID_KEY in s for s in submissions)
+            self.stdout.write(
+                f'{version_count} version(s): '
+                f'{len(submissions)} submissions in {duration:.2f}s '
+                f'({len(submissions) / duration:,.0f} submissions/s)'
+            )
+
+    @staticmethod
+    def _generate_submissions(
+        count, version_ids_newest_first, reversion_ids, latest_ratio
+    ):
+        submissions = []
+        for index in range(count):
+            submission = {
+                '_id': index,
+                'question_1': 'yes',
+                'question_2': index,
+                'group/question_3': 'no',
+            }
+            if random.random() < latest_ratio:
+                submission['__version__'] = version_ids_newest_first[0]
+            else:
+                # Older submissions carry many version keys
+                submission['__version__'] = random.choice(
+                    version_ids_newest_first
+                )
+                submission['_version_'] = random.choice(
+                    version_ids_newest_first
+                )
+                if reversion_ids:
+                    submission['_version__001'] = random.choice(reversion_ids)
+            submissions.append(submission)
+        return submissions
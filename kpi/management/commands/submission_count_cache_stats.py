@@ -0,0 +1,40 @@
+# coding: utf-8
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from kpi.utils.submission_count_cache import SubmissionCountCache
+
+
+class Command(BaseCommand):
+    help = (
+        'Print the hits and misses of the submission count cache. Requires '
+        'a cache back end shared by every process (e.g. Redis or memcached).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            default=False,
+            help='Reset the counters after printing them',
+        )
+
+    def handle(self, *args, **options):
+        # Counters of other processes cannot be read from a local-memory
+        # cache, i.e. this one would always be empty
+        if isinstance(caches['default'], LocMemCache):
+            raise CommandError(
+                'The cache back end is local to each process, configure a '
+                'shared one (e.g. Redis or memcached) in `CACHES`'
+            )
+
+        stats = SubmissionCountCache.get_stats()
+        total = stats['hits'] + stats['misses']
+        hit_ratio = stats['hits'] / total if total else 0
+        self.stdout.write(
+            f"hits: {stats['hits']}\tmisses: {stats['misses']}\t"
+            f'hit ratio: {hit_ratio:.2%}'
+        )
+        if options['reset']:
+            SubmissionCountCache.reset_stats()
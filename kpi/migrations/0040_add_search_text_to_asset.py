@@ -0,0 +1,89 @@
+# coding: utf-8
+import json
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+def get_search_text(name, uid, owner_username, settings, summary, tag_names):
+    """
+    Frozen copy of `kpi.utils.asset_search.get_search_text()`
+    """
+    try:
+        description = settings.get('description')
+    except AttributeError:
+        description = None
+
+    values = [
+        name,
+        uid,
+        owner_username,
+        description,
+        json.dumps(summary, ensure_ascii=False, default=str),
+    ]
+    return '\n'.join(
+        [*(str(value) for value in values if value), '\x1e', *tag_names]
+    )
+
+
+def populate_search_text(apps, schema_editor):
+    Asset = apps.get_model('kpi', 'Asset')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+
+    try:
+        content_type = ContentType.objects.get(app_label='kpi', model='asset')
+    except ContentType.DoesNotExist:
+        # Fresh database, there are no assets yet
+        return
+
+    batch_size = 1000
+    assets = Asset.objects.only(
+        'pk', 'name', 'uid', 'owner__username', 'settings', 'summary'
+    ).select_related('owner').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(assets.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        tag_names = {}
+        for object_id, tag_name in TaggedItem.objects.filter(
+            content_type=content_type,
+            object_id__in=[asset.pk for asset in batch],
+        ).values_list('object_id', 'tag__name'):
+            tag_names.setdefault(object_id, []).append(tag_name)
+        for asset in batch:
+            asset.search_text = get_search_text(
+                asset.name,
+                asset.uid,
+                asset.owner.username if asset.owner else None,
+                asset.settings,
+                asset.summary,
+                tag_names.get(asset.pk, []),
+            )
+        Asset.objects.bulk_update(batch, ['search_text'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('kpi', '0039_add_support_paired_data_to_asset_file'),
+        ('taggit', '0001_initial'),
+    ]
+
+    operations = [
+        # Required by the index added in
+        # `0042_add_search_text_index_to_asset`
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='asset',
+            name='search_text',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(
+            populate_search_text,
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.7 on 2026-10-18 12:00
+
+import django.contrib.postgres.fields.jsonb
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi', '0040_add_search_text_to_asset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetReport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('params_hash', models.CharField(max_length=32)),
+                ('watermark', django.contrib.postgres.fields.jsonb.JSONField(default=list)),
+                ('stats', django.contrib.postgres.fields.jsonb.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('date_modified', models.DateTimeField(default=django.utils.timezone.now)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stored_reports', to='kpi.Asset')),
+            ],
+            options={
+                'unique_together': {('asset', 'params_hash')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.7 on 2026-10-18 12:00
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # `CREATE INDEX CONCURRENTLY` cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('kpi', '0041_add_asset_report'),
+    ]
+
+    operations = [
+        # Build the index without locking `kpi_asset` against writes.
+        # Django 2.2 has no `AddIndexConcurrently`
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql=(
+                        'CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                        '"kpi_asset_search_text_trgm" ON "kpi_asset" '
+                        'USING gin ("search_text" gin_trgm_ops)'
+                    ),
+                    reverse_sql=(
+                        'DROP INDEX CONCURRENTLY IF EXISTS '
+                        '"kpi_asset_search_text_trgm"'
+                    ),
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='asset',
+                    index=django.contrib.postgres.indexes.GinIndex(
+                        fields=['search_text'],
+                        name='kpi_asset_search_text_trgm',
+                        opclasses=['gin_trgm_ops'],
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 2.2.7 on 2026-10-18 12:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # `CREATE INDEX CONCURRENTLY` cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('kpi', '0042_add_search_text_index_to_asset'),
+    ]
+
+    operations = [
+        # On PostgreSQL, `search_text__icontains` compiles to
+        # `UPPER("search_text"::text) LIKE UPPER(%s)`, which an index on the
+        # column itself cannot serve. Django 2.2 cannot declare indexes on
+        # expressions, so the new index is left out of the state
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql=(
+                        'CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                        '"kpi_asset_search_text_upper_trgm" ON "kpi_asset" '
+                        'USING gin (UPPER("search_text") gin_trgm_ops)'
+                    ),
+                    reverse_sql=(
+                        'DROP INDEX CONCURRENTLY IF EXISTS '
+                        '"kpi_asset_search_text_upper_trgm"'
+                    ),
+                ),
+                migrations.RunSQL(
+                    sql=(
+                        'DROP INDEX CONCURRENTLY IF EXISTS '
+                        '"kpi_asset_search_text_trgm"'
+                    ),
+                    reverse_sql=(
+                        'CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                        '"kpi_asset_search_text_trgm" ON "kpi_asset" '
+                        'USING gin ("search_text" gin_trgm_ops)'
+                    ),
+                ),
+            ],
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='asset',
+                    name='kpi_asset_search_text_trgm',
+                ),
+            ],
+        ),
+    ]
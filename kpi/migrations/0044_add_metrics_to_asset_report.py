@@ -0,0 +1,20 @@
+# Generated by Django 2.2.7 on 2026-10-18 12:00
+
+import django.contrib.postgres.fields.jsonb
+import django.core.serializers.json
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi', '0043_index_upper_search_text_of_asset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assetreport',
+            name='metrics',
+            field=django.contrib.postgres.fields.jsonb.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, null=True),
+        ),
+    ]
@@ -20,10 +20,14 @@ from kpi.deployment_backends.kc_access.utils import (
     assign_applicable_kc_permissions
 )
 from kpi.models.object_permission import ObjectPermission
+from kpi.utils.cache import void_cache_for_request
 from kpi.utils.object_permission import (
+    get_cached_code_names,
     get_database_user,
+    get_perm_ids_from_code_names,
     perm_parse,
 )
+from kpi.utils.permission_cache import PermissionCache
 from kpi.utils.permissions import is_user_anonymous
 
 
@@ -132,9 +136,9 @@ class ObjectPermissionMixin:
             app_label, codename = perm_parse(perm)
             if app_label == content_type.app_label:
                 codenames.add(codename)
-        allowed_permission_ids = Permission.objects.filter(
-            content_type_id=content_type.pk, codename__in=codenames
-        ).values_list('pk', flat=True)
+        allowed_permission_ids = get_perm_ids_from_code_names(
+            codenames, type(self)
+        )
         filtered_set = copy.copy(unfiltered_set)
         for user_id, permission_id in unfiltered_set:
             if user_id == settings.ANONYMOUS_USER_ID:
@@ -205,60 +209,147 @@ class ObjectPermissionMixin:
             # Anonymous users weren't considered; no filtering is necessary
             return effective_perms
 
+    @void_cache_for_request(keys=('__get_all_object_permissions',
+                                  '__get_all_user_permissions',))
+    @transaction.atomic
     def recalculate_descendants_perms(self):
+        """
+        Recalculate the inherited permissions of all descendants, one level
+        of the tree at a time: stale inherited permissions of a whole level
+        are deleted at once and new ones are created with a single
+        `bulk_create()`. Effective permissions of each level are computed in
+        memory and handed down to the next one, so the number of queries
+        grows with the depth of the tree, not with its size.
+        """
         if self.asset_type not in ASSET_TYPES_WITH_CHILDREN:
             # It's impossible for us to have descendants. Move along...
             return
-        children = list(self.children.only('pk', 'owner', 'parent'))
-        if not children:
-            return
-        effective_perms = self._get_effective_perms(include_calculated=False)
-        for child in children:
+        parents = {self.pk: self}
+        effective_perms_by_parent = {
+            self.pk: self._get_effective_perms(include_calculated=False)
+        }
+        affected_asset_ids = set()
+        affected_user_ids = set()
+        while parents:
+            children = list(
+                type(self).objects.filter(parent_id__in=parents.keys()).only(
+                    'pk', 'owner', 'parent', 'asset_type'
+                )
+            )
+            if not children:
+                break
+            children_ids = [child.pk for child in children]
+            affected_asset_ids.update(children_ids)
             # remove stale inherited perms
-            child.permissions.filter(inherited=True).delete()
+            ObjectPermission.objects.filter(
+                asset_id__in=children_ids, inherited=True
+            ).delete()
             # calc the new ones
-            child._recalculate_inherited_perms(
-                parent_effective_perms=effective_perms,
-                stale_already_deleted=True,
-                #return_instead_of_creating=True
+            new_permissions = []
+            code_names = get_cached_code_names(type(self))
+            for child in children:
+                # Avoid fetching the parent again
+                child.parent = parents[child.parent_id]
+                new_permissions += child._recalculate_inherited_perms(
+                    parent_effective_perms=effective_perms_by_parent[
+                        child.parent_id
+                    ],
+                    stale_already_deleted=True,
+                    return_instead_of_creating=True,
+                    code_names=code_names,
+                )
+            ObjectPermission.objects.bulk_create(new_permissions)
+            affected_user_ids.update(p.user_id for p in new_permissions)
+            # descend!
+            parents = {
+                child.pk: child
+                for child in children
+                if child.asset_type in ASSET_TYPES_WITH_CHILDREN
+            }
+            effective_perms_by_parent = self._get_effective_perms_in_bulk(
+                parents, new_permissions
             )
-            # recurse!
-            child.recalculate_descendants_perms()
+
+        # `bulk_create()` does not send any signals
+        PermissionCache.invalidate_many(
+            asset_ids=affected_asset_ids, user_ids=affected_user_ids
+        )
+
+    @staticmethod
+    def _get_effective_perms_in_bulk(objects, inherited_permissions):
+        """
+        Work like `_get_effective_perms(include_calculated=False)` for each
+        object of `objects`, a dict of objects by pk, with one query for all
+        of them. Their inherited permissions are not read from the database
+        but taken from `inherited_permissions`, a list of (possibly unsaved)
+        `ObjectPermission`s.
+
+        Returns:
+            dict: {object pk: set of (User's pk, Permission's pk)}
+        """
+        if not objects:
+            return {}
+
+        grant_perms = defaultdict(set)
+        deny_perms = defaultdict(set)
+        records = ObjectPermission.objects.filter(
+            asset_id__in=objects.keys(), inherited=False
+        ).values_list('asset_id', 'user_id', 'permission_id', 'deny')
+        for object_id, user_id, permission_id, deny in records:
+            perms = deny_perms if deny else grant_perms
+            perms[object_id].add((user_id, permission_id))
+        for permission in inherited_permissions:
+            if permission.asset_id in objects:
+                grant_perms[permission.asset_id].add(
+                    (permission.user_id, permission.permission_id)
+                )
+
+        return {
+            pk: obj._filter_anonymous_perms(
+                grant_perms[pk].difference(deny_perms[pk])
+            )
+            for pk, obj in objects.items()
+        }
 
     def _recalculate_inherited_perms(
             self,
             parent_effective_perms=None,
             stale_already_deleted=False,
             return_instead_of_creating=False,
-            translate_perm={}  # mutable default parameter serves as cache
+            translate_perm={},  # mutable default parameter serves as cache
+            code_names=None,
     ):
         """
         Copy all of our parent's effective permissions to ourself,
         marking the copies as inherited permissions. The owner's rights are
         also made explicit as "inherited" permissions.
+
+        `code_names` can be passed to avoid fetching the permissions of our
+        content type again (see `get_cached_code_names()`).
         """
         # Start with a clean slate
         if not stale_already_deleted:
             self.permissions.filter(inherited=True).delete()
-        content_type = ContentType.objects.get_for_model(self)
         if return_instead_of_creating:
             # Conditionally create this so that Python will raise an exception
             # if we use it when we're not supposed to
             objects_to_return = []
         # The owner gets every assignable permission
-        if self.owner is not None:
-            for perm in Permission.objects.filter(
-                content_type=content_type,
-                codename__in=self.get_assignable_permissions(
-                    with_partial=False,
-                ),
+        if self.owner_id is not None:
+            if code_names is None:
+                code_names = get_cached_code_names(type(self))
+            for codename in self.get_assignable_permissions(
+                with_partial=False
             ):
+                if codename not in code_names:
+                    continue
+                perm_id = code_names[codename]['id']
                 new_permission = ObjectPermission()
                 new_permission.asset = self
                 # `user_id` instead of `user` is another workaround for
                 # migrations
                 new_permission.user_id = self.owner_id
-                new_permission.permission = perm
+                new_permission.permission_id = perm_id
                 new_permission.inherited = True
                 new_permission.uid = new_permission._meta.get_field(
                     'uid').generate_uid()
@@ -686,21 +777,27 @@ class ObjectPermissionMixin:
                 ]
             }
         """
-        records = ObjectPermission.objects. \
-            filter(asset_id=object_id). \
-            values('user_id',
-                   'permission_id',
-                   'permission__codename',
-                   'deny')
-        object_permissions_per_user = defaultdict(list)
-        for record in records:
-            object_permissions_per_user[record['user_id']].append((
-                record['permission_id'],
-                record['permission__codename'],
-                record['deny'],
-            ))
-
-        return object_permissions_per_user
+        def _get_object_permissions_per_user():
+            records = ObjectPermission.objects. \
+                filter(asset_id=object_id). \
+                values('user_id',
+                       'permission_id',
+                       'permission__codename',
+                       'deny')
+            object_permissions_per_user = defaultdict(list)
+            for record in records:
+                object_permissions_per_user[record['user_id']].append((
+                    record['permission_id'],
+                    record['permission__codename'],
+                    record['deny'],
+                ))
+
+            return object_permissions_per_user
+
+        # Also share them between requests
+        return PermissionCache.get_or_set_for_asset(
+            object_id, 'object_permissions', _get_object_permissions_per_user
+        )
 
     @staticmethod
     @cache_for_request
@@ -736,18 +833,24 @@ class ObjectPermissionMixin:
                 ]
             }
         """
-        records = ObjectPermission.objects.filter(user=user_id).values(
-            'asset_id', 'permission_id', 'permission__codename', 'deny'
+        def _get_object_permissions_per_object():
+            records = ObjectPermission.objects.filter(user=user_id).values(
+                'asset_id', 'permission_id', 'permission__codename', 'deny'
+            )
+            object_permissions_per_object = defaultdict(list)
+            for record in records:
+                object_permissions_per_object[record['asset_id']].append((
+                    record['permission_id'],
+                    record['permission__codename'],
+                    record['deny'],
+                ))
+
+            return object_permissions_per_object
+
+        # Also share them between requests
+        return PermissionCache.get_or_set_for_user(
+            user_id, 'object_permissions', _get_object_permissions_per_object
         )
-        object_permissions_per_object = defaultdict(list)
-        for record in records:
-            object_permissions_per_object[record['asset_id']].append((
-                record['permission_id'],
-                record['permission__codename'],
-                record['deny'],
-            ))
-
-        return object_permissions_per_object
 
     def __get_object_permissions(self, deny, user=None, codename=None):
         """
@@ -2,6 +2,7 @@
 from .asset import Asset
 from .asset import UserAssetSubscription
 from .asset_export_settings import AssetExportSettings
+from .asset_report import AssetReport
 from .asset_version import AssetVersion
 from .asset_file import AssetFile
 from .asset_snapshot import AssetSnapshot
@@ -62,8 +62,13 @@ from kpi.mixins import (
 from kpi.models.asset_file import AssetFile
 from kpi.models.asset_snapshot import AssetSnapshot
 from kpi.utils.asset_content_analyzer import AssetContentAnalyzer
+from kpi.utils.asset_search import (
+    get_search_text,
+    get_search_text_tag_names,
+)
 from kpi.utils.mongo_helper import MongoHelper
 from kpi.utils.object_permission import get_cached_code_names
+from kpi.utils.permission_cache import PermissionCache
 from kpi.utils.sluggify import sluggify_label
 from .asset_user_partial_permission import AssetUserPartialPermission
 from .asset_version import AssetVersion
@@ -179,6 +184,16 @@ class Asset(ObjectPermissionMixin,
     #   }
     # }
     paired_data = LazyDefaultJSONBField(default=dict)
+    # Text which search terms without a specified field are looked up in.
+    # Refreshed by `save()` and `update_search_text()`. `UPPER(search_text)`
+    # is indexed with trigrams, which supports `search_text__icontains` on
+    # PostgreSQL. Django 2.2 cannot declare indexes on expressions, see
+    # `0043_index_upper_search_text_of_asset` instead
+    search_text = models.TextField(default='', blank=True)
+    # Fields `search_text` is built from, besides tags
+    SEARCH_TEXT_FIELDS = frozenset(
+        ('name', 'uid', 'owner', 'owner_id', 'settings', 'summary')
+    )
 
     objects = AssetManager()
 
@@ -573,8 +588,12 @@ class Asset(ObjectPermissionMixin,
         If user doesn't have any partial permissions, it returns `None`.
         """
 
-        perms = self.asset_partial_permissions.filter(user_id=user_id)\
-            .values_list("permissions", flat=True).first()
+        perms = PermissionCache.get_or_set_for_asset(
+            self.pk,
+            f'partial_permissions:{user_id}',
+            lambda: self.asset_partial_permissions.filter(user_id=user_id)
+            .values_list("permissions", flat=True).first(),
+        )
 
         if perms:
             if with_filters:
@@ -626,7 +645,7 @@ class Asset(ObjectPermissionMixin,
         queryset = queryset.defer(
             # Avoid pulling these from the database because they are often huge
             # and we don't need them for list views.
-            'content', 'report_styles'
+            'content', 'report_styles', 'search_text'
         ).select_related(
             # We only need `username`, but `select_related('owner__username')`
             # actually pulled in the entire `auth_user` table under Django 1.8.
@@ -690,6 +709,7 @@ class Asset(ObjectPermissionMixin,
             # so long as all of the operations in this overridden `save()`
             # method pertain to content, bail out if it's impossible for this
             # asset to have content in the first place
+            update_fields = self._populate_search_text(is_new, update_fields)
             super().save(
                 force_insert=force_insert,
                 force_update=force_update,
@@ -737,6 +757,8 @@ class Asset(ObjectPermissionMixin,
                 self._deployment_data.pop('_stored_data_key', None)
                 self.__copy_hidden_fields()
 
+        update_fields = self._populate_search_text(is_new, update_fields)
+
         super().save(
             force_insert=force_insert,
             force_update=force_update,
@@ -796,6 +818,59 @@ class Asset(ObjectPermissionMixin,
         intended_tags = value.split(',')
         self.tags.set(*intended_tags)
 
+    def update_search_text(self, tag_names=None):
+        """
+        Refresh `search_text` with the current values of the asset, without
+        calling `save()`, e.g. when its tags change. `tag_names` are queried
+        if they are not passed
+        """
+        search_text = self._get_search_text(tag_names)
+        if search_text != self.search_text:
+            Asset.objects.filter(pk=self.pk).update(search_text=search_text)
+            self.search_text = search_text
+
+    def _get_search_text(self, tag_names=None):
+        owner_username = self.owner.username if self.owner_id else None
+        if tag_names is None:
+            tag_names = self.tags.names()
+        return get_search_text(
+            self.name,
+            self.uid,
+            owner_username,
+            self.settings,
+            self.summary,
+            tag_names,
+        )
+
+    def _populate_search_text(self, is_new, update_fields=None):
+        """
+        Refresh `search_text` right before saving, so that it is written by
+        the same query as the other fields. Return `update_fields`, which
+        includes `search_text` if it lists any field `search_text` is built
+        from
+        """
+        if update_fields is not None:
+            if not self.SEARCH_TEXT_FIELDS.intersection(update_fields):
+                return update_fields
+            update_fields = [*update_fields, 'search_text']
+
+        if not self.uid:
+            # Otherwise, the uid would only be generated by
+            # `KpiUidField.pre_save()`
+            self.uid = self._meta.get_field('uid').generate_uid()
+
+        if is_new:
+            # New assets cannot have tags yet
+            tag_names = []
+        elif 'search_text' in self.get_deferred_fields():
+            tag_names = None
+        else:
+            # Keep the stored tags, `update_search_text()` refreshes them
+            # whenever they change
+            tag_names = get_search_text_tag_names(self.search_text)
+        self.search_text = self._get_search_text(tag_names)
+        return update_fields
+
     def to_clone_dict(
             self,
             version: Union[str, AssetVersion] = None
@@ -91,6 +91,9 @@ class AssetFile(models.Model, AbstractFormMedia):
         ),
     }
 
+    # Suffix of the index stored next to the XML of paired data
+    INDEX_FILE_SUFFIX = '.index'
+
     uid = KpiUidField(uid_prefix='af')
     asset = models.ForeignKey('Asset', related_name='asset_files',
                               on_delete=models.CASCADE)
@@ -123,6 +126,7 @@ class AssetFile(models.Model, AbstractFormMedia):
         # is anything else than 'form_media'
         if force or self.file_type != self.FORM_MEDIA:
             if not self.is_remote_url:
+                self.delete_index()
                 self.content.delete(save=False)
             return super().delete(using=using, keep_parents=keep_parents)
 
@@ -131,6 +135,14 @@ class AssetFile(models.Model, AbstractFormMedia):
         self.synced_with_backend = False
         self.save(update_fields=['date_deleted', 'synced_with_backend'])
 
+    def delete_index(self):
+        """
+        Delete the index stored next to the XML of paired data, if any (see
+        `PairedDataViewset.external()`)
+        """
+        if self.file_type == self.PAIRED_DATA and self.content:
+            self.content.storage.delete(self.index_file_name)
+
     @property
     def deleted_at(self):
         """
@@ -179,6 +191,10 @@ class AssetFile(models.Model, AbstractFormMedia):
 
         return self.metadata['hash']
 
+    @property
+    def index_file_name(self):
+        return f'{self.content.name}{self.INDEX_FILE_SUFFIX}'
+
     @property
     def is_remote_url(self):
         """
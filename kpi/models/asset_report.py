@@ -0,0 +1,24 @@
+# coding: utf-8
+from django.contrib.postgres.fields import JSONField as JSONBField
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+
+
+class AssetReport(models.Model):
+    """
+    Statistics of the submissions of an asset, precomputed by
+    `kobo.apps.reports.report_store.ReportStore` and shared by every process
+    """
+    asset = models.ForeignKey('Asset', related_name='stored_reports',
+                              on_delete=models.CASCADE)
+    params_hash = models.CharField(max_length=32)
+    watermark = JSONBField(default=list)
+    stats = JSONBField(default=list, encoder=DjangoJSONEncoder)
+    # Metrics `stats` are computed from, to which new submissions are added.
+    # `None` for reports split by a question
+    metrics = JSONBField(null=True, encoder=DjangoJSONEncoder)
+    date_modified = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('asset', 'params_hash')
@@ -1,8 +1,10 @@
 # coding: utf-8
 import base64
 import datetime
+import json
 import posixpath
 import re
+import shutil
 import tempfile
 from collections import defaultdict
 from io import BytesIO
@@ -33,10 +35,21 @@ from kpi.constants import (
     ASSET_TYPE_EMPTY,
     ASSET_TYPE_SURVEY,
     ASSET_TYPE_TEMPLATE,
+    EXPORT_SETTING_INCREMENTAL,
     PERM_CHANGE_ASSET,
     PERM_VIEW_SUBMISSIONS,
     PERM_PARTIAL_SUBMISSIONS,
 )
+from kpi.utils.incremental_export import (
+    FINGERPRINT_FIELDS,
+    ExportChunkRecorder,
+    ExportChunkWriter,
+    diff_submissions,
+    get_fingerprint,
+    merge_sorted_chunks,
+    read_chunks,
+    read_index,
+)
 from kpi.utils.log import logging
 from kpi.utils.strings import to_str
 from kpi.utils.rename_xls_sheet import (
@@ -423,6 +436,11 @@ class ExportTask(ImportExportTask):
              | 123                             |
 
         The default is `['hxl']`
+    * `incremental`: optional; defaults to `False`. When `True`, `csv` and
+                     `geojson` exports reuse the result of the latest
+                     incremental export made by the same user, with the same
+                     options, and only render the submissions which have been
+                     added or edited since then
     """
 
     uid = KpiUidField(uid_prefix='e')
@@ -452,6 +470,18 @@ class ExportTask(ImportExportTask):
     }
 
     TIMESTAMP_KEY = '_submission_time'
+
+    INCREMENTAL_EXPORT_TYPES = ('csv', 'geojson')
+    # Options which do not alter the content of the export
+    INCREMENTAL_IGNORED_DATA_KEYS = ('name', 'processing_time_seconds')
+    # Above this number of edited submissions, rendering the whole export is
+    # cheaper than querying the edited submissions by id
+    INCREMENTAL_MAX_CHANGED_SUBMISSIONS = 50000
+    INDEX_FILE_SUFFIX = '.index'
+    SHARDABLE_EXPORT_TYPES = ('csv', 'geojson')
+    # S3 multipart uploads require parts of at least 5 MiB
+    XLSX_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+
     # Above 244 seems to cause 'Download error' in Chrome 64/Linux
     MAXIMUM_FILENAME_LENGTH = 240
 
@@ -466,6 +496,14 @@ class ExportTask(ImportExportTask):
             return hierarchy_in_labels.lower() == 'true'
         return hierarchy_in_labels
 
+    @property
+    def _incremental(self):
+        incremental = self.data.get(EXPORT_SETTING_INCREMENTAL, False)
+        # v1 exports expects a string
+        if isinstance(incremental, str):
+            return incremental.lower() == 'true'
+        return incremental
+
     @property
     def _fields_from_all_versions(self):
         fields_from_versions = self.data.get('fields_from_all_versions', True)
@@ -582,47 +620,63 @@ class ExportTask(ImportExportTask):
         `PrivateFileField`. Should be called by the `run()` method of the
         superclass. The `submission_stream` method is provided for testing
         """
-        source_url = self.data.get('source', False)
-        fields = self.data.get('fields', [])
+        source_url, source, export_type = self._validate_export()
+        fields = self._get_fields()
         flatten = self.data.get('flatten', True)
-
-        if not source_url:
-            raise Exception('no source specified for the export')
-        source = _resolve_url_to_asset(source_url)
-        source_perms = source.get_perms(self.user)
-
-        if (PERM_VIEW_SUBMISSIONS not in source_perms and
-                PERM_PARTIAL_SUBMISSIONS not in source_perms):
-            # Unsure if DRF exceptions make sense here since we're not
-            # returning a HTTP response
-            raise exceptions.PermissionDenied(
-                '{user} cannot export {source}'.format(
-                    user=self.user, source=source)
-            )
-
-        if not source.has_deployment:
-            raise Exception('the source must be deployed prior to export')
-
-        export_type = self.data.get('type', '').lower()
-        if export_type not in ('xls', 'csv', 'geojson', 'spss_labels'):
-            raise NotImplementedError(
-                'only `xls`, `csv`, `geojson`, and `spss_labels` '
-                'are valid export types'
-            )
+        shard_results = getattr(self, '_shard_results', None)
 
         # Take this opportunity to do some housekeeping
         self.log_and_mark_stuck_as_errored(self.user, source_url)
 
-        # Include the group name in `fields` for Mongo to correctly filter
-        # for repeat groups
-        if fields:
-            field_groups = set(f.split('/')[0] for f in fields if '/' in f)
-            fields += list(field_groups)
-
-        submission_stream = source.deployment.get_submissions(
-            user=self.user,
-            fields=fields
+        submission_params = {'user': self.user, 'fields': fields}
+        incremental = (
+            self._incremental and export_type in self.INCREMENTAL_EXPORT_TYPES
         )
+        previous_export = None
+        # Chunks of `previous_export` which can be reused as is
+        kept_chunk_file = None
+
+        if incremental:
+            # Render submissions in a stable order to let the next incremental
+            # exports merge them
+            submission_params['sort'] = {'_id': 1}
+            if fields:
+                submission_params['fields'] = [
+                    *fields, '_id', *FINGERPRINT_FIELDS
+                ]
+            schema = list(
+                source.deployed_versions.values_list('uid', flat=True)
+            )
+            previous_export = self._get_previous_incremental_export(
+                source_url, schema
+            )
+
+        if previous_export:
+            kept_chunk_file = tempfile.TemporaryFile()
+            changed_ids, max_previous_id = self._diff_with_previous_export(
+                source, previous_export, kept_chunk_file
+            )
+            if (
+                max_previous_id is None
+                or len(changed_ids) > self.INCREMENTAL_MAX_CHANGED_SUBMISSIONS
+            ):
+                kept_chunk_file.close()
+                kept_chunk_file = previous_export = None
+            else:
+                submission_params['query'] = {
+                    '$or': [
+                        {'_id': {'$in': changed_ids}},
+                        {'_id': {'$gt': max_previous_id}},
+                    ]
+                }
+
+        if shard_results is not None:
+            # Submissions have already been rendered by `run_shard()`
+            submission_stream = []
+        else:
+            submission_stream = source.deployment.get_submissions(
+                **submission_params
+            )
 
         pack, submission_stream = build_formpack(
             source, submission_stream, self._fields_from_all_versions)
@@ -643,14 +697,24 @@ class ExportTask(ImportExportTask):
         self.result.file.close()
 
         with self.result.storage.open(self.result.name, 'wb') as output_file:
-            if export_type == 'csv':
-                for line in export.to_csv(submission_stream):
-                    output_file.write((line + "\r\n").encode('utf-8'))
-            elif export_type == 'geojson':
-                for line in export.to_geojson(
-                    submission_stream, flatten=flatten
+            if shard_results is not None:
+                self._stitch_shards(export_type, output_file, shard_results)
+            elif incremental:
+                self._write_incremental_export(
+                    export,
+                    export_type,
+                    submission_stream,
+                    output_file,
+                    flatten,
+                    schema,
+                    previous_export,
+                    kept_chunk_file,
+                )
+            elif export_type in ('csv', 'geojson'):
+                for data in self._get_export_lines(
+                    export, export_type, submission_stream, flatten
                 ):
-                    output_file.write(line.encode('utf-8'))
+                    output_file.write(data)
             elif export_type == 'xls':
                 # XLSX export actually requires a filename (limitation of
                 # pyexcelerate?)
@@ -658,23 +722,22 @@ class ExportTask(ImportExportTask):
                         prefix='export_xlsx', mode='rb'
                 ) as xlsx_output_file:
                     export.to_xlsx(xlsx_output_file.name, submission_stream)
-                    # TODO: chunk again once
-                    # https://github.com/jschneier/django-storages/issues/449
-                    # is fixed
-                    # TODO: Check if monkey-patch (line 57) can restore writing
-                    # by chunk
-                    """
-                    while True:
-                        chunk = xlsx_output_file.read(5 * 1024 * 1024)
-                        if chunk:
-                            output_file.write(chunk)
-                        else:
-                            break
-                    """
-                    output_file.write(xlsx_output_file.read())
+                    # Copy by chunks to keep memory usage constant, whatever
+                    # the size of the workbook. S3 storage uploads each chunk
+                    # as a part of a multipart upload, which relies on the
+                    # accurate `tell()` of the django-storages fork we pin
+                    # (see https://github.com/jschneier/django-storages/issues/566)
+                    shutil.copyfileobj(
+                        xlsx_output_file,
+                        output_file,
+                        self.XLSX_UPLOAD_CHUNK_SIZE,
+                    )
             elif export_type == 'spss_labels':
                 export.to_spss_labels(output_file)
 
+        if kept_chunk_file:
+            kept_chunk_file.close()
+
         # Restore the FileField to its typical state
         self.result.open('rb')
         self.save(update_fields=['last_submission_time'])
@@ -683,6 +746,384 @@ class ExportTask(ImportExportTask):
         # exports in excess of the per-user, per-form limit
         self.remove_excess(self.user, source_url)
 
+    def get_shard_ranges(self) -> list:
+        """
+        Return a list of `(min_id, max_id)` tuples which split the submissions
+        to export in `settings.EXPORT_SHARDS` ranges of roughly the same size.
+        `min_id` is inclusive, `max_id` is exclusive and `None` means
+        unbounded. Each range can be rendered by `run_shard()` in parallel.
+
+        Return an empty list if the export should not be sharded.
+        """
+        export_type = self.data.get('type', '').lower()
+        shard_count = settings.EXPORT_SHARDS
+        if (
+            shard_count < 2
+            or export_type not in self.SHARDABLE_EXPORT_TYPES
+            or self._incremental
+        ):
+            return []
+
+        _, source, _ = self._validate_export()
+        count = source.deployment.calculated_submission_count(self.user)
+        if count < settings.EXPORT_SHARDING_THRESHOLD:
+            return []
+
+        # Use the `_id` of the first submission of each shard as boundaries
+        boundaries = [None]
+        for shard_index in range(1, shard_count):
+            submissions = source.deployment.get_submissions(
+                user=self.user,
+                fields=['_id'],
+                sort={'_id': 1},
+                start=count * shard_index // shard_count,
+                limit=1,
+            )
+            boundaries.extend(submission['_id'] for submission in submissions)
+        boundaries.append(None)
+
+        return list(zip(boundaries[:-1], boundaries[1:]))
+
+    def run_shard(self, shard_index, min_id=None, max_id=None) -> dict:
+        """
+        Render the submissions whose `_id` is within `[min_id, max_id)` to a
+        temporary file, along with the index of its chunks (see
+        `ExportChunkRecorder`).
+
+        Return a dictionary to be passed to `stitch_shards()`.
+        """
+        _, source, export_type = self._validate_export()
+        flatten = self.data.get('flatten', True)
+        id_range = {}
+        if min_id is not None:
+            id_range['$gte'] = min_id
+        if max_id is not None:
+            id_range['$lt'] = max_id
+
+        fields = self._get_fields()
+        if fields:
+            # `ExportChunkRecorder` needs `_id` to index the chunks
+            fields.append('_id')
+
+        submission_stream = source.deployment.get_submissions(
+            user=self.user,
+            fields=fields,
+            sort={'_id': 1},
+            query={'_id': id_range} if id_range else {},
+        )
+        pack, submission_stream = build_formpack(
+            source, submission_stream, self._fields_from_all_versions)
+        submission_stream = self._record_last_submission_time(
+            submission_stream)
+        export = pack.export(**self._build_export_options(pack))
+
+        storage = self.result.storage
+        shard_name = storage.save(
+            self._get_shard_name(shard_index), ContentFile('')
+        )
+        with tempfile.TemporaryFile() as chunk_file:
+            with storage.open(shard_name, 'wb') as shard_file:
+                recorder = ExportChunkRecorder(shard_file, chunk_file)
+                for data in self._get_export_lines(
+                    export, export_type, recorder.wrap(submission_stream), flatten
+                ):
+                    recorder.write(data)
+
+            chunk_file.seek(0)
+            with storage.open(
+                f'{shard_name}{self.INDEX_FILE_SUFFIX}', 'wb'
+            ) as index_file:
+                shutil.copyfileobj(chunk_file, index_file)
+
+        last_submission_time = None
+        if self.last_submission_time:
+            last_submission_time = self.last_submission_time.isoformat()
+
+        return {
+            'name': shard_name,
+            'header_length': recorder.header_length,
+            'footer_offset': recorder.footer_offset,
+            'last_submission_time': last_submission_time,
+        }
+
+    def stitch_shards(self, shard_results: list):
+        """
+        Run the export by concatenating the files rendered by `run_shard()`
+        instead of reading the submissions again
+        """
+        self._shard_results = shard_results
+        self.run()
+
+    def abort_shards(self, error: Exception):
+        """
+        Mark the export as failed and remove the files rendered by shards which
+        succeeded
+        """
+        self.messages.update({
+            'error_type': type(error).__name__,
+            'error': str(error),
+        })
+        self.status = self.ERROR
+        self.save(update_fields=['status', 'messages'])
+        self._delete_shard_files()
+
+    def _diff_with_previous_export(
+        self, source, previous_export, kept_chunk_file
+    ):
+        """
+        Compare the submissions currently accessible to `self.user` with the
+        ones rendered in `previous_export`, reading only the attributes needed
+        to compute their fingerprints. See `diff_submissions()`
+        """
+        current_fingerprints = (
+            (submission['_id'], get_fingerprint(submission))
+            for submission in source.deployment.get_submissions(
+                user=self.user,
+                fields=['_id', *FINGERPRINT_FIELDS],
+                sort={'_id': 1},
+            )
+        )
+        with self.result.storage.open(
+            previous_export.index_file_name, 'rb'
+        ) as index_file:
+            _, previous_chunks = read_index(index_file)
+            return diff_submissions(
+                previous_chunks, current_fingerprints, kept_chunk_file
+            )
+
+    def _delete_shard_files(self):
+        storage = self.result.storage
+        shard_prefix = self._get_shard_name('')
+        shard_dir, shard_file_prefix = posixpath.split(shard_prefix)
+        try:
+            _, file_names = storage.listdir(shard_dir)
+        except FileNotFoundError:
+            return
+        for file_name in file_names:
+            if file_name.startswith(shard_file_prefix):
+                storage.delete(posixpath.join(shard_dir, file_name))
+
+    @staticmethod
+    def _get_export_lines(export, export_type, submission_stream, flatten):
+        """
+        Internal generator that yields the encoded lines of a `csv` or
+        `geojson` export
+        """
+        if export_type == 'csv':
+            for line in export.to_csv(submission_stream):
+                yield (line + "\r\n").encode('utf-8')
+        elif export_type == 'geojson':
+            for line in export.to_geojson(submission_stream, flatten=flatten):
+                yield line.encode('utf-8')
+
+    def _get_fields(self):
+        fields = list(self.data.get('fields', []))
+        # Include the group name in `fields` for Mongo to correctly filter
+        # for repeat groups
+        if fields:
+            field_groups = set(f.split('/')[0] for f in fields if '/' in f)
+            fields += list(field_groups)
+        return fields
+
+    def _get_previous_incremental_export(self, source_url, schema):
+        """
+        Return the most recent complete export of `source_url` made by
+        `self.user` with the same options, against the same deployed versions,
+        whose result can be merged with new submissions. Return `None` if
+        there is none.
+        """
+        previous_exports = (
+            self._meta.model.objects.filter(
+                user=self.user,
+                data__source=source_url,
+                status=self.COMPLETE,
+            )
+            .exclude(pk=self.pk)
+            .order_by('-date_created')
+        )
+        comparable_data = self._get_comparable_data(self.data)
+        storage = self.result.storage
+        for previous_export in previous_exports:
+            if (
+                not previous_export.result
+                or self._get_comparable_data(previous_export.data)
+                != comparable_data
+                or not storage.exists(previous_export.index_file_name)
+            ):
+                continue
+
+            with storage.open(previous_export.index_file_name, 'rb') as f:
+                metadata, _ = read_index(f)
+            if metadata.get('schema') == schema:
+                return previous_export
+
+        return None
+
+    @classmethod
+    def _get_comparable_data(cls, data):
+        return {
+            key: value
+            for key, value in data.items()
+            if key not in cls.INCREMENTAL_IGNORED_DATA_KEYS
+        }
+
+    def _get_shard_name(self, shard_index):
+        return export_upload_to(self, f'{self.uid}_shard_{shard_index}')
+
+    def _stitch_shards(self, export_type, output_file, shard_results):
+        """
+        Concatenate the chunks of the files rendered by `run_shard()`, keeping
+        the header of the first one and the footer of the last one
+        """
+        storage = self.result.storage
+        first_shard = shard_results[0]
+        with storage.open(first_shard['name'], 'rb') as shard_file:
+            header = shard_file.read(first_shard['header_length'])
+        output_file.write(header)
+        writer = ExportChunkWriter(
+            export_type,
+            output_file,
+            offset=first_shard['header_length'],
+            header=header,
+        )
+
+        for shard_index, shard in enumerate(shard_results):
+            shard_name = shard['name']
+            index_name = f'{shard_name}{self.INDEX_FILE_SUFFIX}'
+            with storage.open(shard_name, 'rb') as shard_file, storage.open(
+                index_name, 'rb'
+            ) as index_file:
+                for chunk in read_chunks(index_file):
+                    writer.write(shard_file, chunk)
+                if shard_index == len(shard_results) - 1:
+                    shard_file.seek(shard['footer_offset'])
+                    shutil.copyfileobj(shard_file, output_file)
+
+            if shard['last_submission_time']:
+                last_submission_time = dateutil.parser.parse(
+                    shard['last_submission_time']
+                )
+                if (
+                    self.last_submission_time is None
+                    or last_submission_time > self.last_submission_time
+                ):
+                    self.last_submission_time = last_submission_time
+
+        self._delete_shard_files()
+
+    def _validate_export(self):
+        """
+        Return a tuple of the source URL, the source asset and the type of the
+        export. Raise an exception if the export cannot be run.
+        """
+        source_url = self.data.get('source', False)
+        if not source_url:
+            raise Exception('no source specified for the export')
+        source = _resolve_url_to_asset(source_url)
+        source_perms = source.get_perms(self.user)
+
+        if (PERM_VIEW_SUBMISSIONS not in source_perms and
+                PERM_PARTIAL_SUBMISSIONS not in source_perms):
+            # Unsure if DRF exceptions make sense here since we're not
+            # returning a HTTP response
+            raise exceptions.PermissionDenied(
+                '{user} cannot export {source}'.format(
+                    user=self.user, source=source)
+            )
+
+        if not source.has_deployment:
+            raise Exception('the source must be deployed prior to export')
+
+        export_type = self.data.get('type', '').lower()
+        if export_type not in ('xls', 'csv', 'geojson', 'spss_labels'):
+            raise NotImplementedError(
+                'only `xls`, `csv`, `geojson`, and `spss_labels` '
+                'are valid export types'
+            )
+
+        return source_url, source, export_type
+
+    def _write_incremental_export(
+        self,
+        export,
+        export_type,
+        submission_stream,
+        output_file,
+        flatten,
+        schema,
+        previous_export=None,
+        kept_chunk_file=None,
+    ):
+        """
+        Render `submission_stream` and record which bytes of the result belong
+        to which submission in an index stored next to `self.result`. When
+        `previous_export` is provided, `submission_stream` must contain only
+        the new and edited submissions; they are merged, in `_id` order, with
+        the chunks of `previous_export` listed in `kept_chunk_file`
+        """
+        storage = self.result.storage
+        metadata = json.dumps({'schema': schema}).encode() + b'\n'
+
+        with tempfile.TemporaryFile() as chunk_file, storage.open(
+            self.index_file_name, 'wb'
+        ) as index_file:
+            index_file.write(metadata)
+
+            if previous_export is None:
+                # Nothing to merge with, render straight to the result
+                recorder = ExportChunkRecorder(output_file, chunk_file)
+                for data in self._get_export_lines(
+                    export, export_type, recorder.wrap(submission_stream), flatten
+                ):
+                    recorder.write(data)
+                chunk_file.seek(0)
+                shutil.copyfileobj(chunk_file, index_file)
+                return
+
+            with tempfile.TemporaryFile() as new_file, storage.open(
+                previous_export.result.name, 'rb'
+            ) as previous_file:
+                recorder = ExportChunkRecorder(new_file, chunk_file)
+                for data in self._get_export_lines(
+                    export, export_type, recorder.wrap(submission_stream), flatten
+                ):
+                    recorder.write(data)
+
+                new_file.seek(0)
+                header = new_file.read(recorder.header_length)
+                output_file.write(header)
+                chunk_file.seek(0)
+                kept_chunk_file.seek(0)
+                merged_chunks = merge_sorted_chunks(
+                    read_chunks(kept_chunk_file), read_chunks(chunk_file)
+                )
+                writer = ExportChunkWriter(
+                    export_type,
+                    output_file,
+                    offset=recorder.header_length,
+                    chunk_file=index_file,
+                    header=header,
+                )
+                for is_new, chunk in merged_chunks:
+                    writer.write(new_file if is_new else previous_file, chunk)
+
+                new_file.seek(recorder.footer_offset)
+                shutil.copyfileobj(new_file, output_file)
+
+        if (
+            previous_export.last_submission_time
+            and (
+                self.last_submission_time is None
+                or previous_export.last_submission_time
+                > self.last_submission_time
+            )
+        ):
+            self.last_submission_time = previous_export.last_submission_time
+
+    @property
+    def index_file_name(self):
+        return f'{self.result.name}{self.INDEX_FILE_SUFFIX}'
+
     @classmethod
     @transaction.atomic
     def log_and_mark_stuck_as_errored(cls, user, source):
@@ -740,7 +1181,9 @@ class ExportTask(ImportExportTask):
             export.delete()
 
     def delete(self, *args, **kwargs):
-        # removing exported file from storage
+        # removing exported file (and its incremental index) from storage
+        if self.result:
+            self.result.storage.delete(self.index_file_name)
         self.result.delete(save=False)
         super().delete(*args, **kwargs)
 
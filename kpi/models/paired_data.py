@@ -269,6 +269,7 @@ class PairedData(OpenRosaManifestInterface,
         # We delete the content of `self.asset_file` to force its regeneration
         # when the 'xml_endpoint' is called
         if self.asset_file and self.asset_file.content:
+            self.asset_file.delete_index()
             self.asset_file.content.delete()
 
     def update(self, updated_values):
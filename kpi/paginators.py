@@ -1,15 +1,26 @@
 # coding: utf-8
+import base64
+import json
 from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
 
+from bson import json_util
+from bson.decimal128 import Decimal128
 from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import ugettext as _
 from django_request_cache import cache_for_request
 from rest_framework.pagination import (
     LimitOffsetPagination,
     PageNumberPagination,
+    _positive_int as positive_int,
 )
 from rest_framework.response import Response
 from rest_framework.reverse import reverse_lazy
-from rest_framework.serializers import SerializerMethodField
+from rest_framework.serializers import SerializerMethodField, ValidationError
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class DataPagination(LimitOffsetPagination):
@@ -21,6 +32,231 @@ class DataPagination(LimitOffsetPagination):
     max_limit = settings.SUBMISSION_LIST_LIMIT
 
 
+class DataCursorPagination:
+    """
+    Keyset pagination for submissions. Instead of skipping `start`
+    submissions, each page seeks directly past the last submission of the
+    previous one, thanks to an opaque token passed as the `cursor` query
+    parameter. It encodes the sort key and the values of that key and `_id`
+    for the last submission of the page.
+
+    Pass an empty `cursor` to get the first page. The total count of
+    submissions can be omitted with `skip_count=true`.
+    """
+    cursor_query_param = 'cursor'
+    skip_count_query_param = 'skip_count'
+    limit_query_param = 'limit'
+    default_sort = {'_id': 1}
+    # Aliases of the BSON types a submission can contain, in MongoDB
+    # comparison order. Null values are matched with `None` instead, which
+    # also matches missing values. Arrays are left out: they are compared by
+    # their elements
+    SORTED_TYPES = (
+        ('null',),
+        ('double', 'int', 'long', 'decimal'),
+        ('string',),
+        ('object',),
+        ('bool',),
+        ('date',),
+    )
+
+    def __init__(self):
+        self.count = None
+        self.has_next = False
+        self.last_submission = None
+        self.limit = None
+        self.request = None
+        self.sort_direction = None
+        self.sort_key = None
+
+    @classmethod
+    def is_requested(cls, request) -> bool:
+        return cls.cursor_query_param in request.query_params
+
+    def get_mongo_params(self, request, deployment, params: dict) -> dict:
+        """
+        Return a copy of `params`, the parameters to pass to
+        `deployment.get_submissions()`, narrowed down to the requested page
+        """
+        self.request = request
+        params = dict(params)
+        if 'start' in params:
+            raise ValidationError({
+                'start': _('This param cannot be used along with `cursor`.')
+            })
+
+        token = params.pop(self.cursor_query_param)
+        skip_count = (
+            str(params.pop(self.skip_count_query_param, '')).lower() == 'true'
+        )
+        self.limit = params['limit']
+        self.sort_key, self.sort_direction = self._get_sort(
+            self._load_json_param(params, 'sort')
+        )
+        query = self._load_json_param(params, 'query') or {}
+
+        if not skip_count:
+            self.count = deployment.calculated_submission_count(
+                request.user,
+                query=query,
+                submission_ids=params.get('submission_ids', []),
+            )
+
+        if token:
+            seek_query = self._get_seek_query(token)
+            query = (
+                {'$and': [query, seek_query]} if query else seek_query
+            )
+
+        params.update({
+            'query': query,
+            'sort': {self.sort_key: self.sort_direction},
+            # Fetch one more submission to know whether there is a next page
+            'limit': self.limit + 1,
+            'skip_count': True,
+        })
+        return params
+
+    def paginate_submissions(self, submissions) -> list:
+        page = list(submissions)
+        self.has_next = len(page) > self.limit
+        page = page[:self.limit]
+        if page:
+            self.last_submission = page[-1]
+        return page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        value = self.last_submission.get(self.sort_key)
+        token = base64.urlsafe_b64encode(
+            json_util.dumps({
+                'sort': [self.sort_key, self.sort_direction],
+                'value': value,
+                'id': self.last_submission['_id'],
+            }).encode()
+        ).decode()
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.skip_count_query_param)
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def _get_seek_query(self, token: str) -> dict:
+        try:
+            cursor = json.loads(
+                base64.urlsafe_b64decode(token.encode()),
+                object_hook=json_util.object_hook,
+            )
+            sort_key, sort_direction = cursor['sort']
+            value = cursor['value']
+            last_id = positive_int(cursor['id'])
+        except (ValueError, TypeError, KeyError):
+            raise ValidationError({self.cursor_query_param: _('Invalid cursor')})
+
+        if [sort_key, sort_direction] != [self.sort_key, self.sort_direction]:
+            raise ValidationError({
+                self.cursor_query_param: _(
+                    'Cursor does not match the requested `sort`'
+                )
+            })
+
+        operator = '$gt' if sort_direction == 1 else '$lt'
+        if sort_key == '_id':
+            return {'_id': {operator: last_id}}
+
+        after_value = self._get_after_value_queries(
+            sort_key, sort_direction, value
+        )
+        same_value = {sort_key: value, '_id': {operator: last_id}}
+        return {'$or': [*after_value, same_value]}
+
+    @classmethod
+    def _get_after_value_queries(
+        cls, sort_key: str, sort_direction: int, value
+    ) -> list:
+        """
+        Return the queries matching the values of `sort_key` which come after
+        `value` in `sort_direction`.
+
+        MongoDB compares values of different types by their BSON type (null
+        and missing values first, then numbers, strings, etc.) but range
+        operators only match values of the same type as their operand.
+        Values of the other types are thus matched with `$type`.
+        """
+        operator = '$gt' if sort_direction == 1 else '$lt'
+        queries = [] if value is None else [{sort_key: {operator: value}}]
+        type_position = cls._get_type_position(value)
+        if type_position is None:
+            return queries
+
+        if sort_direction == 1:
+            following_types = cls.SORTED_TYPES[type_position + 1:]
+        else:
+            following_types = cls.SORTED_TYPES[1:type_position]
+            if value is not None:
+                # Null and missing values come last in descending order
+                queries.append({sort_key: None})
+
+        queries.extend(
+            {sort_key: {'$type': type_alias}}
+            for type_aliases in following_types
+            for type_alias in type_aliases
+        )
+        return queries
+
+    @staticmethod
+    def _get_type_position(value) -> Optional[int]:
+        """
+        Return the position of the BSON type of `value` in
+        `DataCursorPagination.SORTED_TYPES`
+        """
+        if value is None:
+            return 0
+        # `bool` is a subclass of `int`, test it first
+        for position, python_types in (
+            (4, bool),
+            (1, (int, float, Decimal128)),
+            (2, str),
+            (3, dict),
+            (5, datetime),
+        ):
+            if isinstance(value, python_types):
+                return position
+        return None
+
+    def _get_sort(self, sort) -> tuple:
+        sort = sort or self.default_sort
+        if not isinstance(sort, dict) or len(sort) != 1:
+            raise ValidationError({
+                'sort': _('Only one sort key is supported along with `cursor`.')
+            })
+
+        sort_key, sort_direction = list(sort.items())[0]
+        try:
+            sort_direction = 1 if int(sort_direction) >= 0 else -1
+        except (ValueError, TypeError):
+            raise ValidationError({'sort': _('Sort direction must be 1 or -1.')})
+
+        return sort_key, sort_direction
+
+    @staticmethod
+    def _load_json_param(params: dict, name: str):
+        value = params.get(name)
+        if isinstance(value, str):
+            try:
+                value = json.loads(value, object_hook=json_util.object_hook)
+            except ValueError:
+                raise ValidationError({name: _('Value must be valid JSON.')})
+        return value
+
+
 class Paginated(LimitOffsetPagination):
     """ Adds 'root' to the wrapping response object. """
     root = SerializerMethodField('get_parent_url', read_only=True)
@@ -30,6 +266,86 @@ class Paginated(LimitOffsetPagination):
 
 
 class AssetPagination(Paginated):
+    """
+    Limit/offset pagination for assets, which also supports keyset
+    pagination when the `cursor` query parameter is passed (along with the
+    default ordering). Instead of skipping `offset` assets, each page then
+    seeks directly past the last asset of the previous one, thanks to an
+    opaque token which encodes its `date_modified` and `id`.
+
+    Pass an empty `cursor` to get the first page. The total count of assets
+    can be omitted with `skip_count=true`.
+    """
+    cursor_query_param = 'cursor'
+    skip_count_query_param = 'skip_count'
+    cursor_ordering = ('-date_modified', '-pk')
+
+    def __init__(self):
+        self.has_next = False
+        self.last_asset = None
+        self.use_cursor = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        if self._get_ordering(queryset) != ['-date_modified']:
+            raise ValidationError({
+                self.cursor_query_param: _(
+                    'This param can only be used with the default ordering.'
+                )
+            })
+
+        skip_count = (
+            request.query_params.get(self.skip_count_query_param, '').lower()
+            == 'true'
+        )
+        self.count = None if skip_count else self.get_count(queryset)
+
+        queryset = queryset.order_by(*self.cursor_ordering)
+        token = request.query_params[self.cursor_query_param]
+        if token:
+            date_modified, last_id = self._decode_cursor(token)
+            queryset = queryset.filter(
+                Q(date_modified__lt=date_modified)
+                | Q(date_modified=date_modified, pk__lt=last_id)
+            )
+
+        # Fetch one more asset to know whether there is a next page
+        page = list(queryset[:self.limit + 1])
+        self.has_next = len(page) > self.limit
+        page = page[:self.limit]
+        if page:
+            self.last_asset = page[-1]
+        return page
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+
+        if not self.has_next:
+            return None
+
+        token = base64.urlsafe_b64encode(
+            json.dumps({
+                'date_modified': self.last_asset.date_modified.isoformat(),
+                'id': self.last_asset.pk,
+            }).encode()
+        ).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def get_previous_link(self):
+        if self.use_cursor:
+            # Keyset pagination only goes forward
+            return None
+        return super().get_previous_link()
 
     def get_paginated_response(self, data, metadata):
 
@@ -52,20 +368,35 @@ class AssetPagination(Paginated):
         # it creates (left) joins on tables when queryset is interpreted
         # and it is way slower than running this extra query.
         #
-        # `AssetPagination.get_count()` and `AssetViewSet.get_serializer_context()`
-        # use the same query base. So use it here to retrieve `asset_ids`
-        # and cache them.
+        # Only used when the list is not paginated: `get_count()` and
+        # `AssetViewSet.get_serializer_context()` do not need every id.
         asset_ids = list(queryset.values_list('id', flat=True).distinct().order_by())
         return asset_ids
 
     def get_count(self, queryset):
         """
         Determine total number of assets.
-        Use `len()` instead of `queryset.count()`.
-
-        See cls.get_all_asset_ids_from_queryset())
+        Count distinct ids only instead of calling `queryset.count()`, which
+        would compare every column of the (distinct) queryset. The ids are
+        not fetched either.
         """
-        return len(AssetPagination.get_all_asset_ids_from_queryset(queryset))
+        return queryset.values('pk').distinct().order_by().count()
+
+    def _decode_cursor(self, token: str) -> tuple:
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(token.encode()))
+            date_modified = parse_datetime(cursor['date_modified'])
+            last_id = positive_int(cursor['id'])
+        except (ValueError, TypeError, KeyError):
+            date_modified = None
+        if date_modified is None:
+            raise ValidationError({self.cursor_query_param: _('Invalid cursor')})
+
+        return date_modified, last_id
+
+    @staticmethod
+    def _get_ordering(queryset) -> list:
+        return list(queryset.query.order_by or queryset.model._meta.ordering)
 
     def get_paginated_response_schema(self, schema):
         return {
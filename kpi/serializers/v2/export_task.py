@@ -23,6 +23,7 @@ from formpack.constants import (
     VALID_MULTIPLE_SELECTS,
 )
 
+from kpi.constants import EXPORT_SETTING_INCREMENTAL
 from kpi.fields import ReadOnlyJSONField
 from kpi.models import ExportTask, Asset
 from kpi.tasks import export_in_background
@@ -88,10 +89,18 @@ class ExportTaskSerializer(serializers.ModelSerializer):
         if EXPORT_SETTING_FLATTEN in data_:
             attrs[EXPORT_SETTING_FLATTEN] = data_[EXPORT_SETTING_FLATTEN]
 
+        if EXPORT_SETTING_INCREMENTAL in data_:
+            attrs[EXPORT_SETTING_INCREMENTAL] = data_[
+                EXPORT_SETTING_INCREMENTAL
+            ]
+
         return attrs
 
     def validate_data(self, data: dict) -> dict:
-        valid_export_settings = VALID_EXPORT_SETTINGS + [EXPORT_SETTING_SOURCE]
+        valid_export_settings = VALID_EXPORT_SETTINGS + [
+            EXPORT_SETTING_INCREMENTAL,
+            EXPORT_SETTING_SOURCE,
+        ]
 
         for required in REQUIRED_EXPORT_SETTINGS:
             if required not in data:
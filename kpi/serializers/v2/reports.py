@@ -2,7 +2,7 @@
 from rest_framework import serializers
 from rest_framework.reverse import reverse
 
-from kobo.apps.reports import report_data
+from kobo.apps.reports.report_store import ReportStore
 
 
 class ReportsDetailSerializer(serializers.BaseSerializer):
@@ -16,12 +16,11 @@ class ReportsDetailSerializer(serializers.BaseSerializer):
             vnames = None
 
         split_by = request.query_params.get('split_by', None)
-        submission_stream = obj.deployment.get_submissions(request.user)
-        _list = report_data.data_by_identifiers(
+        _list = ReportStore.get_report(
             obj,
+            request.user,
             vnames,
             split_by=split_by,
-            submission_stream=submission_stream,
         )
 
         return {
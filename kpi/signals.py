@@ -2,7 +2,12 @@
 from constance.signals import config_updated
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_save,
+)
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 from taggit.models import Tag
@@ -14,7 +19,17 @@ from kpi.deployment_backends.kc_access.shadow_models import (
     KobocatUser,
 )
 from kpi.deployment_backends.kc_access.utils import grant_kc_model_level_perms
-from kpi.models import Asset, TagUid
+from kpi.models import (
+    Asset,
+    AssetUserPartialPermission,
+    ExportTask,
+    ObjectPermission,
+    TagUid,
+    UserAssetSubscription,
+)
+from kpi.utils.asset_list_metadata_cache import AssetListMetadataCache
+from kpi.utils.asset_search import get_search_text_tag_names
+from kpi.utils.permission_cache import PermissionCache
 from kpi.utils.permissions import grant_default_model_level_perms
 
 
@@ -65,6 +80,41 @@ def save_kobocat_user(sender, instance, created, raw, **kwargs):
             grant_kc_model_level_perms(instance)
 
 
+@receiver(pre_save, sender=User)
+def store_previous_username(sender, instance, raw, update_fields, **kwargs):
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and 'username' not in update_fields:
+        # e.g. `last_login` updates
+        return
+    instance._previous_username = (
+        User.objects.filter(pk=instance.pk)
+        .values_list('username', flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=User)
+def update_assets_search_text_on_rename(sender, instance, raw, **kwargs):
+    """
+    Refresh `Asset.search_text`, which includes the username of the owner,
+    when a user is renamed
+    """
+    previous_username = getattr(instance, '_previous_username', None)
+    if raw or previous_username in (None, instance.username):
+        return
+    instance._previous_username = instance.username
+    assets = Asset.objects.filter(owner=instance).only(
+        'pk', 'name', 'uid', 'owner', 'settings', 'summary', 'search_text'
+    )
+    for asset in assets.iterator():
+        # Avoid fetching the owner and the tags again for each asset
+        asset.owner = instance
+        asset.update_search_text(
+            get_search_text_tag_names(asset.search_text)
+        )
+
+
 @receiver(post_save, sender=Token)
 def save_kobocat_token(sender, instance, **kwargs):
     """
@@ -104,6 +154,38 @@ def update_kc_xform_has_kpi_hooks(sender, instance, **kwargs):
         asset.deployment.set_has_kpi_hooks()
 
 
+@receiver(m2m_changed, sender=Asset.tags.through)
+def update_asset_search_text_on_tags_change(
+    sender, instance, action, reverse, **kwargs
+):
+    if (
+        isinstance(instance, Asset)
+        and not reverse
+        and action in ('post_add', 'post_remove', 'post_clear')
+    ):
+        instance.update_search_text()
+
+
+@receiver(post_save, sender=Asset)
+@receiver(post_delete, sender=Asset)
+def invalidate_asset_list_metadata_cache(sender, instance, **kwargs):
+    """
+    Invalidate the cached metadata of the asset lists, which `instance` may
+    belong to
+    """
+    if kwargs.get('raw'):
+        return
+    AssetListMetadataCache.invalidate_all()
+
+
+@receiver(post_save, sender=UserAssetSubscription)
+@receiver(post_delete, sender=UserAssetSubscription)
+def invalidate_subscriber_asset_list_metadata_cache(
+    sender, instance, **kwargs
+):
+    AssetListMetadataCache.invalidate([instance.user_id])
+
+
 @receiver(post_delete, sender=Asset)
 def post_delete_asset(sender, instance, **kwargs):
     # Update parent's languages if this object is a child of another asset.
@@ -114,3 +196,28 @@ def post_delete_asset(sender, instance, **kwargs):
     else:
         if parent:
             parent.update_languages()
+
+
+@receiver(post_delete, sender=ExportTask)
+def delete_export_index_file(sender, instance, **kwargs):
+    """
+    Remove the index of incremental exports from storage when exports are
+    deleted in bulk (e.g. along with their user), i.e. without calling
+    `ExportTask.delete()`
+    """
+    if instance.result:
+        instance.result.storage.delete(instance.index_file_name)
+
+
+@receiver(post_save, sender=ObjectPermission)
+@receiver(post_delete, sender=ObjectPermission)
+@receiver(post_save, sender=AssetUserPartialPermission)
+@receiver(post_delete, sender=AssetUserPartialPermission)
+def invalidate_permission_cache(sender, instance, **kwargs):
+    """
+    Invalidate the permissions cached for the asset and the user of
+    `instance` across requests
+    """
+    PermissionCache.invalidate(
+        asset_id=instance.asset_id, user_id=instance.user_id
+    )
@@ -1,7 +1,9 @@
 # coding: utf-8
+from celery import chord
 from django.core.management import call_command
 
 from kobo.celery import celery_app
+from kpi.constants import BULK_UPDATE_SUBMISSIONS_PROGRESS
 
 
 @celery_app.task
@@ -17,7 +19,93 @@ def export_in_background(export_task_uid):
     from kpi.models.import_export_task import ExportTask  # avoid circular imports
 
     export_task = ExportTask.objects.get(uid=export_task_uid)
-    export_task.run()
+    try:
+        shard_ranges = export_task.get_shard_ranges()
+    except Exception:
+        # Let `run()` report the error
+        shard_ranges = []
+
+    if not shard_ranges:
+        export_task.run()
+        return
+
+    header = [
+        export_shard_in_background.s(export_task_uid, shard_index, *id_range)
+        for shard_index, id_range in enumerate(shard_ranges)
+    ]
+    callback = stitch_export_shards.s(export_task_uid).on_error(
+        export_shards_failed.s(export_task_uid=export_task_uid)
+    )
+    chord(header)(callback)
+
+
+@celery_app.task
+def export_shard_in_background(
+    export_task_uid, shard_index, min_id=None, max_id=None
+):
+    from kpi.models.import_export_task import ExportTask  # avoid circular imports
+
+    export_task = ExportTask.objects.get(uid=export_task_uid)
+    return export_task.run_shard(shard_index, min_id, max_id)
+
+
+@celery_app.task
+def stitch_export_shards(shard_results, export_task_uid):
+    from kpi.models.import_export_task import ExportTask  # avoid circular imports
+
+    export_task = ExportTask.objects.get(uid=export_task_uid)
+    export_task.stitch_shards(shard_results)
+
+
+@celery_app.task
+def export_shards_failed(request, exc, traceback, export_task_uid):
+    from kpi.models.import_export_task import ExportTask  # avoid circular imports
+
+    export_task = ExportTask.objects.get(uid=export_task_uid)
+    export_task.abort_shards(exc)
+
+
+@celery_app.task(bind=True)
+def bulk_update_submissions_in_background(self, asset_uid, data, user_id):
+    """
+    Run `bulk_update_submissions()` of the deployment of `asset_uid`. The
+    progress is stored in the state of the task (see
+    `kpi.views.v2.data.DataViewSet.bulk_status()`).
+    """
+    from django.contrib.auth.models import User  # avoid circular imports
+    from kpi.models.asset import Asset  # avoid circular imports
+
+    asset = Asset.objects.get(uid=asset_uid)
+    user = User.objects.get(pk=user_id)
+
+    def _report_progress(done, total):
+        # Results of eager tasks are not stored. Report every percent only
+        if self.request.is_eager or (
+            done < total and done % max(total // 100, 1)
+        ):
+            return
+        self.update_state(
+            state=BULK_UPDATE_SUBMISSIONS_PROGRESS,
+            meta={'done': done, 'total': total},
+        )
+
+    response = asset.deployment.bulk_update_submissions(
+        data, user, progress_callback=_report_progress
+    )
+    return {'status_code': response['status'], 'data': response['data']}
+
+
+@celery_app.task
+def refresh_report(asset_uid):
+    from kobo.apps.reports.report_store import ReportStore  # avoid circular imports
+    from kpi.models.asset import Asset  # avoid circular imports
+
+    try:
+        asset = Asset.objects.get(uid=asset_uid)
+    except Asset.DoesNotExist:
+        return
+    if asset.has_deployment:
+        ReportStore.refresh(asset)
 
 
 @celery_app.task
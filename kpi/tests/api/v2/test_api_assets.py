@@ -4,11 +4,17 @@ import copy
 import json
 from io import StringIO
 
+import mock
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 
 from kpi.constants import (
+    ASSET_SEARCH_DEFAULT_FIELD_LOOKUPS,
     PERM_CHANGE_ASSET,
     PERM_VIEW_ASSET,
     PERM_VIEW_SUBMISSIONS,
@@ -17,6 +23,8 @@ from kpi.constants import (
 from kpi.models import Asset
 from kpi.models import AssetFile
 from kpi.models import AssetVersion
+from kpi.models import UserAssetSubscription
+from kpi.models.asset import KpiTaggableManager
 from kpi.serializers.v2.asset import AssetListSerializer
 from kpi.tests.base_test_case import (
     BaseAssetDetailTestCase,
@@ -175,6 +183,69 @@ class AssetListApiTests(BaseAssetTestCase):
         results = uids_from_search_results('pk:alrighty')
         self.assertListEqual(results, [])
 
+    def test_assets_search_query_follows_tags_and_owner(self):
+        someuser = User.objects.get(username='someuser')
+        anotheruser = User.objects.get(username='anotheruser')
+        survey = Asset.objects.create(
+            owner=someuser, name='survey', asset_type='survey'
+        )
+        shared_survey = Asset.objects.create(
+            owner=anotheruser, name='shared survey', asset_type='survey'
+        )
+        shared_survey.assign_perm(someuser, PERM_VIEW_ASSET)
+
+        def uids_from_search_results(query, **params):
+            return [
+                r['uid']
+                for r in self.client.get(
+                    self.list_url, data={'q': query, **params}
+                ).data['results']
+            ]
+
+        self.assertListEqual(uids_from_search_results('fruit'), [])
+        survey.tags.add('fruit-basket')
+        self.assertListEqual(uids_from_search_results('fruit'), [survey.uid])
+        # Saving keeps the tags without querying them
+        survey = Asset.objects.get(pk=survey.pk)
+        survey.name = 'renamed survey'
+        with mock.patch.object(KpiTaggableManager, 'names') as names:
+            survey.save()
+        names.assert_not_called()
+        self.assertListEqual(uids_from_search_results('fruit'), [survey.uid])
+        survey.tags.clear()
+        self.assertListEqual(uids_from_search_results('fruit'), [])
+
+        self.assertListEqual(
+            uids_from_search_results('anotheruser'), [shared_survey.uid]
+        )
+        # Relevance ordering is ignored where it is not supported
+        self.assertListEqual(
+            uids_from_search_results('anotheruser', ordering='relevance'),
+            [shared_survey.uid],
+        )
+
+        anotheruser.username = 'renameduser'
+        anotheruser.save()
+        self.assertListEqual(uids_from_search_results('anotheruser'), [])
+        self.assertListEqual(
+            uids_from_search_results('renameduser'), [shared_survey.uid]
+        )
+
+    def test_assets_search_query_uses_trigram_index(self):
+        queryset = Asset.objects.filter(
+            **{ASSET_SEARCH_DEFAULT_FIELD_LOOKUPS[0]: 'fruit'}
+        )
+        sql, params = queryset.query.sql_with_params()
+        self.assertIn('UPPER("kpi_asset"."search_text"::text) LIKE', sql)
+
+        with connection.cursor() as cursor:
+            # The table is too small for the planner to pick the index
+            # otherwise
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('kpi_asset_search_text_upper_trgm', plan)
+
     def test_assets_ordering(self):
 
         someuser = User.objects.get(username='someuser')
@@ -250,6 +321,147 @@ class AssetListApiTests(BaseAssetTestCase):
         assert expected_order_by_name_collections_first == uids
 
 
+    @override_settings(ASSET_LIST_METADATA_CACHE_TIMEOUT=60)
+    def test_assets_list_metadata_are_cached(self):
+        cache.clear()
+        someuser = User.objects.get(username='someuser')
+        anotheruser = User.objects.get(username='anotheruser')
+        survey = Asset.objects.create(
+            owner=someuser,
+            asset_type='survey',
+            settings={'organization': 'Kobo'},
+        )
+        another_survey = Asset.objects.create(
+            owner=anotheruser,
+            asset_type='survey',
+            settings={'organization': 'Another org'},
+        )
+
+        def get_organizations(params=None):
+            data = {'metadata': 'on', **(params or {})}
+            response = self.client.get(self.list_url, data=data)
+            return response.data['metadata']['organizations']
+
+        self.assertEqual(get_organizations(), ['Kobo'])
+        # Cached metadata are not computed again, whatever the page
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(get_organizations({'limit': 1}), ['Kobo'])
+        self.assertFalse(
+            any(
+                q['sql'].startswith(
+                    'SELECT "kpi_asset"."summary", "kpi_asset"."settings"'
+                )
+                for q in context.captured_queries
+            )
+        )
+
+        # Saving an asset invalidates the metadata
+        survey.settings['organization'] = 'KoboToolbox'
+        survey.save()
+        self.assertEqual(get_organizations(), ['KoboToolbox'])
+
+        # So does sharing one
+        another_survey.assign_perm(someuser, PERM_VIEW_ASSET)
+        self.assertEqual(
+            get_organizations(), ['Another org', 'KoboToolbox']
+        )
+
+    def test_assets_cursor_pagination(self):
+        someuser = User.objects.get(username='someuser')
+        for index in range(5):
+            Asset.objects.create(
+                owner=someuser, name=f'Survey {index}', asset_type='survey'
+            )
+        expected_uids = [
+            r['uid'] for r in self.client.get(self.list_url).data['results']
+        ]
+
+        uids = []
+        url = self.list_url
+        data = {'cursor': '', 'limit': 2}
+        while url:
+            response = self.client.get(url, data=data)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['count'], len(expected_uids))
+            self.assertIsNone(response.data['previous'])
+            self.assertLessEqual(len(response.data['results']), 2)
+            uids += [r['uid'] for r in response.data['results']]
+            url = response.data['next']
+            data = None
+        self.assertEqual(sorted(uids), sorted(expected_uids))
+        self.assertEqual(len(uids), len(set(uids)))
+
+        response = self.client.get(
+            self.list_url, data={'cursor': '', 'skip_count': 'true'}
+        )
+        self.assertIsNone(response.data['count'])
+
+        # Keyset pagination relies on the default ordering
+        response = self.client.get(
+            self.list_url, data={'cursor': '', 'ordering': 'name'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.list_url, data={'cursor': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_assets_list_loads_related_data_of_page_only(self):
+        someuser = User.objects.get(username='someuser')
+        anotheruser = User.objects.get(username='anotheruser')
+        admin = User.objects.get(username='admin')
+        collections = [
+            Asset.objects.create(
+                owner=someuser,
+                name=f'Collection {index}',
+                asset_type='collection',
+            )
+            for index in range(3)
+        ]
+        for collection in collections:
+            UserAssetSubscription.objects.create(
+                asset=collection, user=anotheruser
+            )
+
+        def get_page():
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(
+                    self.list_url, data={'limit': 2, 'ordering': 'name'}
+                )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return response, context.captured_queries
+
+        response, queries = get_page()
+        for result in response.data['results']:
+            self.assertEqual(result['subscribers_count'], 1)
+
+        # Subscriptions are only loaded for the assets of the page
+        page_asset_ids = [
+            str(collection.pk) for collection in collections[:2]
+        ]
+        subscription_queries = [
+            q['sql'] for q in queries if 'kpi_userassetsubscription' in q['sql']
+        ]
+        self.assertEqual(len(subscription_queries), 1)
+        self.assertIn(
+            '"asset_id" IN ({})'.format(', '.join(page_asset_ids)),
+            subscription_queries[0],
+        )
+
+        # Subscriptions and children of other assets do not cost any query
+        other_collection = Asset.objects.create(
+            owner=admin, asset_type='collection'
+        )
+        for user in (someuser, anotheruser):
+            UserAssetSubscription.objects.create(
+                asset=other_collection, user=user
+            )
+        for _ in range(3):
+            Asset.objects.create(
+                owner=admin, asset_type='survey', parent=other_collection
+            )
+        _, new_queries = get_page()
+        self.assertEqual(len(new_queries), len(queries))
+
+
 class AssetVersionApiTests(BaseTestCase):
     fixtures = ['test_data']
 
@@ -906,6 +1118,33 @@ class AssetFileTest(BaseTestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         # TODO: test that the file itself is removed
 
+    def test_file_content_supports_conditional_requests(self):
+        response_dict = json.loads(self.create_asset_file().content)
+        response = self.client.get(response_dict['content'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertEqual(
+            etag,
+            f'"{AssetFile.objects.get(uid=response_dict["uid"]).md5_hash}"',
+        )
+
+        # The file must not be read from storage again
+        with mock.patch(
+            'kpi.views.v2.asset_file.AssetFileViewSet.PrivateContentView.'
+            'as_view'
+        ) as patched_as_view:
+            response = self.client.get(
+                response_dict['content'], HTTP_IF_NONE_MATCH=etag
+            )
+            patched_as_view.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get(
+            response_dict['content'], HTTP_IF_NONE_MATCH='"md5:outdated"'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_editor_can_create_file(self):
         anotheruser = User.objects.get(username='anotheruser')
         self.assertListEqual(list(self.asset.get_perms(anotheruser)), [])
@@ -1,6 +1,9 @@
 # coding: utf-8
 import unittest
+
+import mock
 from django.contrib.auth.models import User
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.exceptions import ErrorDetail
@@ -15,6 +18,8 @@ from kpi.constants import (
 from kpi.models import Asset
 from kpi.tests.base_test_case import BaseAssetTestCase
 from kpi.urls.router_api_v2 import URL_NAMESPACE as ROUTER_URL_NAMESPACE
+from kpi.utils.hash import calculate_hash
+from kpi.utils.xml import strip_nodes
 
 
 class BasePairedDataTestCase(BaseAssetTestCase):
@@ -423,6 +428,98 @@ class PairedDataExternalApiTests(BasePairedDataTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.content, expected_xml)
 
+    def test_get_external_processes_new_and_edited_submissions_only(self):
+        self.deploy_source()
+        submissions = [
+            {
+                '_id': id_,
+                'meta/instanceID': f'uuid:{id_}',
+                'group_restaurant/favourite_restaurant': restaurant,
+                'city_name': city_name,
+            }
+            for id_, restaurant, city_name in [
+                (1, 'Dominos', 'Brussels'),
+                (2, 'Boston Pizza', 'Montreal'),
+            ]
+        ]
+        self.source_asset.deployment.mock_submissions(submissions)
+
+        with override_settings(PAIRED_DATA_EXPIRATION=0), mock.patch(
+            'kpi.views.v2.paired_data.strip_nodes', wraps=strip_nodes
+        ) as patched_strip_nodes:
+            response = self.client.get(self.external_xml_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(patched_strip_nodes.call_count, 2)
+            self.assertIn('Dominos', response.content.decode())
+
+            # Edit the first submission (KoBoCAT assigns a new `instanceID`)
+            # and add a third one
+            submissions[0]['meta/instanceID'] = 'uuid:1-edited'
+            submissions[0]['city_name'] = 'Namur'
+            submissions.append(
+                {
+                    '_id': 3,
+                    'meta/instanceID': 'uuid:3',
+                    'group_restaurant/favourite_restaurant': 'Pizza Hut',
+                    'city_name': 'Paris',
+                }
+            )
+            self.source_asset.deployment.mock_submissions(submissions)
+            patched_strip_nodes.reset_mock()
+            response = self.client.get(self.external_xml_url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(patched_strip_nodes.call_count, 2)
+        content = response.content.decode()
+        self.assertNotIn('Brussels', content)
+        for city_name in ['Namur', 'Montreal', 'Paris']:
+            self.assertIn(city_name, content)
+        self.assertLess(content.index('Namur'), content.index('Montreal'))
+        self.assertLess(content.index('Montreal'), content.index('Paris'))
+
+        # The hash of the file matches its content
+        asset_file = self.destination_asset.asset_files.get()
+        self.assertEqual(
+            asset_file.md5_hash,
+            calculate_hash(asset_file.content.read(), prefix=True),
+        )
+
+    def test_get_external_supports_conditional_requests(self):
+        self.deploy_source()
+        self.source_asset.deployment.mock_submissions(
+            [{'_id': 1, 'meta/instanceID': 'uuid:1', 'city_name': 'Montreal'}]
+        )
+        response = self.client.get(self.external_xml_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        asset_file = self.destination_asset.asset_files.get()
+        etag = response['ETag']
+        self.assertEqual(etag, f'"{asset_file.md5_hash}"')
+        self.assertIn('Last-Modified', response)
+
+        # Unexpired file
+        response = self.client.get(
+            self.external_xml_url, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Regenerated file has not changed either
+        with override_settings(PAIRED_DATA_EXPIRATION=0):
+            response = self.client.get(
+                self.external_xml_url, HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.source_asset.deployment.mock_submissions(
+            [{'_id': 1, 'meta/instanceID': 'uuid:1b', 'city_name': 'Laval'}]
+        )
+        with override_settings(PAIRED_DATA_EXPIRATION=0):
+            response = self.client.get(
+                self.external_xml_url, HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Laval', response.content.decode())
+        self.assertNotEqual(response['ETag'], etag)
+
     def deploy_source(self):
         # Refresh source asset from DB, it has been altered by
         # `self.toggle_source_sharing()`
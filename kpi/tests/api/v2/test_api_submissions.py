@@ -6,11 +6,13 @@ import time
 import uuid
 from datetime import datetime
 
+import mock
 import pytz
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.urls import reverse
 from rest_framework import status
+from rest_framework.utils.urls import replace_query_param
 
 from kpi.constants import (
     PERM_CHANGE_ASSET,
@@ -453,6 +455,99 @@ class SubmissionApiTests(BaseSubmissionTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), limit)
 
+    def test_list_submissions_with_cursor(self):
+        """
+        someuser is the owner of the project.
+        They can page through their data by following `next` links
+        """
+        for sort in ['{"_id": 1}', '{"q1": -1}']:
+            params = {'format': 'json', 'limit': 7, 'cursor': '', 'sort': sort}
+            response = self.client.get(self.submission_list_url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['count'], len(self.submissions))
+
+            results = list(response.data['results'])
+            while response.data['next']:
+                self.assertEqual(len(response.data['results']), 7)
+                response = self.client.get(response.data['next'])
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                results.extend(response.data['results'])
+
+            expected = self.asset.deployment.get_submissions(
+                self.someuser, sort=sort
+            )
+            self.assertEqual(results, expected)
+
+    def test_list_submissions_with_cursor_and_missing_values(self):
+        """
+        someuser is the owner of the project.
+        Submissions whose sort key is missing, null or of another type are
+        neither skipped nor repeated
+        """
+        for index, submission in enumerate(self.submissions):
+            if index % 4 == 0:
+                del submission['q1']
+            elif index % 4 == 1:
+                submission['q1'] = None
+            elif index % 4 == 2:
+                submission['q1'] = index % 3
+        self.asset.deployment.mock_submissions(self.submissions)
+
+        for sort in ['{"q1": 1}', '{"q1": -1}']:
+            params = {'format': 'json', 'limit': 3, 'cursor': '', 'sort': sort}
+            response = self.client.get(self.submission_list_url, params)
+            results = list(response.data['results'])
+            while response.data['next']:
+                response = self.client.get(response.data['next'])
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                results.extend(response.data['results'])
+
+            expected = self.asset.deployment.get_submissions(
+                self.someuser, sort=sort
+            )
+            self.assertEqual(len(expected), len(self.submissions))
+            self.assertEqual(results, expected)
+
+    def test_list_submissions_with_cursor_and_params(self):
+        """
+        someuser is the owner of the project.
+        They can skip the count and the cursor cannot be reused with another
+        `sort`
+        """
+        response = self.client.get(
+            self.submission_list_url, {
+                'format': 'json',
+                'limit': 2,
+                'cursor': '',
+                'skip_count': 'true',
+                'query': '{"_submitted_by": ""}',
+            }
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['count'])
+        self.assertEqual(
+            [submission['_id'] for submission in response.data['results']],
+            [
+                submission['_id']
+                for submission in self.submissions_submitted_by_unknown[:2]
+            ],
+        )
+
+        if response.data['next']:
+            next_url = replace_query_param(
+                response.data['next'], 'sort', '{"q1": 1}'
+            )
+            response = self.client.get(next_url)
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+
+        response = self.client.get(
+            self.submission_list_url,
+            {'format': 'json', 'cursor': '', 'start': 1},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_list_submissions_not_shared_as_anotheruser(self):
         """
         someuser is the owner of the project.
@@ -1205,6 +1300,52 @@ class BulkUpdateSubmissionsApiTests(BaseSubmissionTestCase):
         assert response.status_code == status.HTTP_200_OK
         self._check_bulk_update(response)
 
+    def test_bulk_update_submissions_in_background(self):
+        """
+        someuser is the owner of the project.
+        someuser can bulk update their own data in the background and follow
+        the progress of the update.
+        """
+        response = self.client.patch(
+            f'{self.submission_url}?background=true',
+            data=self.submitted_payload,
+            format='json',
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        task_id = response.data['task_id']
+        assert task_id.startswith(f'{self.asset.uid}-')
+
+        # Tasks run eagerly in tests
+        submission_ids = self.updated_submission_data['submission_ids']
+        for submission in self._deployment.get_submissions(
+            self.asset.owner, submission_ids=submission_ids
+        ):
+            assert submission['q1'] == '🕺'
+
+        # Results of eager tasks are not stored, fake them
+        with mock.patch('kpi.views.v2.data.AsyncResult') as patched_result:
+            patched_result.return_value.state = 'PROGRESS'
+            patched_result.return_value.info = {'done': 1, 'total': 3}
+            response = self.client.get(
+                response.data['status_url'], format='json'
+            )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {
+            'status': 'PROGRESS',
+            'progress': {'done': 1, 'total': 3},
+        }
+
+        # Tasks of other assets are not reported
+        status_url = reverse(
+            self._get_endpoint('submission-bulk-status'),
+            kwargs={
+                'parent_lookup_asset': self.asset.uid,
+                'task_id': str(uuid.uuid4()),
+            },
+        )
+        response = self.client.get(status_url, format='json')
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
     def test_cannot_bulk_update_submissions_as_anotheruser(self):
         """
         someuser is the owner of the project.
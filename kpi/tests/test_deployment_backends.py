@@ -1,10 +1,14 @@
 # coding: utf-8
+import mock
 import pytest
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from mongomock.collection import Cursor
 
 from kpi.exceptions import DeploymentDataException
 from kpi.models.asset import Asset
 from kpi.models.asset_version import AssetVersion
+from kpi.utils.submission_count_cache import SubmissionCountCache
 
 
 class CreateDeployment(TestCase):
@@ -151,3 +155,59 @@ class MockDeployment(TestCase):
         # altered directly
         with self.assertRaises(DeploymentDataException) as e:
             asset.save()
+
+
+@override_settings(SUBMISSION_COUNT_CACHE_TIMEOUT=60)
+class MockDeploymentSubmissionCount(TestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        self.someuser = User.objects.get(username='someuser')
+        self.asset = Asset.objects.create(
+            owner=self.someuser,
+            content={'survey': [{'type': 'integer', 'name': 'q1'}]},
+        )
+        self.asset.deploy(backend='mock', active=True)
+        self.asset.save()
+        v_uid = self.asset.latest_deployed_version.uid
+        self.asset.deployment.mock_submissions([
+            {'__version__': v_uid, 'q1': i} for i in range(3)
+        ])
+        SubmissionCountCache.reset_stats()
+
+    def test_count_is_cached(self):
+        deployment = self.asset.deployment
+        with mock.patch.object(
+            Cursor, 'count', autospec=True, side_effect=Cursor.count
+        ) as patched_count:
+            self.assertEqual(deployment.submission_count, 3)
+            self.assertEqual(deployment.submission_count, 3)
+            self.assertEqual(patched_count.call_count, 1)
+            # Queries are cached independently
+            self.assertEqual(
+                deployment.calculated_submission_count(
+                    self.someuser, query={'q1': {'$gt': 0}}
+                ),
+                2,
+            )
+            self.assertEqual(patched_count.call_count, 2)
+
+        self.assertEqual(
+            SubmissionCountCache.get_stats(), {'hits': 1, 'misses': 2}
+        )
+
+    def test_count_is_invalidated(self):
+        deployment = self.asset.deployment
+        self.assertEqual(deployment.submission_count, 3)
+        deployment.delete_submission(1, self.someuser)
+        self.assertEqual(deployment.submission_count, 2)
+        deployment.duplicate_submission(2, self.someuser)
+        self.assertEqual(deployment.submission_count, 3)
+
+    @override_settings(SUBMISSION_COUNT_CACHE_TIMEOUT=0)
+    def test_cache_can_be_disabled(self):
+        self.assertEqual(self.asset.deployment.submission_count, 3)
+        self.assertEqual(self.asset.deployment.submission_count, 3)
+        self.assertEqual(
+            SubmissionCountCache.get_stats(), {'hits': 0, 'misses': 0}
+        )
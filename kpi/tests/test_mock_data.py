@@ -1,13 +1,18 @@
 # coding: utf-8
+import json
 from copy import deepcopy
 from collections import OrderedDict
 
+import mock
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import TestCase, override_settings
 
 from formpack import FormPack
 from kobo.apps.reports import report_data
-from kpi.models import Asset
+from kobo.apps.reports.report_store import ReportStore
+from kpi.models import Asset, AssetReport
+from kpi.utils.formpack_cache import FormPackCache
 
 F1 = {'survey': [{'$kuid': 'Uf89NP4VX', 'type': 'start', 'name': 'start'},
                   {'$kuid': 'ZtZBY7XHX', 'type': 'end', 'name': 'end'},
@@ -105,6 +110,27 @@ SUBMISSION_DATA = OrderedDict([
 ])
 
 
+def _sort_responses(stats):
+    """
+    Return the data of `stats` by question name, with their responses
+    sorted. Responses of the same frequency come in no particular order.
+    """
+    sorted_stats = {}
+    for stat in stats:
+        data = dict(stat['data'])
+        if 'responses' in data:
+            data['responses'] = sorted(
+                zip(
+                    data.pop('responses'),
+                    data.pop('frequencies'),
+                    data.pop('percentages'),
+                ),
+                key=str,
+            )
+        sorted_stats[stat['name']] = data
+    return sorted_stats
+
+
 def _get_stats_object(pack, version_ids, submissions=None, lang=None, split_by=None):
     if submissions == None:
         raise ValueError('submissions must be provided')
@@ -218,6 +244,35 @@ class MockDataReports(TestCase):
                              '\u0627\u0644\u062e\u064a\u0627\u0631 '
                              '\u0627\u0644\u062b\u0627\u0646\u064a'))
 
+    def test_kobo_apps_reports_report_data_aggregated(self):
+        # Without `submission_stream`, select and numeric questions are
+        # counted by Mongo; results must not change
+        for params in [{}, {'split_by': 'Select_one'}, {'lang': 'Arabic'}]:
+            self.assertEqual(
+                report_data.data_by_identifiers(self.asset, **params),
+                report_data.data_by_identifiers(
+                    self.asset,
+                    submission_stream=self.asset.deployment.get_submissions(
+                        self.user
+                    ),
+                    **params
+                ),
+            )
+
+        # Submissions are not fetched if every question is aggregated
+        with mock.patch.object(
+            self.asset.deployment,
+            'get_submissions',
+            side_effect=AssertionError,
+        ):
+            values = report_data.data_by_identifiers(
+                self.asset, field_names=['Select_Many', 'Number', 'Decimal']
+            )
+        self.assertEqual(
+            [v['name'] for v in values], ['Select_Many', 'Number', 'Decimal']
+        )
+        self.assertEqual(values[2]['data']['median'], 3.0)
+
     def test_export_works_if_no_version_value_provided_in_submission(self):
         submissions = self.asset.deployment.get_submissions(self.asset.owner)
 
@@ -285,3 +340,153 @@ class MockDataReports(TestCase):
         self.assertEqual(self.asset.asset_versions.count(), 2)
         self.assertTrue(self.asset.has_deployment)
         self.assertEqual(self.asset.deployment.submission_count, 4)
+
+    def test_build_formpack_is_cached(self):
+        FormPackCache.clear()
+        with mock.patch(
+            'kobo.apps.reports.report_data._compile_formpack',
+            wraps=report_data._compile_formpack,
+        ) as patched_compile_formpack:
+            pack, _ = report_data.build_formpack(self.asset)
+            cached_pack, _ = report_data.build_formpack(self.asset)
+            self.assertEqual(patched_compile_formpack.call_count, 1)
+            # Each call gets its own copy
+            self.assertIsNot(pack, cached_pack)
+            self.assertEqual(
+                list(pack.versions.keys()), list(cached_pack.versions.keys())
+            )
+
+            # A new deployed version changes the key
+            self.asset.content['survey'].append(
+                {'type': 'text', 'name': 'new_question', 'label': 'New'}
+            )
+            self.asset.save()
+            self.asset.deploy(backend='mock', active=True)
+            report_data.build_formpack(self.asset)
+            self.assertEqual(patched_compile_formpack.call_count, 2)
+
+    @override_settings(FORMPACK_CACHE_MAX_SIZE=0)
+    def test_build_formpack_cache_can_be_disabled(self):
+        FormPackCache.clear()
+        with mock.patch(
+            'kobo.apps.reports.report_data._compile_formpack',
+            wraps=report_data._compile_formpack,
+        ) as patched_compile_formpack:
+            report_data.build_formpack(self.asset)
+            report_data.build_formpack(self.asset)
+            self.assertEqual(patched_compile_formpack.call_count, 2)
+
+    def test_infer_version_id(self):
+        infer_version_id = report_data.get_version_id_inferrer(
+            ['v3', 'v2', 'v2alias', 'v1'], {'1234': 'v2'}
+        )
+        inferred_key = report_data.INFERRED_VERSION_ID_KEY
+        cases = [
+            ({'__version__': 'v3', '_version_': 'v1'}, 'v3'),
+            ({'__version__': 'v1', '_version_': 'v2alias'}, 'v2alias'),
+            ({'__version__': 'v1', '_version__001': '1234'}, 'v2'),
+            ({'__version__': 'unknown'}, 'v3'),
+            ({}, 'v3'),
+        ]
+        for submission, expected_version_id in cases:
+            self.assertEqual(
+                infer_version_id(submission)[inferred_key],
+                expected_version_id,
+            )
+
+    def test_report_store(self):
+        with mock.patch(
+            'kobo.apps.reports.report_data.data_by_identifiers',
+            wraps=report_data.data_by_identifiers,
+        ) as patched_data_by_identifiers:
+            stats = ReportStore.get_report(self.asset, self.user)
+            expected_stats = report_data.data_by_identifiers(
+                self.asset, submission_stream=self.submissions
+            )
+            # Stored reports are JSON
+            self.assertEqual(
+                _sort_responses(stats),
+                _sort_responses(
+                    json.loads(
+                        json.dumps(expected_stats, cls=DjangoJSONEncoder)
+                    )
+                ),
+            )
+            self.assertEqual(
+                AssetReport.objects.filter(asset=self.asset).count(), 1
+            )
+            patched_data_by_identifiers.reset_mock()
+
+            # Served from the store
+            self.assertEqual(ReportStore.get_report(self.asset, self.user), stats)
+            patched_data_by_identifiers.assert_not_called()
+
+            # Styles are applied on read
+            self.asset.report_styles['kuid_names'] = {'Select_one': 'abcd'}
+            self.asset.report_styles['specified'] = {
+                'abcd': {'report_type': 'vertical'}
+            }
+            stats = ReportStore.get_report(self.asset, self.user)
+            patched_data_by_identifiers.assert_not_called()
+            select_one_stat = [s for s in stats if s['name'] == 'Select_one'][0]
+            self.assertEqual(
+                select_one_stat['style'], {'report_type': 'vertical'}
+            )
+            # ... without altering the stored report
+            self.assertNotIn(
+                'abcd',
+                [stat['kuid'] for stat in AssetReport.objects.get().stats],
+            )
+
+        with mock.patch(
+            'kobo.apps.reports.report_data.get_report_metrics',
+            wraps=report_data.get_report_metrics,
+        ) as patched_get_report_metrics:
+            # New submissions are added to the stored report...
+            submission = deepcopy(self.submissions[0])
+            submission['_id'] = 1000
+            self.asset.deployment.mock_submissions(
+                [submission], flush_db=False
+            )
+            stats = ReportStore.get_report(self.asset, self.user)
+            patched_get_report_metrics.assert_called_once()
+            self.assertEqual(
+                patched_get_report_metrics.call_args[1]['query'],
+                {'_id': {'$gt': 4, '$lte': 1000}},
+            )
+            patched_get_report_metrics.reset_mock()
+            # ... which matches the report of all submissions
+            expected_stats = report_data.data_by_identifiers(
+                self.asset,
+                submission_stream=self.asset.deployment.get_submissions(
+                    self.user
+                ),
+            )
+            self.assertEqual(
+                _sort_responses(stats),
+                _sort_responses(
+                    json.loads(
+                        json.dumps(expected_stats, cls=DjangoJSONEncoder)
+                    )
+                ),
+            )
+
+            # Edits, even made without going through KPI (e.g. through
+            # Enketo), make the report computed again from all submissions
+            self.asset.deployment.set_validation_status(
+                1,
+                self.user,
+                {'validation_status.uid': 'validation_status_approved'},
+                'PATCH',
+            )
+            ReportStore.get_report(self.asset, self.user)
+            patched_get_report_metrics.assert_called_once()
+            self.assertEqual(
+                patched_get_report_metrics.call_args[1]['query'],
+                {'_id': {'$lte': 1000}},
+            )
+            patched_get_report_metrics.reset_mock()
+
+            # Served from the store
+            ReportStore.get_report(self.asset, self.user)
+            patched_get_report_metrics.assert_not_called()
@@ -1,5 +1,6 @@
 # coding: utf-8
 import os
+import shutil
 import zipfile
 from collections import defaultdict
 
@@ -9,7 +10,7 @@ import xlrd
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from kobo.apps.reports import report_data
 from kpi.constants import (
@@ -19,6 +20,7 @@ from kpi.constants import (
     PERM_VIEW_SUBMISSIONS,
 )
 from kpi.models import Asset, ExportTask
+from kpi.tasks import export_in_background
 from kpi.utils.object_permission import get_anonymous_user
 from kpi.utils.mongo_helper import drop_mock_only
 
@@ -530,6 +532,116 @@ class MockDataExports(MockDataExportsBase):
         ]
         self.run_csv_export_test(expected_lines, export_options)
 
+    def test_csv_export_incremental(self):
+        task_data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'csv',
+            'incremental': True,
+        }
+        first_export_task = ExportTask()
+        first_export_task.user = self.user
+        first_export_task.data = dict(task_data)
+        first_export_task.save()
+        first_export_task.run()
+        self.assertEqual(first_export_task.status, ExportTask.COMPLETE)
+        storage = first_export_task.result.storage
+        self.assertTrue(storage.exists(first_export_task.index_file_name))
+
+        # Edit, delete and add submissions
+        settings.MONGO_DB.instances.update_one(
+            {'_id': 61},
+            {
+                '$set': {
+                    'Do_you_descend_from_unicellular_organism': 'yes',
+                    'meta/instanceID': 'uuid:0f6eb8c5-4d9b-4fbf-8e48-ed4c5a1c7fe1',
+                }
+            },
+        )
+        settings.MONGO_DB.instances.delete_one({'_id': 62})
+        new_submission = self.asset.deployment.get_submission(
+            63, self.asset.owner
+        )
+        new_submission.update({
+            '_id': 64,
+            '_uuid': 'bc7c9e0b-a5ff-4c0f-8b1b-1f4ac1d6b9f5',
+            'meta/instanceID': 'uuid:bc7c9e0b-a5ff-4c0f-8b1b-1f4ac1d6b9f5',
+        })
+        self.asset.deployment.mock_submissions(
+            [new_submission], flush_db=False
+        )
+
+        incremental_export_task = ExportTask()
+        incremental_export_task.user = self.user
+        incremental_export_task.data = dict(task_data)
+        incremental_export_task.save()
+        with mock.patch(
+            'kpi.models.import_export_task.build_formpack',
+            wraps=report_data.build_formpack,
+        ) as patched_build_formpack:
+            incremental_export_task.run()
+            submission_stream = patched_build_formpack.call_args[0][1]
+            # Only the edited and the new submissions are rendered
+            self.assertEqual(
+                [submission['_id'] for submission in submission_stream],
+                [61, 64],
+            )
+        self.assertEqual(incremental_export_task.status, ExportTask.COMPLETE)
+
+        export_task = ExportTask()
+        export_task.user = self.user
+        export_task.data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'csv',
+        }
+        export_task.save()
+        export_task.run()
+
+        self.assertEqual(
+            list(incremental_export_task.result),
+            list(export_task.result),
+        )
+
+    @override_settings(EXPORT_SHARDS=2, EXPORT_SHARDING_THRESHOLD=1)
+    def test_csv_export_sharded(self):
+        task_data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'csv',
+        }
+        sharded_export_task = ExportTask()
+        sharded_export_task.user = self.user
+        sharded_export_task.data = dict(task_data)
+        sharded_export_task.save()
+        self.assertEqual(
+            sharded_export_task.get_shard_ranges(), [(None, 62), (62, None)]
+        )
+        export_in_background(sharded_export_task.uid)
+        sharded_export_task.refresh_from_db()
+        self.assertEqual(sharded_export_task.status, ExportTask.COMPLETE)
+
+        # Temporary shard files have been removed
+        storage = sharded_export_task.result.storage
+        _, file_names = storage.listdir(
+            os.path.dirname(sharded_export_task.result.name)
+        )
+        self.assertFalse(
+            [name for name in file_names if '_shard_' in name]
+        )
+
+        export_task = ExportTask()
+        export_task.user = self.user
+        export_task.data = dict(task_data)
+        export_task.save()
+        export_task.run()
+
+        self.assertEqual(
+            list(sharded_export_task.result),
+            list(export_task.result),
+        )
+        self.assertEqual(
+            sharded_export_task.last_submission_time,
+            export_task.last_submission_time,
+        )
+
     def test_xls_export_english_labels(self):
         export_options = {'lang': 'English'}
         expected_data = {
@@ -543,6 +655,30 @@ class MockDataExports(MockDataExportsBase):
         }
         self.run_xls_export_test(expected_data, export_options)
 
+    def test_xls_export_uploaded_by_chunks(self):
+        task_data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'xls',
+        }
+        export_task = ExportTask()
+        export_task.user = self.user
+        export_task.data = task_data
+        export_task.save()
+        with mock.patch.object(
+            ExportTask, 'XLSX_UPLOAD_CHUNK_SIZE', 1024
+        ), mock.patch(
+            'kpi.models.import_export_task.shutil.copyfileobj',
+            wraps=shutil.copyfileobj,
+        ) as patched_copyfileobj:
+            export_task.run()
+            patched_copyfileobj.assert_called_once()
+            self.assertEqual(patched_copyfileobj.call_args[0][2], 1024)
+
+        self.assertEqual(export_task.status, ExportTask.COMPLETE)
+        book = xlrd.open_workbook(file_contents=export_task.result.read())
+        self.assertGreater(export_task.result.size, 1024)
+        self.assertEqual(book.sheet_by_index(0).nrows, 5)
+
     def test_xls_export_english_labels_partial_submissions(self):
         export_options = {'lang': 'English'}
         expected_data = {self.asset.name: [
@@ -1,7 +1,10 @@
 # coding: utf-8
 import unittest
 from django.contrib.auth.models import User, AnonymousUser
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from kpi.constants import (
     ASSET_TYPE_COLLECTION,
@@ -252,6 +255,43 @@ class PermissionsTestCase(BasePermissionsTestCase):
         self._test_add_remove_inherited_perm(self.admin_collection, 'change_',
                                              self.someuser, self.admin_asset)
 
+    def test_recalculate_descendants_permissions_in_bulk(self):
+        subcollection = Asset.objects.create(
+            asset_type=ASSET_TYPE_COLLECTION,
+            owner=self.admin,
+            parent=self.admin_collection,
+        )
+
+        def add_surveys(count):
+            for _ in range(count):
+                Asset.objects.create(
+                    asset_type=ASSET_TYPE_SURVEY,
+                    owner=self.anotheruser,
+                    parent=subcollection,
+                )
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                self.admin_collection.recalculate_descendants_perms()
+            return len(context.captured_queries)
+
+        add_surveys(2)
+        self.admin_collection.assign_perm(self.someuser, PERM_CHANGE_ASSET)
+        query_count = count_queries()
+        add_surveys(5)
+        # The number of queries does not depend on the size of the tree
+        self.assertEqual(count_queries(), query_count)
+
+        perm_name = self._get_perm_name('change_', subcollection)
+        for survey in subcollection.children.all():
+            self.assertTrue(self.someuser.has_perm(perm_name, survey))
+            # Owners keep their permissions
+            self.assertTrue(self.anotheruser.has_perm(perm_name, survey))
+
+        self.admin_collection.remove_perm(self.someuser, PERM_CHANGE_ASSET)
+        for survey in subcollection.children.all():
+            self.assertFalse(self.someuser.has_perm(perm_name, survey))
+
     def test_implied_asset_grant_permissions(self):
         implications = {
             PERM_CHANGE_ASSET: (PERM_VIEW_ASSET,),
@@ -722,6 +762,45 @@ class PermissionsTestCase(BasePermissionsTestCase):
         self.assertFalse(grantee.has_perm(PERM_PARTIAL_SUBMISSIONS, asset))
         self.assertTrue(asset.asset_partial_permissions.count() == 0)
 
+    @override_settings(PERMISSION_CACHE_TIMEOUT=60)
+    def test_permissions_are_cached_between_requests(self):
+        cache.clear()
+        asset = self.admin_asset
+        grantee = self.someuser
+        asset.assign_perm(grantee, PERM_VIEW_ASSET)
+        self.assertTrue(grantee.has_perm(PERM_VIEW_ASSET, asset))
+        # Permissions are served from the cache in steady state
+        with self.assertNumQueries(0):
+            self.assertTrue(grantee.has_perm(PERM_VIEW_ASSET, asset))
+
+        # Removing a permission invalidates the cache
+        asset.remove_perm(grantee, PERM_VIEW_ASSET)
+        self.assertFalse(grantee.has_perm(PERM_VIEW_ASSET, asset))
+
+        # So does assigning or updating partial permissions
+        partial_perms = {
+            PERM_VIEW_SUBMISSIONS: [{
+                '_submitted_by': self.anotheruser.username
+            }]
+        }
+        self.assertEqual(asset.get_partial_perms(grantee.pk), None)
+        asset.assign_perm(grantee, PERM_PARTIAL_SUBMISSIONS,
+                          partial_perms=partial_perms)
+        self.assertTrue(grantee.has_perm(PERM_PARTIAL_SUBMISSIONS, asset))
+        self.assertEqual(
+            asset.get_partial_perms(grantee.pk, with_filters=True),
+            partial_perms,
+        )
+        partial_perms[PERM_VIEW_SUBMISSIONS][0]['_submitted_by'] = (
+            grantee.username
+        )
+        asset.assign_perm(grantee, PERM_PARTIAL_SUBMISSIONS,
+                          partial_perms=partial_perms)
+        self.assertEqual(
+            asset.get_partial_perms(grantee.pk, with_filters=True),
+            partial_perms,
+        )
+
     @unittest.skip(reason='Skip until this branch is merged within '
                           '`3115-allowed-write-actions-with-partial-perm`')
     def test_implied_partial_submission_permission(self):
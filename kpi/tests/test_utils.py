@@ -10,7 +10,11 @@ from django.test import TestCase
 from kpi.exceptions import SearchQueryTooShortException
 from kpi.utils.autoname import autoname_fields, autoname_fields_to_field
 from kpi.utils.autoname import autovalue_choices_in_place
-from kpi.utils.query_parser import parse
+from kpi.utils.incremental_export import get_csv_index_column, renumber_chunk
+from kpi.utils.query_parser import ParseError, parse
+from kpi.utils.query_parser.recursive_descent_parser import (
+    parse as recursive_descent_parse,
+)
 from kpi.utils.sluggify import sluggify, sluggify_label
 from kpi.utils.xml import strip_nodes
 
@@ -223,6 +227,60 @@ class UtilsTestCase(TestCase):
             parse(query_string, default_field_lookups)
         assert 'Your query is too short' in str(e.exception)
 
+    def test_query_parser_returns_copies_of_cached_queries(self):
+        default_field_lookups = ['field_a__icontains']
+        query_string = 'a:a AND b:b'
+        parsed_query = parse(query_string, default_field_lookups)
+        parsed_query.children.append(('d', 'd'))
+        assert parse(query_string, default_field_lookups) == (
+            Q(a='a') & Q(b='b')
+        )
+
+    def test_recursive_descent_parser_matches_query_parser(self):
+        default_field_lookups = [
+            'field_a__icontains',
+            'field_b'
+        ]
+        query_strings = [
+            '',
+            'foo',
+            'a:null AND b:TRUE',
+            '(a:a OR b:b AND c:c) AND d:d OR (snakes:🐍🐍 AND NOT x:y)',
+            'NOT \'in a house\' NOT "with a \\"mouse\\""',
+            'ANDROID:a NOTHING',
+            'a:a\n AND\t(b:b  OR  c:c) ',
+        ]
+        for query_string in query_strings:
+            assert recursive_descent_parse(
+                query_string, default_field_lookups
+            ) == parse(query_string, default_field_lookups)
+
+        for query_string in ['a:', '(a:a', 'a:a OR', 'a:a ORANGES']:
+            with self.assertRaises(ParseError):
+                parse(query_string, default_field_lookups)
+            with self.assertRaises(ParseError):
+                recursive_descent_parse(query_string, default_field_lookups)
+
+    def test_renumber_csv_chunk(self):
+        header = b'"start";"_index";"How many?"\r\n"#date";"";"#num"\r\n'
+        index_column = get_csv_index_column(header)
+        self.assertEqual(index_column, 1)
+        # Only the `_index` field is renumbered, not the trailing numeric
+        # answer
+        self.assertEqual(
+            renumber_chunk(
+                'csv', b'"2021-01-01";"7";"42"\r\n', 3, index_column
+            ),
+            b'"2021-01-01";"3";"42"\r\n',
+        )
+        self.assertEqual(
+            renumber_chunk(
+                'csv', b'"multi\r\n""line""";"7";"42"\r\n', 3, index_column
+            ),
+            b'"multi\r\n""line""";"3";"42"\r\n',
+        )
+        self.assertIsNone(get_csv_index_column(b'"start";"end"\r\n'))
+
 
 class XmlUtilsTestCase(TestCase):
 
@@ -401,6 +459,27 @@ class XmlUtilsTestCase(TestCase):
 
         )
 
+    def test_strip_xml_nodes_by_xpaths_in_repeated_groups(self):
+        source = (
+            '<root>'
+            '    <repeat><question_1>A</question_1><question_2>B</question_2>'
+            '    </repeat>'
+            '    <repeat><question_1>C</question_1><question_2>D</question_2>'
+            '    </repeat>'
+            '    <question_3>E</question_3>'
+            '</root>'
+        )
+        expected = (
+            '<root>'
+            '    <repeat><question_1>A</question_1></repeat>'
+            '    <repeat><question_1>C</question_1></repeat>'
+            '</root>'
+        )
+        self.__compare_xml(
+            strip_nodes(source, ['repeat/question_1'], use_xpath=True),
+            expected,
+        )
+
     def __compare_xml(self, source: str, target: str) -> bool:
         """ Attempts to standardize XML by removing whitespace between tags """
         pattern = r'\s*(<[^>]+>)\s*'
@@ -0,0 +1,96 @@
+# coding: utf-8
+import json
+from hashlib import md5
+from typing import Callable, Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+
+from kpi.utils.permission_cache import PermissionCache
+
+
+class AssetListMetadataCache:
+    """
+    Cache the metadata of the asset list (i.e. languages, countries, sectors
+    and organizations found in the assets a user can list with given filters,
+    see `AssetViewSet.get_metadata()`).
+
+    Keys are versioned: the version of all lists is bumped by
+    `invalidate_all()` whenever any asset is saved or deleted, and the
+    version of a user by `invalidate()` whenever the collections the user
+    subscribes to change (see `kpi.signals`). Keys also include the versions
+    of the permissions of the user in `PermissionCache`, which change
+    whenever permissions of the user are assigned or removed. Assets shared
+    publicly appear in every list, so the versions of the anonymous user are
+    part of every key as well.
+
+    Stale metadata must not survive in other processes, so the cache back
+    end has to be shared between them (e.g. Redis or memcached): the cache
+    is disabled unless `settings.ASSET_LIST_METADATA_CACHE_TIMEOUT` is set.
+    """
+
+    KEY_PREFIX = 'asset_list_metadata'
+    ALL = 'all'
+    # Versions must outlive the entries they validate
+    VERSION_TIMEOUT = None
+
+    @classmethod
+    def get_or_set(cls, user_id: int, params: dict, func: Callable) -> dict:
+        """
+        Return the cached metadata for `user_id` and `params`, the filters of
+        the list. `func` is called to get the actual metadata on cache misses.
+        """
+        timeout = settings.ASSET_LIST_METADATA_CACHE_TIMEOUT
+        if not timeout:
+            return func()
+
+        key = cls._get_key(user_id, params)
+        metadata = cache.get(key)
+        if metadata is None:
+            metadata = func()
+            cache.set(key, metadata, timeout)
+        return metadata
+
+    @classmethod
+    def invalidate(cls, user_ids: Iterable):
+        for user_id in set(user_ids):
+            cls._bump_version(cls._get_version_key(user_id))
+
+    @classmethod
+    def invalidate_all(cls):
+        """
+        Invalidate the metadata of every user. Finding the users who can
+        access an asset would cost a query on every save.
+        """
+        cls._bump_version(cls._get_version_key(cls.ALL))
+
+    @classmethod
+    def _bump_version(cls, version_key: str):
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            # The key does not exist (yet)
+            cache.set(version_key, 1, cls.VERSION_TIMEOUT)
+
+    @classmethod
+    def _get_key(cls, user_id: int, params: dict) -> str:
+        user_ids = [user_id, settings.ANONYMOUS_USER_ID]
+        version_keys = [
+            cls._get_version_key(id_) for id_ in [cls.ALL, *user_ids]
+        ]
+        versions = cache.get_many(version_keys)
+        params_hash = md5(
+            json.dumps(
+                [
+                    [versions.get(key, 0) for key in version_keys],
+                    PermissionCache.get_user_versions(user_ids),
+                    params,
+                ],
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()
+        return f'{cls.KEY_PREFIX}:{user_id}:{params_hash}'
+
+    @classmethod
+    def _get_version_key(cls, user_id) -> str:
+        return f'{cls.KEY_PREFIX}:version:{user_id}'
@@ -0,0 +1,73 @@
+# coding: utf-8
+import json
+from typing import Iterable, List, Optional
+
+from django.db.models import FloatField, Func, Value
+
+
+# Search terms never contain line breaks, so they cannot match across values
+SEARCH_TEXT_SEPARATOR = '\n'
+# Line which precedes the tags, so that they can be read back without
+# querying them (see `get_search_text_tag_names()`)
+SEARCH_TEXT_TAGS_MARKER = '\x1e'
+
+
+def get_search_text(
+    name: str,
+    uid: str,
+    owner_username: Optional[str],
+    settings: dict,
+    summary: dict,
+    tag_names: Iterable[str],
+) -> str:
+    """
+    Return the text of an asset which search terms without a specified field
+    are looked up in (see `Asset.search_text`). It gathers the values
+    formerly searched one by one, i.e. name, uid, owner's username,
+    description, summary and tags.
+    """
+    try:
+        description = settings.get('description')
+    except AttributeError:
+        description = None
+
+    values = [
+        name,
+        uid,
+        owner_username,
+        description,
+        # Matches the way `summary__icontains` casted `summary` to text
+        json.dumps(summary, ensure_ascii=False, default=str),
+    ]
+    return SEARCH_TEXT_SEPARATOR.join(
+        [
+            *(str(value) for value in values if value),
+            SEARCH_TEXT_TAGS_MARKER,
+            *tag_names,
+        ]
+    )
+
+
+def get_search_text_tag_names(search_text: str) -> Optional[List[str]]:
+    """
+    Return the tag names stored in `search_text` by `get_search_text()`, or
+    `None` if it does not contain any (e.g. it has never been populated)
+    """
+    lines = search_text.split(SEARCH_TEXT_SEPARATOR)
+    try:
+        index = lines.index(SEARCH_TEXT_TAGS_MARKER)
+    except ValueError:
+        return None
+    return lines[index + 1:]
+
+
+class WordSimilarity(Func):
+    """
+    Greatest similarity between the trigrams of a term and those of any
+    extent of a text. Requires the `pg_trgm` extension of PostgreSQL.
+    """
+    function = 'word_similarity'
+    output_field = FloatField()
+
+    def __init__(self, expression, term, **extra):
+        super().__init__(Value(term), expression, **extra)
@@ -0,0 +1,55 @@
+# coding: utf-8
+from datetime import datetime
+from typing import Optional
+
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def get_conditional_headers(
+    md5_hash: Optional[str], last_modified: Optional[datetime] = None
+) -> dict:
+    """
+    Return the `ETag` and `Last-Modified` headers of a response whose content
+    hash is `md5_hash` (e.g. `AssetFile.md5_hash`), for clients to make
+    conditional requests
+    """
+    headers = {}
+    if md5_hash:
+        headers['ETag'] = quote_etag(md5_hash)
+    if last_modified:
+        headers['Last-Modified'] = http_date(last_modified.timestamp())
+    return headers
+
+
+def get_not_modified_response(
+    request: HttpRequest,
+    md5_hash: Optional[str],
+    last_modified: Optional[datetime] = None,
+) -> Optional[HttpResponse]:
+    """
+    Return a `304 Not Modified` (or `412 Precondition Failed`) response if the
+    conditional headers of `request` match `md5_hash` and `last_modified`,
+    `None` otherwise, i.e. when the content must be sent.
+
+    Only values stored in the database should be passed, the point is to
+    avoid reading the content from storage.
+    """
+    if not md5_hash:
+        return None
+
+    response = get_conditional_response(
+        request,
+        etag=quote_etag(md5_hash),
+        last_modified=(
+            int(last_modified.timestamp()) if last_modified else None
+        ),
+    )
+    if response is not None:
+        for header, value in get_conditional_headers(
+            md5_hash, last_modified
+        ).items():
+            response[header] = value
+
+    return response
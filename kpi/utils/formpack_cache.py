@@ -0,0 +1,103 @@
+# coding: utf-8
+import pickle
+import threading
+from collections import OrderedDict
+from hashlib import md5
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from kpi.utils.log import logging
+
+
+class FormPackCache:
+    """
+    Process-wide LRU cache of compiled `FormPack` objects (and the version
+    lookups `build_formpack()` needs along with them), keyed by the ordered
+    versions they are built from. Compiling the schemas of a form with many
+    versions is expensive; the versions of an asset never change once
+    created, so a compiled pack can be reused until a new version is
+    deployed, which changes the key.
+
+    Entries are stored pickled: their size counts towards
+    `settings.FORMPACK_CACHE_MAX_SIZE` (in bytes) and every `get()` returns a
+    fresh copy, which callers are free to alter. When
+    `settings.FORMPACK_CACHE_USE_SHARED_CACHE` is `True`, entries are also
+    stored in the default Django cache (e.g. Redis or memcached) to be shared
+    between processes.
+    """
+
+    KEY_PREFIX = 'formpack'
+
+    _entries = OrderedDict()
+    _lock = threading.Lock()
+    _size = 0
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries.clear()
+            cls._size = 0
+
+    @classmethod
+    def get(cls, key: str) -> Optional[tuple]:
+        with cls._lock:
+            value = cls._entries.get(key)
+            if value is not None:
+                cls._entries.move_to_end(key)
+
+        if value is None and settings.FORMPACK_CACHE_USE_SHARED_CACHE:
+            value = cache.get(key)
+            if value is not None:
+                cls._store_locally(key, value)
+
+        if value is None:
+            return None
+
+        return pickle.loads(value)
+
+    @classmethod
+    def get_key(cls, title: str, versions: Iterable) -> str:
+        """
+        Return a key for a pack built with `title` from `versions`, an
+        iterable of tuples of the uid, uid aliases and reversion id of each
+        version, newest first
+        """
+        versions_hash = md5(
+            repr((title, tuple(tuple(v) for v in versions))).encode()
+        ).hexdigest()
+        return f'{cls.KEY_PREFIX}:{versions_hash}'
+
+    @classmethod
+    def set(cls, key: str, value: tuple):
+        if not settings.FORMPACK_CACHE_MAX_SIZE:
+            return
+
+        try:
+            value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            logging.warning(f'Cannot cache formpack: {repr(e)}')
+            return
+
+        cls._store_locally(key, value)
+        if settings.FORMPACK_CACHE_USE_SHARED_CACHE:
+            cache.set(key, value, settings.FORMPACK_CACHE_TIMEOUT)
+
+    @classmethod
+    def _store_locally(cls, key: str, value: bytes):
+        max_size = settings.FORMPACK_CACHE_MAX_SIZE
+        if len(value) > max_size:
+            return
+
+        with cls._lock:
+            previous_value = cls._entries.pop(key, None)
+            if previous_value is not None:
+                cls._size -= len(previous_value)
+
+            cls._entries[key] = value
+            cls._size += len(value)
+            # Evict the least recently used entries
+            while cls._size > max_size:
+                _, evicted_value = cls._entries.popitem(last=False)
+                cls._size -= len(evicted_value)
@@ -0,0 +1,325 @@
+# coding: utf-8
+import json
+import re
+from hashlib import md5
+from typing import BinaryIO, Generator, Iterable, Optional
+
+# Submission attributes whose change must invalidate an already-rendered
+# export row. KoBoCAT assigns a new `instanceID` on every edit; validation
+# statuses, notes and tags are updated in place and are exported as
+# `ExportTask.COPY_FIELDS`
+FINGERPRINT_FIELDS = (
+    '_uuid',
+    'meta/instanceID',
+    '_validation_status',
+    '_notes',
+    '_tags',
+)
+
+# formpack quotes every CSV field and doubles quotes inside them
+CSV_FIELD_PATTERN = re.compile(rb'"(?:[^"]|"")*"')
+CSV_INDEX_FIELD = b'"_index"'
+GEOJSON_SEPARATOR = b','
+GEOJSON_STRIPPED_CHARACTERS = b', \t\r\n'
+
+
+def get_fingerprint(
+    submission: dict, fields: tuple = FINGERPRINT_FIELDS
+) -> str:
+    """
+    Return a short digest of the attributes listed in `fields` (defaults to
+    `FINGERPRINT_FIELDS`) for `submission`
+    """
+    values = [submission.get(field) for field in fields]
+    return md5(
+        json.dumps(values, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class ExportChunkRecorder:
+    """
+    Keep track of which bytes of a formpack export belong to which
+    submission. Chunks are written to `chunk_file` (see `write_chunks()`) as
+    soon as they are complete.
+
+    formpack consumes the submission stream lazily, one submission at a time,
+    and yields every line of a submission before requesting the next one.
+    Thus, everything written between two requests of the (wrapped) stream
+    belongs to the submission requested first. Bytes written before the first
+    submission is requested form the header; bytes written once the stream is
+    exhausted form the footer.
+    """
+
+    def __init__(self, output_file: BinaryIO, chunk_file: BinaryIO):
+        self.footer_offset = None
+        self.header_length = 0
+        self._chunk_file = chunk_file
+        self._current_chunk = None
+        self._offset = 0
+        self._output_file = output_file
+
+    def wrap(self, submission_stream: Iterable) -> Generator:
+        for submission in submission_stream:
+            self._flush_current_chunk()
+            # `[_id, fingerprint, offset, length]`, see `write_chunks()`
+            self._current_chunk = [
+                submission['_id'],
+                get_fingerprint(submission),
+                self._offset,
+                0,
+            ]
+            yield submission
+
+        self._flush_current_chunk()
+        self.footer_offset = self._offset
+
+    def write(self, data: bytes):
+        self._output_file.write(data)
+        self._offset += len(data)
+        if self._current_chunk is not None:
+            self._current_chunk[3] += len(data)
+        elif self.footer_offset is None:
+            self.header_length += len(data)
+
+    def _flush_current_chunk(self):
+        if self._current_chunk is not None:
+            write_chunks(self._chunk_file, [self._current_chunk])
+            self._current_chunk = None
+
+
+class ExportChunkWriter:
+    """
+    Write chunks recorded by `ExportChunkRecorder`, possibly read from
+    different files, one after the other. `_index` values are renumbered (the
+    CSV column is found in `header`, see `get_csv_index_column()`) and, if
+    `chunk_file` is provided, the new position of each chunk is written to it
+    (see `write_chunks()`).
+    """
+
+    def __init__(
+        self,
+        export_type: str,
+        output_file: BinaryIO,
+        offset: int = 0,
+        chunk_file: Optional[BinaryIO] = None,
+        header: bytes = b'',
+    ):
+        self._chunk_file = chunk_file
+        self._csv_index_column = (
+            get_csv_index_column(header) if export_type == 'csv' else None
+        )
+        self._export_type = export_type
+        self._first_offset = offset
+        self._offset = offset
+        self._output_file = output_file
+        self._position = 0
+
+    def write(self, source_file: BinaryIO, chunk: list):
+        id_, fingerprint, chunk_offset, length = chunk
+        source_file.seek(chunk_offset)
+        data = normalize_chunk(self._export_type, source_file.read(length))
+        self._position += 1
+        data = renumber_chunk(
+            self._export_type, data, self._position, self._csv_index_column
+        )
+        if (
+            data
+            and self._export_type == 'geojson'
+            and self._offset != self._first_offset
+        ):
+            data = GEOJSON_SEPARATOR + data
+
+        self._output_file.write(data)
+        if self._chunk_file is not None:
+            write_chunks(
+                self._chunk_file, [[id_, fingerprint, self._offset, len(data)]]
+            )
+        self._offset += len(data)
+
+
+def normalize_chunk(export_type: str, chunk: bytes) -> bytes:
+    """
+    Remove the feature separators formpack writes around the GeoJSON features
+    of a submission, since they depend on the position of the submission in
+    the export
+    """
+    if export_type == 'geojson':
+        return chunk.strip(GEOJSON_STRIPPED_CHARACTERS)
+    return chunk
+
+
+def get_csv_index_column(header: bytes) -> Optional[int]:
+    """
+    Return the position of the `_index` column (see `force_index` in formpack)
+    in the first line of the CSV `header`, or `None` if there is none
+    """
+    for position, match in enumerate(CSV_FIELD_PATTERN.finditer(header)):
+        if b'\n' in header[:match.start()]:
+            break
+        if match.group() == CSV_INDEX_FIELD:
+            return position
+    return None
+
+
+def renumber_chunk(
+    export_type: str,
+    chunk: bytes,
+    index: int,
+    csv_index_column: Optional[int] = None,
+) -> bytes:
+    """
+    Replace the `_index` value (see `force_index` in formpack) rendered in
+    `chunk` with `index`. CSV values are only replaced in the
+    `csv_index_column` field of each line
+    """
+    if export_type == 'csv':
+        if csv_index_column is None:
+            return chunk
+        return _renumber_csv_chunk(chunk, index, csv_index_column)
+
+    if export_type == 'geojson' and b'"_index"' in chunk:
+        features = json.loads(b'[' + chunk + b']')
+        for feature in features:
+            properties = feature.get('properties') or {}
+            if '_index' in properties:
+                properties['_index'] = index
+        return GEOJSON_SEPARATOR.join(
+            json.dumps(feature).encode() for feature in features
+        )
+
+    return chunk
+
+
+def _renumber_csv_chunk(chunk: bytes, index: int, column: int) -> bytes:
+    parts = []
+    position = 0
+    previous_end = 0
+    field_position = 0
+    for match in CSV_FIELD_PATTERN.finditer(chunk):
+        if b'\n' in chunk[previous_end:match.start()]:
+            # New line
+            field_position = 0
+        if field_position == column:
+            parts.append(chunk[position:match.start()])
+            parts.append(b'"%d"' % index)
+            position = match.end()
+        field_position += 1
+        previous_end = match.end()
+
+    parts.append(chunk[position:])
+    return b''.join(parts)
+
+
+def read_chunks(chunk_file: BinaryIO) -> Generator[list, None, None]:
+    """
+    Yield the chunks written to `chunk_file` by `write_chunks()`
+    """
+    for line in chunk_file:
+        id_, fingerprint, offset, length = line.split(b'\t')
+        yield [int(id_), fingerprint.decode(), int(offset), int(length)]
+
+
+def read_index(index_file: BinaryIO) -> (dict, Generator[list, None, None]):
+    """
+    Return the metadata and an iterator over the chunks of an index written by
+    `write_index()`
+    """
+    metadata = json.loads(index_file.readline())
+    return metadata, read_chunks(index_file)
+
+
+def write_chunks(chunk_file: BinaryIO, chunks: Iterable):
+    """
+    Write one tab-separated line per chunk: `_id`, fingerprint, offset and
+    length
+    """
+    for id_, fingerprint, offset, length in chunks:
+        chunk_file.write(
+            f'{id_}\t{fingerprint}\t{offset}\t{length}\n'.encode()
+        )
+
+
+def write_index(index_file: BinaryIO, metadata: dict, chunks: Iterable):
+    """
+    Write `metadata` as a JSON line followed by the lines of `write_chunks()`
+    """
+    index_file.write(json.dumps(metadata).encode() + b'\n')
+    write_chunks(index_file, chunks)
+
+
+def merge_sorted_chunks(
+    kept_chunks: Iterable, new_chunks: Iterable
+) -> Generator[tuple, None, None]:
+    """
+    Merge two iterables of chunks sorted by submission id. Yield tuples of
+    `(is_new, chunk)`. When both contain the same submission id, the new chunk
+    wins.
+    """
+    kept_iterator = iter(kept_chunks)
+    new_iterator = iter(new_chunks)
+    kept_chunk = next(kept_iterator, None)
+    new_chunk = next(new_iterator, None)
+
+    while kept_chunk is not None or new_chunk is not None:
+        if new_chunk is None or (
+            kept_chunk is not None and kept_chunk[0] < new_chunk[0]
+        ):
+            yield False, kept_chunk
+            kept_chunk = next(kept_iterator, None)
+            continue
+
+        if kept_chunk is not None and kept_chunk[0] == new_chunk[0]:
+            kept_chunk = next(kept_iterator, None)
+
+        yield True, new_chunk
+        new_chunk = next(new_iterator, None)
+
+
+def diff_submissions(
+    previous_chunks: Iterable,
+    current_fingerprints: Iterable,
+    kept_chunk_file: BinaryIO,
+) -> (list, Optional[int]):
+    """
+    Compare the chunks of a previous export with the current
+    `(_id, fingerprint)` pairs, both sorted by submission id. The previous
+    chunks which are still valid are written to `kept_chunk_file` (see
+    `write_chunks()`); chunks of deleted submissions are simply dropped.
+
+    Return a tuple of
+        - the ids of submissions which must be rendered again (edited, or
+          not part of the previous export even though they are older);
+        - the greatest submission id of the previous export. Every submission
+          above it is new.
+    """
+    changed_ids = []
+    previous_iterator = iter(previous_chunks)
+    previous_chunk = next(previous_iterator, None)
+    max_previous_id = None
+
+    for id_, fingerprint in current_fingerprints:
+        while previous_chunk is not None and previous_chunk[0] < id_:
+            # Deleted (or not accessible anymore)
+            max_previous_id = previous_chunk[0]
+            previous_chunk = next(previous_iterator, None)
+
+        if previous_chunk is not None and previous_chunk[0] == id_:
+            max_previous_id = id_
+            if previous_chunk[1] == fingerprint:
+                write_chunks(kept_chunk_file, [previous_chunk])
+            else:
+                changed_ids.append(id_)
+            previous_chunk = next(previous_iterator, None)
+        elif previous_chunk is not None or (
+            max_previous_id is not None and id_ <= max_previous_id
+        ):
+            # Older than the last submission of the previous export but not
+            # part of it
+            changed_ids.append(id_)
+
+    if previous_chunk is not None:
+        max_previous_id = previous_chunk[0]
+    for previous_chunk in previous_iterator:
+        max_previous_id = previous_chunk[0]
+
+    return changed_ids, max_previous_id
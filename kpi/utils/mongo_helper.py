@@ -5,6 +5,7 @@ from django.conf import settings
 
 from kpi.constants import NESTED_MONGO_RESERVED_ATTRIBUTES
 from kpi.utils.strings import base64_encodestring
+from kpi.utils.submission_count_cache import SubmissionCountCache
 
 
 def drop_mock_only(func):
@@ -114,13 +115,15 @@ class MongoHelper:
         query=None,
         submission_ids=None,
         permission_filters=None,
+        skip_count=False,
     ):
         cursor, total_count = cls._get_cursor_and_count(
             mongo_userform_id,
             fields=fields,
             query=query,
             submission_ids=submission_ids,
-            permission_filters=permission_filters)
+            permission_filters=permission_filters,
+            skip_count=skip_count)
 
         cursor.skip(start)
         if limit is not None:
@@ -130,13 +133,74 @@ class MongoHelper:
             sort = MongoHelper.to_safe_dict(sort, reading=True)
             sort_key = list(sort.keys())[0]
             sort_dir = int(sort[sort_key])  # -1 for desc, 1 for asc
-            cursor.sort(sort_key, sort_dir)
+            sort_keys = [(sort_key, sort_dir)]
+            if sort_key != '_id':
+                # Break ties to keep the order stable between pages
+                sort_keys.append(('_id', sort_dir))
+            cursor.sort(sort_keys)
 
         # set batch size
         cursor.batch_size = cls.DEFAULT_BATCHSIZE
 
         return cursor, total_count
 
+    @classmethod
+    def get_value_counts(
+        cls,
+        mongo_userform_id,
+        fields,
+        query=None,
+        submission_ids=None,
+        permission_filters=None,
+    ):
+        """
+        Count the submissions matching the query for each value of each of
+        `fields` with a single aggregation, so that only the counts are sent
+        back by Mongo.
+
+        Return a dictionary of each field to a list of `(value, count)`
+        tuples. Values are `None` for submissions that do not contain the
+        field.
+        """
+        if not fields:
+            return {}
+
+        query = cls._get_query(
+            mongo_userform_id,
+            query=query or {},
+            submission_ids=submission_ids or [],
+            permission_filters=permission_filters,
+        )
+
+        # `$facet` runs one `$group` per field over the same documents. Facet
+        # names cannot contain dots, use the positions of fields instead.
+        # Missing values are grouped under `None`.
+        facets = {}
+        for index, field in enumerate(fields):
+            facets[str(index)] = [
+                {
+                    '$group': {
+                        '_id': {'$ifNull': [f'${cls.encode(field)}', None]},
+                        'count': {'$sum': 1},
+                    }
+                }
+            ]
+
+        cursor = settings.MONGO_DB.instances.aggregate(
+            [{'$match': query}, {'$facet': facets}],
+            allowDiskUse=True,
+            maxTimeMS=settings.MONGO_DB_MAX_TIME_MS,
+        )
+        results = next(cursor, {})
+
+        value_counts = {}
+        for index, field in enumerate(fields):
+            value_counts[field] = [
+                (result['_id'], result['count'])
+                for result in results.get(str(index), [])
+            ]
+        return value_counts
+
     @classmethod
     def is_attribute_invalid(cls, key: str) -> str:
         """
@@ -289,8 +353,53 @@ class MongoHelper:
         query=None,
         submission_ids=None,
         permission_filters=None,
+        skip_count=False,
     ):
 
+        query = cls._get_query(
+            mongo_userform_id,
+            query=query,
+            submission_ids=submission_ids,
+            permission_filters=permission_filters,
+        )
+
+        if len(fields) > 0:
+            # Retrieve only specified fields from Mongo. Remove
+            # `cls.USERFORM_ID` from those fields in case users try to add it.
+            if cls.USERFORM_ID in fields:
+                fields.remove(cls.USERFORM_ID)
+            fields_to_select = dict(
+                [(cls.encode(field), 1) for field in fields])
+        else:
+            # Retrieve all fields except `cls.USERFORM_ID`
+            fields_to_select = {cls.USERFORM_ID: 0}
+
+        cursor = settings.MONGO_DB.instances.find(
+            query,
+            fields_to_select,
+            max_time_ms=settings.MONGO_DB_MAX_TIME_MS
+        )
+        if skip_count:
+            return cursor, None
+
+        count = SubmissionCountCache.get_or_set(
+            mongo_userform_id, query, cursor.count
+        )
+        return cursor, count
+
+    @classmethod
+    def _get_query(
+        cls,
+        mongo_userform_id,
+        query=None,
+        submission_ids=None,
+        permission_filters=None,
+    ):
+        """
+        Return the Mongo query for the submissions of `mongo_userform_id`
+        matching `query` and `submission_ids`, narrowed down with
+        `permission_filters`
+        """
         if len(submission_ids) > 0:
             query.update({
                 '_id': {cls.IN_OPERATOR: submission_ids}
@@ -316,25 +425,7 @@ class MongoHelper:
 
             query = {cls.AND_OPERATOR: [query, permission_filters_query]}
 
-        query = cls.to_safe_dict(query, reading=True)
-
-        if len(fields) > 0:
-            # Retrieve only specified fields from Mongo. Remove
-            # `cls.USERFORM_ID` from those fields in case users try to add it.
-            if cls.USERFORM_ID in fields:
-                fields.remove(cls.USERFORM_ID)
-            fields_to_select = dict(
-                [(cls.encode(field), 1) for field in fields])
-        else:
-            # Retrieve all fields except `cls.USERFORM_ID`
-            fields_to_select = {cls.USERFORM_ID: 0}
-
-        cursor = settings.MONGO_DB.instances.find(
-            query,
-            fields_to_select,
-            max_time_ms=settings.MONGO_DB_MAX_TIME_MS
-        )
-        return cursor, cursor.count()
+        return cls.to_safe_dict(query, reading=True)
 
     @classmethod
     def _is_attribute_encoded(cls, key):
@@ -12,6 +12,7 @@ from django_request_cache import cache_for_request
 from rest_framework import serializers
 
 from kpi.constants import PERM_MANAGE_ASSET, PERM_FROM_KC_ONLY
+from kpi.utils.permission_cache import PermissionCache
 from kpi.utils.permissions import is_user_anonymous
 
 
@@ -31,7 +32,7 @@ def get_all_objects_for_user(user, klass):
 def get_cached_code_names(model_: models.Model = None) -> dict:
     """
     Creates a dictionary from `auth_permission` table and saves it in cache
-    during the request life.
+    during the request life (and in `PermissionCache` if it is enabled).
     Avoids several accesses to DB to fetch permission ids (or names)
     which only change after migrations.
 
@@ -48,17 +49,23 @@ def get_cached_code_names(model_: models.Model = None) -> dict:
 
     content_type = ContentType.objects.get_for_model(model_)
 
-    records = Permission.objects.values('id', 'codename', 'name').filter(
-        content_type=content_type)
+    def _get_code_names():
+        records = Permission.objects.values('id', 'codename', 'name').filter(
+            content_type=content_type)
 
-    perm_ids_from_code_names = defaultdict(dict)
-    for record in records:
-        perm_ids_from_code_names[record['codename']] = {
-            'id': record['id'],
-            'name': record['name']
-        }
+        perm_ids_from_code_names = defaultdict(dict)
+        for record in records:
+            perm_ids_from_code_names[record['codename']] = {
+                'id': record['id'],
+                'name': record['name']
+            }
 
-    return perm_ids_from_code_names
+        return perm_ids_from_code_names
+
+    # Also share them between requests
+    return PermissionCache.get_or_set_code_names(
+        content_type.pk, _get_code_names
+    )
 
 
 @cache_for_request
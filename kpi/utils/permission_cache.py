@@ -0,0 +1,133 @@
+# coding: utf-8
+from typing import Callable, Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+class PermissionCache:
+    """
+    Cache of the permissions assigned on assets, shared between requests.
+
+    Entries are cached either for an asset or for a user, and their keys are
+    versioned: each asset and each user has its own version, bumped by
+    `invalidate()` whenever their `ObjectPermission` or
+    `AssetUserPartialPermission` records change (see `kpi.signals`).
+    Changing a version orphans every entry cached for that asset or user at
+    once; orphaned entries simply expire.
+
+    Revoked permissions must not survive in other processes, so the cache
+    back end has to be shared between them (e.g. Redis or memcached): the
+    cache is disabled unless `settings.PERMISSION_CACHE_TIMEOUT` is set.
+    """
+
+    KEY_PREFIX = 'permissions'
+    ASSET = 'asset'
+    USER = 'user'
+    # Versions must outlive the entries they validate
+    VERSION_TIMEOUT = None
+
+    @classmethod
+    def get_or_set_for_asset(cls, asset_id: int, name: str, func: Callable):
+        """
+        Return the value cached as `name` for `asset_id`. `func` is called
+        to get the actual value on cache misses.
+        """
+        return cls._get_or_set(cls.ASSET, asset_id, name, func)
+
+    @classmethod
+    def get_or_set_for_user(cls, user_id: int, name: str, func: Callable):
+        """
+        Return the value cached as `name` for `user_id`. `func` is called
+        to get the actual value on cache misses.
+        """
+        return cls._get_or_set(cls.USER, user_id, name, func)
+
+    @classmethod
+    def get_or_set_code_names(cls, content_type_id: int, func: Callable):
+        """
+        Return the cached code names of the permissions of `content_type_id`.
+        They only change with migrations, hence no invalidation.
+        """
+        timeout = settings.PERMISSION_CACHE_TIMEOUT
+        if not timeout:
+            return func()
+
+        return cache.get_or_set(
+            f'{cls.KEY_PREFIX}:code_names:{content_type_id}', func, timeout
+        )
+
+    @classmethod
+    def get_user_versions(cls, user_ids: Iterable) -> list:
+        """
+        Return the current versions of the permissions of `user_ids`. They
+        change whenever these permissions do, so they can be used to
+        validate anything derived from them.
+        """
+        version_keys = [
+            cls._get_version_key(cls.USER, user_id) for user_id in user_ids
+        ]
+        versions = cache.get_many(version_keys)
+        return [versions.get(key, 0) for key in version_keys]
+
+    @classmethod
+    def invalidate(cls, asset_id: int = None, user_id: int = None):
+        """
+        Invalidate every entry cached for `asset_id` and `user_id`
+        """
+        cls.invalidate_many(
+            asset_ids=[] if asset_id is None else [asset_id],
+            user_ids=[] if user_id is None else [user_id],
+        )
+
+    @classmethod
+    def invalidate_many(
+        cls, asset_ids: Iterable = (), user_ids: Iterable = ()
+    ):
+        """
+        Invalidate every entry cached for `asset_ids` and `user_ids`. Versions
+        are bumped again when the current transaction commits, in case
+        another request cached permissions from the database state preceding
+        the commit in the meantime.
+        """
+        version_keys = [
+            cls._get_version_key(cls.ASSET, asset_id) for asset_id in asset_ids
+        ] + [
+            cls._get_version_key(cls.USER, user_id) for user_id in user_ids
+        ]
+        if not version_keys:
+            return
+
+        cls._bump_versions(version_keys)
+        transaction.on_commit(lambda: cls._bump_versions(version_keys))
+
+    @classmethod
+    def _bump_versions(cls, version_keys: list):
+        for version_key in version_keys:
+            try:
+                cache.incr(version_key)
+            except ValueError:
+                # The key does not exist (yet)
+                cache.set(version_key, 1, cls.VERSION_TIMEOUT)
+
+    @classmethod
+    def _get_or_set(cls, scope: str, id_: int, name: str, func: Callable):
+        timeout = settings.PERMISSION_CACHE_TIMEOUT
+        if not timeout:
+            return func()
+
+        version = cache.get(cls._get_version_key(scope, id_), 0)
+        key = f'{cls.KEY_PREFIX}:{scope}:{id_}:{version}:{name}'
+        # Values are wrapped in a tuple to tell cached `None` from misses
+        cached = cache.get(key)
+        if cached is not None:
+            return cached[0]
+
+        value = func()
+        cache.set(key, (value,), timeout)
+        return value
+
+    @classmethod
+    def _get_version_key(cls, scope: str, id_: int) -> str:
+        return f'{cls.KEY_PREFIX}:version:{scope}:{id_}'
@@ -1,11 +1,11 @@
 # coding: utf-8
+import copy
 import operator
 from collections import defaultdict
 from distutils import util
-from functools import reduce
+from functools import lru_cache, reduce
 
 from django.db.models import Q
-from django_request_cache import cache_for_request
 
 from kpi.exceptions import SearchQueryTooShortException
 from .canopy_autogenerated_parser import parse as grammar_parse
@@ -33,6 +33,8 @@ Special notes:
 
 
 MINIMUM_DEFAULT_SEARCH_CHARACTERS = 3
+# Number of parsed queries kept by `parse()`
+PARSE_CACHE_MAX_SIZE = 1024
 
 
 class QueryParseActions:
@@ -121,15 +123,22 @@ class QueryParseActions:
         return ~exp
 
     def term(self, text, a, b, elements):
-
-        def _get_value(_field, _elements):
+        if elements[0].text == '':
+            field = None
+        else:
+            # A field+colon, and a value [[field,':'],value]
+            field = elements[0].elements[0]
+        return self.build_term(field, elements[1])
+
+    def build_term(self, field, value):
+        """
+        Build the `Q` object of a search term. `field` is `None` if the term
+        does not specify one.
+        """
+        if field is None:
             # A search term by itself without a specified field
-            _value = _elements[1]
             # the `field` value is not used in `process_value()`
-            return self.process_value(_field, _value)
-
-        if elements[0].text == '':
-            value = _get_value('', elements)
+            value = self.process_value('', value)
 
             # As discussed here: https://github.com/kobotoolbox/kpi/pull/2830
             # there strain on the server for small search queries without a
@@ -146,15 +155,13 @@ class QueryParseActions:
             # combining all the `Q` objects with an `or` operator and
             # returning the result
             return reduce(operator.or_, q_list)
-        else:
-            # A field+colon, and a value [[field,':'],value]
-            field = elements[0].elements[0]
-            # ByPass `status` field because it does not really exist.
-            # It's only a property of Asset model.
-            if field == 'status':
-                return Q()
 
-        value = _get_value(field, elements)
+        # ByPass `status` field because it does not really exist.
+        # It's only a property of Asset model.
+        if field == 'status':
+            return Q()
+
+        value = self.process_value(field, value)
         return Q(**{field: value})
 
     @staticmethod
@@ -195,7 +202,6 @@ def get_parsed_parameters(parsed_query: Q) -> dict:
     return dict(parameters)
 
 
-@cache_for_request
 def parse(query: str, default_field_lookups: list) -> Q:
     """
     Parse a Boolean query string into a Django Q object.
@@ -204,5 +210,13 @@ def parse(query: str, default_field_lookups: list) -> Q:
     `summary__icontains` and `name__icontains`, then the query `term` returns
     any object whose `summary` or `name` field contains `term` (case
     insensitive)
+
+    Parsed queries are kept in a process-wide LRU cache, since the same
+    queries are repeated over and over. Callers get their own copy.
     """
+    return copy.deepcopy(_parse(query, tuple(default_field_lookups)))
+
+
+@lru_cache(maxsize=PARSE_CACHE_MAX_SIZE)
+def _parse(query: str, default_field_lookups: tuple) -> Q:
     return grammar_parse(query, QueryParseActions(default_field_lookups))
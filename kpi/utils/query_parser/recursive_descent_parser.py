@@ -0,0 +1,159 @@
+# coding: utf-8
+"""
+Hand-written recursive descent parser for the grammar in `grammar.peg`.
+
+It follows the PEG semantics of the parser generated by canopy (ordered
+choices, greedy repetitions without backtracking, `!"OR"` look-ahead) and
+builds the same `Q` objects through `QueryParseActions.build_term()`, but
+it does not build an intermediate tree nor memoize every rule at every
+offset. See the `benchmark_query_parser` management command, which compares
+both parsers.
+"""
+import re
+
+from django.db.models import Q
+
+from .canopy_autogenerated_parser import ParseError
+from .query_parser import QueryParseActions
+
+
+_NAME = re.compile(r'[a-zA-Z_][a-zA-Z0-9\-_]*')
+_WHITESPACES = re.compile(r'\s*')
+_WORD = re.compile(r'[^\s():]+')
+
+
+class RecursiveDescentParser:
+
+    def __init__(self, query: str, actions: QueryParseActions):
+        self._query = query
+        self._actions = actions
+
+    def parse(self) -> Q:
+        # query <- _* exp? _*
+        result = self._read_exp(self._skip_whitespaces(0))
+        if result is None:
+            q_obj, offset = Q(), 0
+        else:
+            q_obj, offset = result
+        offset = self._skip_whitespaces(offset)
+        if offset != len(self._query):
+            raise ParseError(
+                f'Unexpected input at offset {offset}: '
+                f'{self._query[offset:offset + 20]!r}'
+            )
+        return q_obj
+
+    def _read_exp(self, offset: int):
+        # exp <- andexp (_+ "OR" _+ andexp)*
+        result = self._read_andexp(offset)
+        if result is None:
+            return None
+        q_obj, offset = result
+        while True:
+            next_offset = self._read_whitespaces(offset)
+            if next_offset is None or not self._query.startswith(
+                'OR', next_offset
+            ):
+                break
+            next_offset = self._read_whitespaces(next_offset + 2)
+            if next_offset is None:
+                break
+            result = self._read_andexp(next_offset)
+            if result is None:
+                break
+            q_obj |= result[0]
+            offset = result[1]
+        return q_obj, offset
+
+    def _read_andexp(self, offset: int):
+        # andexp <- groupexp ((_+ "AND")? _+ !"OR" groupexp)*
+        result = self._read_groupexp(offset)
+        if result is None:
+            return None
+        q_obj, offset = result
+        while True:
+            next_offset = offset
+            and_offset = self._read_whitespaces(offset)
+            if and_offset is not None and self._query.startswith(
+                'AND', and_offset
+            ):
+                next_offset = and_offset + 3
+            next_offset = self._read_whitespaces(next_offset)
+            if next_offset is None or self._query.startswith(
+                'OR', next_offset
+            ):
+                break
+            result = self._read_groupexp(next_offset)
+            if result is None:
+                break
+            q_obj &= result[0]
+            offset = result[1]
+        return q_obj, offset
+
+    def _read_groupexp(self, offset: int):
+        # groupexp <- "NOT" _+ groupexp / "(" _* exp _* ")" / term
+        if self._query.startswith('NOT', offset):
+            next_offset = self._read_whitespaces(offset + 3)
+            if next_offset is not None:
+                result = self._read_groupexp(next_offset)
+                if result is not None:
+                    return ~result[0], result[1]
+
+        if self._query.startswith('(', offset):
+            result = self._read_exp(self._skip_whitespaces(offset + 1))
+            if result is not None:
+                next_offset = self._skip_whitespaces(result[1])
+                if self._query.startswith(')', next_offset):
+                    return result[0], next_offset + 1
+
+        return self._read_term(offset)
+
+    def _read_term(self, offset: int):
+        # term <- (name ":")? value
+        field = None
+        match = _NAME.match(self._query, offset)
+        if match and self._query.startswith(':', match.end()):
+            field = match.group()
+            offset = match.end() + 1
+
+        result = self._read_value(offset)
+        if result is None:
+            return None
+        value, offset = result
+        return self._actions.build_term(field, value), offset
+
+    def _read_value(self, offset: int):
+        # value <- string / word
+        query = self._query
+        if offset < len(query) and query[offset] in ('"', "'"):
+            quote = query[offset]
+            index = offset + 1
+            while index < len(query):
+                char = query[index]
+                if char == quote:
+                    return query[offset + 1:index], index + 1
+                if char == '\\' and index + 1 < len(query):
+                    index += 2
+                else:
+                    index += 1
+            # Unterminated strings are read as words
+
+        match = _WORD.match(query, offset)
+        if match is None:
+            return None
+        return match.group(), match.end()
+
+    def _read_whitespaces(self, offset: int):
+        # _+
+        end = self._skip_whitespaces(offset)
+        return end if end > offset else None
+
+    def _skip_whitespaces(self, offset: int) -> int:
+        # _*
+        return _WHITESPACES.match(self._query, offset).end()
+
+
+def parse(query: str, default_field_lookups: list) -> Q:
+    return RecursiveDescentParser(
+        query, QueryParseActions(default_field_lookups)
+    ).parse()
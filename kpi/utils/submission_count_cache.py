@@ -0,0 +1,124 @@
+# coding: utf-8
+import json
+from hashlib import md5
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class SubmissionCountCache:
+    """
+    Cache the number of submissions matching a Mongo query.
+
+    Keys are versioned: each userform has its own version, bumped by
+    `invalidate()` whenever its submissions are added, edited or deleted
+    through a deployment back end. Changing the version orphans every count
+    cached for that userform at once; orphaned entries simply expire.
+    Submissions can also be added directly to KoBoCAT, without KPI being
+    notified, so counts never outlive
+    `settings.SUBMISSION_COUNT_CACHE_TIMEOUT`.
+
+    The cache is disabled unless `settings.SUBMISSION_COUNT_CACHE_TIMEOUT`
+    is set, which requires a cache back end shared by every process.
+
+    Hits and misses are counted in the cache as well (see `get_stats()`).
+    With a cache local to each process (e.g. the default local-memory
+    cache), they only cover the current process.
+    """
+
+    KEY_PREFIX = 'submission_count'
+    HITS_KEY = f'{KEY_PREFIX}:hits'
+    MISSES_KEY = f'{KEY_PREFIX}:misses'
+    # Versions must outlive the counts they validate
+    VERSION_TIMEOUT = None
+
+    @classmethod
+    def get_or_set(
+        cls, mongo_userform_id: str, query: dict, count_func: Callable
+    ) -> int:
+        """
+        Return the cached count of submissions of `mongo_userform_id` for
+        `query`, which must be the final Mongo query (i.e. narrowed down with
+        submission ids and permission filters). `count_func` is called to get
+        the actual count on cache misses.
+        """
+        timeout = settings.SUBMISSION_COUNT_CACHE_TIMEOUT
+        if not timeout:
+            return count_func()
+
+        key = cls._get_key(mongo_userform_id, query)
+        count = cache.get(key)
+        if count is not None:
+            cls._increment(cls.HITS_KEY)
+            return count
+
+        cls._increment(cls.MISSES_KEY)
+        count = count_func()
+        cache.set(key, count, timeout)
+        return count
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        stats = cache.get_many([cls.HITS_KEY, cls.MISSES_KEY])
+        return {
+            'hits': stats.get(cls.HITS_KEY, 0),
+            'misses': stats.get(cls.MISSES_KEY, 0),
+        }
+
+    @classmethod
+    def get_version(cls, mongo_userform_id: str) -> str:
+        """
+        Return the current version of the counts of `mongo_userform_id`. It
+        changes whenever they are invalidated, so it can be used to detect
+        changes to submissions.
+        """
+        global_version_key = cls._get_version_key()
+        version_key = cls._get_version_key(mongo_userform_id)
+        versions = cache.get_many([global_version_key, version_key])
+        return '{}.{}'.format(
+            versions.get(global_version_key, 0), versions.get(version_key, 0)
+        )
+
+    @classmethod
+    def invalidate(cls, mongo_userform_id: str = None):
+        """
+        Invalidate the counts of `mongo_userform_id`, or every count if
+        `mongo_userform_id` is not provided
+        """
+        version_key = cls._get_version_key(mongo_userform_id)
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            # The key does not exist (yet)
+            cache.set(version_key, 1, cls.VERSION_TIMEOUT)
+
+    @classmethod
+    def reset_stats(cls):
+        cache.delete_many([cls.HITS_KEY, cls.MISSES_KEY])
+
+    @classmethod
+    def _get_key(cls, mongo_userform_id: str, query: dict) -> str:
+        query_hash = md5(
+            json.dumps(query, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        return ':'.join([
+            cls.KEY_PREFIX,
+            mongo_userform_id,
+            cls.get_version(mongo_userform_id),
+            query_hash,
+        ])
+
+    @classmethod
+    def _get_version_key(cls, mongo_userform_id: str = None) -> str:
+        if mongo_userform_id is None:
+            return f'{cls.KEY_PREFIX}:version'
+        return f'{cls.KEY_PREFIX}:version:{mongo_userform_id}'
+
+    @staticmethod
+    def _increment(key: str):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 0, None)
+            cache.incr(key)
@@ -1,9 +1,133 @@
 # coding: utf-8
 import re
-from typing import Optional, Union
+from functools import lru_cache
+from typing import Iterable, Optional, Union
+
 from lxml import etree
 
 
+class NodeFilter:
+    """
+    Compiled version of the nodes to keep in XML documents, to strip many
+    documents the same way (see `strip_nodes()`).
+
+    With `use_xpath=True`, `nodes_to_keep` are paths of nodes relative to the
+    root node (e.g. `group/question`). They are compiled into a trie of node
+    names which documents are walked along in a single pass, without
+    computing the path of every node. Otherwise, `nodes_to_keep` are node
+    names, wherever these nodes are.
+
+    Nodes to keep are kept with their descendants and their ancestors. Any
+    other node is removed.
+    """
+
+    # Marks the end of an xpath in the trie: the whole subtree is kept.
+    # Node names cannot contain slashes.
+    KEEP_SUBTREE = '/'
+
+    def __init__(self, nodes_to_keep: Iterable[str], use_xpath: bool = False):
+        self._names = None
+        self._trie = None
+        if not nodes_to_keep:
+            # Keep everything
+            return
+
+        if not use_xpath:
+            self._names = set(nodes_to_keep)
+            return
+
+        self._trie = {}
+        for xpath in nodes_to_keep:
+            trie_node = self._trie
+            for name in xpath.strip('/').split('/'):
+                if self.KEEP_SUBTREE in trie_node:
+                    # A shorter xpath already keeps this subtree
+                    break
+                trie_node = trie_node.setdefault(name, {})
+            else:
+                # Replace the last node, its children do not matter anymore
+                trie_node.clear()
+                trie_node[self.KEEP_SUBTREE] = True
+
+    def strip(
+        self,
+        source: Union[str, bytes],
+        xml_declaration: bool = False,
+        rename_root_node_to: Optional[str] = None,
+    ) -> str:
+        """
+        Returns a stripped version of `source`. If `rename_root_node_to` is
+        provided, the root node will be renamed to the value of that parameter
+        in the returned XML string.
+        """
+        # Force `source` to be bytes in case it contains an XML declaration
+        # `etree` does not support strings with xml declarations.
+        if isinstance(source, str):
+            source = source.encode()
+
+        root_element = etree.fromstring(source)
+        if self._trie is not None:
+            self._prune_by_xpath(root_element, self._trie)
+        elif self._names is not None and (
+            self._get_name(root_element) not in self._names
+        ):
+            self._prune_by_name(root_element)
+
+        if rename_root_node_to:
+            root_element.tag = rename_root_node_to
+
+        return etree.tostring(
+            etree.ElementTree(root_element),
+            pretty_print=True,
+            encoding='utf-8',
+            xml_declaration=xml_declaration,
+        ).decode()
+
+    @staticmethod
+    def _get_name(node: etree._Element) -> Optional[str]:
+        if not isinstance(node.tag, str):
+            # Comments and processing instructions
+            return None
+        return etree.QName(node).localname
+
+    def _prune_by_name(self, node: etree._Element) -> bool:
+        """
+        Remove the children of `node` which are not to be kept, nor have
+        descendants to keep. Return whether any child is kept.
+        """
+        keep_node = False
+        for child in list(node):
+            if self._get_name(child) in self._names or self._prune_by_name(
+                child
+            ):
+                keep_node = True
+            else:
+                node.remove(child)
+        return keep_node
+
+    def _prune_by_xpath(self, node: etree._Element, trie_node: dict) -> bool:
+        """
+        Remove the children of `node` whose path does not lead (nor belong)
+        to the xpaths of `trie_node`. Return whether any child is kept.
+        """
+        keep_node = False
+        for child in list(node):
+            child_trie_node = trie_node.get(self._get_name(child))
+            if child_trie_node is not None and (
+                self.KEEP_SUBTREE in child_trie_node
+                or self._prune_by_xpath(child, child_trie_node)
+            ):
+                keep_node = True
+            else:
+                node.remove(child)
+        return keep_node
+
+
+@lru_cache(maxsize=128)
+def get_node_filter(nodes_to_keep: tuple, use_xpath: bool) -> NodeFilter:
+    return NodeFilter(nodes_to_keep, use_xpath)
+
+
 def strip_nodes(
     source: Union[str, bytes],
     nodes_to_keep: list,
@@ -13,123 +137,37 @@ def strip_nodes(
 ) -> str:
     """
     Returns a stripped version of `source`. It keeps only nodes provided in
-    `nodes_to_keep`.
+    `nodes_to_keep` (see `NodeFilter`).
     If `rename_root_node_to` is provided, the root node will be renamed to the
     value of that parameter in the returned XML string.
-    """
-    # Force `source` to be bytes in case it contains an XML declaration
-    # `etree` does not support strings with xml declarations.
-    if isinstance(source, str):
-        source = source.encode()
-
-    # Build xml to be parsed
-    xml_doc = etree.fromstring(source)
-    tree = etree.ElementTree(xml_doc)
-    root_element = tree.getroot()
-    root_path = tree.getpath(root_element)
-
-    def get_xpath_matches():
-        if use_xpath:
-            xpaths_ = []
-            for xpath_ in nodes_to_keep:
-                xpaths_.append(f"/{xpath_.strip('/')}/")
-            return xpaths_
-
-        xpath_matches = []
-        # Retrieve XPaths of all nodes we need to keep
-        for node_to_keep in nodes_to_keep:
-            for node in tree.iter(node_to_keep):
-                xpath_match = remove_root_path(tree.getpath(node))
-                # To make a difference between XPaths with same beginning
-                # string, we need to add a trailing slash for later comparison
-                # in `process_node()`.
-                # For example, `subgroup1` would match both `subgroup1/` and
-                # `subgroup11/`, but `subgroup1/` correctly excludes
-                # `subgroup11/`
-                xpath_matches.append(f'{xpath_match}/')
-
-        return xpath_matches
-
-    def process_node(node_: etree._Element, xpath_matches_: list):
-        """
-        `process_node()` is a recursive function.
-
-        First, it loops through all children of the root element.
-        Then for each child, it loops through its children if any, etc...
-        When all children are processed, it checks whether the node should be
-        removed or not.
-
-        The most nested children are processed first in order to know which
-        parents must be kept.
-
-        For example:
-        With `nodes_to_keep = ['question_2', 'question_3']` and this XML:
-        <root>
-          <group>
-              <question_1>Value1</question_1>
-              <question_2>Value2</question_2>
-          </group>
-          <question_3>Value3</question_3>
-        </root>
-
-         Nodes are processed in this order:
-         - `<question_1>`: Removed because not in `nodes_to_keep`
-
-         - `<question_2>`: Kept. Parent node `<group>` is tagged `do_not_delete`
-
-         - `<group>`: Kept even if it is not in `nodes_to_keep` because
-                      it is tagged `do_not_delete` by its child `<question_2>`
-
-         - `<question_3>`: Kept.
-
-        Results:
-        <root>
-          <group>
-              <question_2>Value2</question1>
-          </group>
-          <question3>Value3</question3>
-        </root>
-        """
-        for child in node_.getchildren():
-            process_node(child, xpath_matches_)
-
-        # Get XPath of current node
-        node_xpath = remove_root_path(tree.getpath(node_))
 
-        # If `node_path` does not start with one of the occurrences previously
-        # found, it must be removed.
-        if (
-            not f'{node_xpath}/'.startswith(tuple(xpath_matches_))
-            and node_.get('do_not_delete') != 'true'
-        ):
-            if node_ != root_element:
-                node_.getparent().remove(node_)
-        elif node_xpath != '':
-            # node matches, keep its parent too.
-            node_.getparent().set('do_not_delete', 'true')
-
-        # All children have been processed and `node_` seems to be a parent we
-        # need to keep. Remove `do_not_delete` flag to avoid rendering it in
-        # final xml
-        if node_.attrib.get('do_not_delete'):
-            del node_.attrib['do_not_delete']
-
-    def remove_root_path(path_: str) -> str:
-        return path_.replace(root_path, '')
-
-    if len(nodes_to_keep):
-        xpath_matches = get_xpath_matches()
-        process_node(root_element, xpath_matches)
-
-    if rename_root_node_to:
-        tree.getroot().tag = rename_root_node_to
-
-    return etree.tostring(
-        tree,
-        pretty_print=True,
-        encoding='utf-8',
+    Compiled `nodes_to_keep` are cached since the same nodes are usually kept
+    for many documents (e.g. every submission sent by a hook).
+
+    For example:
+    With `nodes_to_keep = ['question_2', 'question_3']` and this XML:
+    <root>
+      <group>
+          <question_1>Value1</question_1>
+          <question_2>Value2</question_2>
+      </group>
+      <question_3>Value3</question_3>
+    </root>
+
+    Results:
+    <root>
+      <group>
+          <question_2>Value2</question_2>
+      </group>
+      <question_3>Value3</question_3>
+    </root>
+    """
+    node_filter = get_node_filter(tuple(nodes_to_keep), use_xpath)
+    return node_filter.strip(
+        source,
         xml_declaration=xml_declaration,
-    ).decode()
+        rename_root_node_to=rename_root_node_to,
+    )
 
 
 def add_xml_declaration(xml_content: Union[str, bytes]) -> Union[str, bytes]:
@@ -183,6 +183,7 @@ class ExportTaskViewSet(NoUpdateModelViewSet):
             'fields_from_all_versions',
             'fields',
             'flatten',
+            'incremental',
         )
         task_data = {}
         for opt in valid_options:
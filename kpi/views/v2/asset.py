@@ -13,6 +13,7 @@ from rest_framework.response import Response
 from rest_framework_extensions.mixins import NestedViewSetMixin
 
 from kpi.constants import (
+    ASSET_SEARCH_DEFAULT_FIELD_LOOKUPS,
     ASSET_TYPES,
     ASSET_TYPE_ARG_NAME,
     ASSET_TYPE_SURVEY,
@@ -52,6 +53,7 @@ from kpi.renderers import (
 )
 from kpi.serializers import DeploymentSerializer
 from kpi.serializers.v2.asset import AssetListSerializer, AssetSerializer
+from kpi.utils.asset_list_metadata_cache import AssetListMetadataCache
 from kpi.utils.hash import calculate_hash
 from kpi.serializers.v2.reports import ReportsDetailSerializer
 from kpi.utils.kobo_to_xlsform import to_xlsform_structure
@@ -101,6 +103,12 @@ class AssetViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
     Look at [README](https://github.com/kobotoolbox/kpi#searching-assets)
     for more details.
 
+    On PostgreSQL, search results can be sorted by relevance with
+    `ordering=relevance`.
+    > Example
+    >
+    >       curl -X GET https://[kpi]/api/v2/assets/?q=health&ordering=relevance
+
     Results can be sorted with `ordering` parameter.
     Allowed fields are:
 
@@ -120,6 +128,22 @@ class AssetViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
     >
     >       curl -X GET https://[kpi]/api/v2/assets/?collections_first=true&ordering=-name
 
+    Large lists can be browsed faster with the `cursor` parameter, along with
+    the default ordering. Pass an empty `cursor` to get the first page, then
+    follow the `next` links. Each page seeks directly past the last asset of
+    the previous one instead of skipping `offset` assets.
+    The total count can be omitted with `skip_count=true`.
+
+    > Example
+    >
+    >       curl -X GET https://[kpi]/api/v2/assets/?cursor=&limit=50&skip_count=true
+    >       {
+    >           "count": null
+    >           "next": "https://[kpi]/api/v2/assets/?cursor=eyJkYXRlX21vZGlm...&limit=50&skip_count=true"
+    >           "previous": null
+    >           "results": [...]
+    >       }
+
     <hr>
 
     Get a hash of all `version_id`s of assets.
@@ -303,6 +327,17 @@ class AssetViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
 
     lookup_field = 'uid'
     pagination_class = AssetPagination
+    # Query parameters which do not narrow down the list
+    metadata_independent_params = (
+        AssetPagination.cursor_query_param,
+        AssetPagination.limit_query_param,
+        AssetPagination.offset_query_param,
+        AssetPagination.skip_count_query_param,
+        'collections_first',
+        'format',
+        'metadata',
+        'ordering',
+    )
     permission_classes = [IsOwnerOrReadOnly]
     ordering_fields = [
         'asset_type',
@@ -325,14 +360,8 @@ class AssetViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
     ]
     # Terms that can be used to search and filter return values
     # from a query `q`
-    search_default_field_lookups = [
-        'name__icontains',
-        'owner__username__icontains',
-        'settings__description__icontains',
-        'summary__icontains',
-        'tags__name__icontains',
-        'uid__icontains',
-    ]
+    search_default_field_lookups = ASSET_SEARCH_DEFAULT_FIELD_LOOKUPS
+    search_rank_field = 'search_text'
 
     @action(detail=True, renderer_classes=[renderers.JSONRenderer])
     def content(self, request, uid):
@@ -480,10 +509,23 @@ class AssetViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
     def get_metadata(self, queryset):
         """
         Prepare metadata to inject in list endpoint.
-        Useful to retrieve values needed for search
+        Useful to retrieve values needed for search.
+        Metadata only depend on filters, not on pagination or ordering, and
+        are cached per user (see `AssetListMetadataCache`)
 
         :return: dict
         """
+        params = {
+            param: values
+            for param, values in self.request.query_params.lists()
+            if param not in self.metadata_independent_params
+        }
+        user_id = get_database_user(self.request.user).pk
+        return AssetListMetadataCache.get_or_set(
+            user_id, params, lambda: self._compute_metadata(queryset)
+        )
+
+    def _compute_metadata(self, queryset):
         metadata = {
             'languages': set(),
             'countries': OrderedDict(),
@@ -584,15 +626,20 @@ class AssetViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
             # The serializer will be able to pick what it needs from that dict
             # and narrow down data according to users' permissions.
 
-            # self.__filtered_queryset is set in the `list()` method that
-            # DRF automatically calls and is overridden below. This is
-            # to prevent double calls to `filter_queryset()` as described in
-            # the issue here: https://github.com/kobotoolbox/kpi/issues/2576
-            queryset = self.__filtered_queryset
-
-            # 1) Retrieve all asset IDs of current list
-            asset_ids = AssetPagination.\
-                get_all_asset_ids_from_queryset(queryset)
+            # 1) Retrieve the asset IDs of the current page. Only these assets
+            # are serialized, so there is no need to load data for the others
+            # (which can be numerous).
+            # `self.__page` and `self.__filtered_queryset` are set in the
+            # `list()` method that DRF automatically calls and is overridden
+            # below. This is to prevent double calls to `filter_queryset()` as
+            # described in the issue here:
+            # https://github.com/kobotoolbox/kpi/issues/2576
+            if self.__page is not None:
+                asset_ids = [asset.pk for asset in self.__page]
+            else:
+                asset_ids = AssetPagination.get_all_asset_ids_from_queryset(
+                    self.__filtered_queryset
+                )
 
             # 2) Get object permissions per asset
             object_permissions = ObjectPermission.objects.filter(
@@ -615,6 +662,7 @@ class AssetViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
 
             # 3) Get the collection subscriptions per asset
             subscriptions_queryset = UserAssetSubscription.objects. \
+                filter(asset_id__in=asset_ids). \
                 values('asset_id', 'user_id').distinct().order_by('asset_id')
 
             user_subscriptions_per_asset = defaultdict(list)
@@ -650,6 +698,8 @@ class AssetViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
         self.__filtered_queryset = self.filter_queryset(self.get_queryset())
 
         page = self.paginate_queryset(self.__filtered_queryset)
+        # Lets `get_serializer_context()` load related data for this page only
+        self.__page = page
         if page is not None:
             serializer = self.get_serializer(page, many=True)
             metadata = None
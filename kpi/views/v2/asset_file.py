@@ -1,6 +1,7 @@
 # coding: utf-8
 from django.http import HttpResponseRedirect, Http404
 from private_storage.views import PrivateStorageDetailView
+from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework_extensions.mixins import NestedViewSetMixin
 
@@ -9,6 +10,10 @@ from kpi.filters import RelatedAssetPermissionsFilter
 from kpi.models import AssetFile
 from kpi.serializers.v2.asset_file import AssetFileSerializer
 from kpi.permissions import AssetEditorPermission
+from kpi.utils.conditional_response import (
+    get_conditional_headers,
+    get_not_modified_response,
+)
 from kpi.utils.viewset_mixins import AssetNestedObjectViewsetMixin
 from kpi.views.no_update_model import NoUpdateModelViewSet
 
@@ -164,6 +169,14 @@ class AssetFileViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
         if asset_file.metadata.get('redirect_url'):
             return HttpResponseRedirect(asset_file.metadata.get('redirect_url'))
 
+        # Clients which already have the current file do not need it again,
+        # and it does not need to be read from storage.
+        not_modified_response = get_not_modified_response(
+            self.request, asset_file.md5_hash, asset_file.date_modified
+        )
+        if not_modified_response is not None:
+            return not_modified_response
+
         view = self.PrivateContentView.as_view(
             model=AssetFile,
             slug_url_kwarg='uid',
@@ -174,4 +187,10 @@ class AssetFileViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
         # TODO: simply redirect if external storage with expiring tokens (e.g.
         # Amazon S3) is used?
         #   return HttpResponseRedirect(asset_file.content.url)
-        return view(self.request, uid=asset_file.uid)
+        response = view(self.request, uid=asset_file.uid)
+        if response.status_code == status.HTTP_200_OK:
+            for header, value in get_conditional_headers(
+                asset_file.md5_hash, asset_file.date_modified
+            ).items():
+                response[header] = value
+        return response
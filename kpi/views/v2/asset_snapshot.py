@@ -1,5 +1,6 @@
 # coding: utf-8
 import copy
+import json
 
 import requests
 from django.http import HttpResponseRedirect
@@ -19,6 +20,11 @@ from kpi.renderers import (
 )
 from kpi.serializers.v2.asset_snapshot import AssetSnapshotSerializer
 from kpi.serializers.v2.open_rosa import FormListSerializer, ManifestSerializer
+from kpi.utils.conditional_response import (
+    get_conditional_headers,
+    get_not_modified_response,
+)
+from kpi.utils.hash import calculate_hash
 from kpi.views.no_update_model import NoUpdateModelViewSet
 from kpi.views.v2.open_rosa import OpenRosaViewSetMixin
 
@@ -94,7 +100,20 @@ class AssetSnapshotViewSet(OpenRosaViewSetMixin, NoUpdateModelViewSet):
         context = {'request': request}
         serializer = ManifestSerializer(files, many=True, context=context)
 
-        return Response(serializer.data, headers=self.get_headers())
+        # The manifest only changes when files (or their hashes) do
+        md5_hash = calculate_hash(
+            json.dumps(serializer.data, sort_keys=True), prefix=True
+        )
+        not_modified_response = get_not_modified_response(request, md5_hash)
+        if not_modified_response is not None:
+            # OpenRosa clients expect their headers on every response
+            for header, value in self.get_headers().items():
+                not_modified_response[header] = value
+            return not_modified_response
+
+        headers = self.get_headers()
+        headers.update(get_conditional_headers(md5_hash))
+        return Response(serializer.data, headers=headers)
 
     @action(detail=True, renderer_classes=[renderers.TemplateHTMLRenderer])
     def preview(self, request, *args, **kwargs):
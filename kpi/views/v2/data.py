@@ -1,6 +1,8 @@
 # coding: utf-8
 import json
+import uuid
 
+from celery.result import AsyncResult
 from django.conf import settings
 from django.http import Http404
 from django.utils.translation import ugettext_lazy as _
@@ -13,9 +15,11 @@ from rest_framework import (
 from rest_framework.decorators import action
 from rest_framework.pagination import _positive_int as positive_int
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework_extensions.mixins import NestedViewSetMixin
 
 from kpi.constants import (
+    BULK_UPDATE_SUBMISSIONS_PROGRESS,
     SUBMISSION_FORMAT_TYPE_JSON,
     PERM_CHANGE_SUBMISSIONS,
     PERM_DELETE_SUBMISSIONS,
@@ -23,7 +27,7 @@ from kpi.constants import (
 )
 from kpi.exceptions import ObjectDeploymentDoesNotExist
 from kpi.models import Asset
-from kpi.paginators import DataPagination
+from kpi.paginators import DataCursorPagination, DataPagination
 from kpi.permissions import (
     DuplicateSubmissionPermission,
     EditSubmissionPermission,
@@ -34,6 +38,7 @@ from kpi.permissions import (
 from kpi.renderers import SubmissionGeoJsonRenderer, SubmissionXMLRenderer
 from kpi.utils.viewset_mixins import AssetNestedObjectViewsetMixin
 from kpi.serializers.v2.data import DataBulkActionsValidator
+from kpi.tasks import bulk_update_submissions_in_background
 
 
 class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
@@ -75,6 +80,23 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
     >
     >       curl -X GET https://[kpi]/api/v2/assets/aSAvYreNzVEkrWg5Gdcvg/data/?start=0&limit=10
 
+    ### Cursor pagination
+    Deep pages are slow to retrieve with `start`. Pass an empty `cursor`
+    instead to get the first page, then follow the `next` link of each page:
+    it seeks directly to the following submissions, whatever the depth of
+    the page.
+
+    * `cursor`: Opaque token provided by the `next` link
+    * `limit`: Number of results per page
+    * `sort`: One key only, e.g. `{"_submission_time": -1}`. Default is `{"_id": 1}`
+    * `skip_count`: Set to `true` to omit the total number of results (`count` is `null`)
+
+    `start` cannot be used along with `cursor`, which is only available in JSON format.
+
+    > Example: The first ten results, without the total count
+    >
+    >       curl -X GET 'https://[kpi]/api/v2/assets/aSAvYreNzVEkrWg5Gdcvg/data/?cursor=&limit=10&skip_count=true'
+
     ## Query submitted data
     Provides a list of submitted data for a specific form. Use `query`
     parameter to apply form data specific, see
@@ -275,6 +297,29 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
     "group_1/sub_group_1/.../sub_group_n/question_1": "new value"
     </pre>
 
+    Large updates can run in the background by adding `?background=true` to
+    the URL. The response (`202`) contains the URL of the status of the task:
+
+    <pre class="prettyprint">
+    <b>GET</b> /api/v2/assets/<code>{uid}</code>/data/bulk/<code>{task_id}</code>/
+    </pre>
+
+    > Response
+    >
+    >       HTTP 200 Ok
+    >        {
+    >           "status": "PROGRESS",
+    >           "progress": {
+    >               "done": 1500,
+    >               "total": 10000
+    >           }
+    >        }
+
+    `status` can be `PENDING`, `PROGRESS`, `SUCCESS` or `FAILURE`. Once the
+    task succeeds, the response contains the results of the update as
+    `data`, and the status code they would have been returned with as
+    `status_code`.
+
 
     ### CURRENT ENDPOINT
     """
@@ -316,10 +361,61 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
 
         bulk_actions_validator = DataBulkActionsValidator(**kwargs)
         bulk_actions_validator.is_valid(raise_exception=True)
+
+        if (
+            request.method == 'PATCH'
+            and request.query_params.get('background') == 'true'
+        ):
+            # Prefix the task id with the asset uid to make sure
+            # `bulk_status()` only reports tasks of this asset
+            task_id = f'{self.asset.uid}-{uuid.uuid4()}'
+            bulk_update_submissions_in_background.apply_async(
+                args=(
+                    self.asset.uid,
+                    bulk_actions_validator.data,
+                    request.user.pk,
+                ),
+                task_id=task_id,
+            )
+            return Response(
+                {
+                    'task_id': task_id,
+                    'status_url': reverse(
+                        'submission-bulk-status',
+                        kwargs={
+                            'parent_lookup_asset': self.asset.uid,
+                            'task_id': task_id,
+                        },
+                        request=request,
+                    ),
+                },
+                status=status.HTTP_202_ACCEPTED,
+            )
+
         json_response = action_(bulk_actions_validator.data, request.user)
 
         return Response(**json_response)
 
+    @action(detail=False, methods=['GET'],
+            renderer_classes=[renderers.JSONRenderer],
+            url_path=r'bulk/(?P<task_id>[\w\-]+)')
+    def bulk_status(self, request, task_id, *args, **kwargs):
+        self._get_deployment()
+        if not task_id.startswith(f'{self.asset.uid}-'):
+            raise Http404
+
+        # Celery reports unknown tasks as pending
+        result = AsyncResult(task_id)
+        response = {'status': result.state}
+        if result.state == BULK_UPDATE_SUBMISSIONS_PROGRESS:
+            response['progress'] = result.info
+        elif result.successful():
+            response.update(result.result)
+        elif result.failed():
+            response['detail'] = str(result.result)
+
+        return Response(response)
+
     def destroy(self, request, pk, *args, **kwargs):
         deployment = self._get_deployment()
         # Coerce to int because back end only finds matches with same type
@@ -371,6 +467,22 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
                 )
             )
 
+        if DataCursorPagination.is_requested(request):
+            if format_type != SUBMISSION_FORMAT_TYPE_JSON:
+                raise serializers.ValidationError({
+                    'cursor': _('This param is only supported in `JSON` format')
+                })
+            paginator = DataCursorPagination()
+            submissions = deployment.get_submissions(
+                request.user,
+                format_type=format_type,
+                **paginator.get_mongo_params(request, deployment, filters)
+            )
+            page = paginator.paginate_submissions(submissions)
+            return paginator.get_paginated_response(page)
+
+        # The count is needed by `DataPagination`
+        filters.pop(DataCursorPagination.skip_count_query_param, None)
         submissions = deployment.get_submissions(request.user,
                                                  format_type=format_type,
                                                  **filters)
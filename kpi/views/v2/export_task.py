@@ -71,7 +71,8 @@ class ExportTaskViewSet(
     >           "multiple_select": "both",
     >           "type": "geojson",
     >           "fields": ["field_1", "field_2"],
-    >           "flatten": "true"
+    >           "flatten": "true",
+    >           "incremental": "false"
     >        }
 
     where:
@@ -94,6 +95,7 @@ class ExportTaskViewSet(
         * An empty array which will result in all columns being included
         * If "fields" is not included in the "export_settings", all columns will be included in the export
     * "flatten" (optional) is a boolean value and only relevant when exporting to "geojson" format.
+    * "incremental" (optional) is a boolean value and only relevant when exporting to "csv" or "geojson" format. When `true`, the latest incremental export with the same options is reused and only new and edited submissions are processed.
 
 
     ### Retrieves current export task
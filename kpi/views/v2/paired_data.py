@@ -1,6 +1,11 @@
 # coding: utf-8
+import hashlib
+import shutil
+import tempfile
+from typing import BinaryIO, Optional
+
 from django.conf import settings
-from django.core.files.base import ContentFile
+from django.core.files.base import File
 from django.http import Http404
 from django.utils import timezone
 from rest_framework import renderers, viewsets
@@ -8,7 +13,6 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework_extensions.mixins import NestedViewSetMixin
 
-from kpi.constants import SUBMISSION_FORMAT_TYPE_XML
 from kpi.models import Asset, AssetFile, PairedData
 from kpi.permissions import (
     AssetEditorPermission,
@@ -16,7 +20,19 @@ from kpi.permissions import (
 )
 from kpi.serializers.v2.paired_data import PairedDataSerializer
 from kpi.renderers import SubmissionXMLRenderer
-from kpi.utils.hash import calculate_hash
+from kpi.utils.conditional_response import (
+    get_conditional_headers,
+    get_not_modified_response,
+)
+from kpi.utils.incremental_export import (
+    diff_submissions,
+    get_fingerprint,
+    merge_sorted_chunks,
+    read_chunks,
+    read_index,
+    write_chunks,
+    write_index,
+)
 from kpi.utils.viewset_mixins import AssetNestedObjectViewsetMixin
 from kpi.utils.xml import strip_nodes, add_xml_declaration
 
@@ -178,6 +194,13 @@ class PairedDataViewset(AssetNestedObjectViewsetMixin,
     permission_classes = (AssetEditorPermission,)
     serializer_class = PairedDataSerializer
 
+    # Submission attributes whose change alters the XML of a submission.
+    # KoBoCAT assigns a new `instanceID` on every edit
+    XML_FINGERPRINT_FIELDS = ('_uuid', 'meta/instanceID')
+    # Above this number of edited submissions, regenerating the whole XML is
+    # cheaper than querying the edited submissions by id
+    MAX_CHANGED_SUBMISSIONS = 50000
+
     @action(detail=True,
             methods=['GET'],
             permission_classes=[XMLExternalDataPermission],
@@ -242,64 +265,81 @@ class PairedDataViewset(AssetNestedObjectViewsetMixin,
                     timedelta.total_seconds() > settings.PAIRED_DATA_EXPIRATION
                 )
 
-        # ToDo evaluate adding headers for caching and a HTTP 304 status code
         if not has_expired:
-            return Response(asset_file.content.file.read().decode())
-
-        # If the content of `asset_file' has expired, let's regenerate the XML
-        submissions = source_asset.deployment.get_submissions(
-            self.asset.owner,
-            format_type=SUBMISSION_FORMAT_TYPE_XML
-        )
-        parsed_submissions = []
-
-        for submission in submissions:
-            # Use `rename_root_node_to='item'` to rename the root node of each
-            # submission to `item` so that form authors do not have to rewrite
-            # their `xml-external` formulas any time the asset UID changes,
-            # and most importantly to integrate well with all pyxform xpath
-            # evaluations that are always prefixed by root/item
-            # e.g. when cloning a form or creating a project from a template.
-            # Set `use_xpath=True` because `paired_data.fields` uses full group
-            # hierarchies, not just question names.
-            parsed_submissions.append(
-                strip_nodes(
-                    submission,
-                    paired_data.allowed_fields,
-                    use_xpath=True,
-                    rename_root_node_to='item',
-                )
+            # Clients which already have the current file do not need it
+            # again, and it does not need to be read from storage.
+            not_modified_response = get_not_modified_response(
+                request, asset_file.md5_hash, asset_file.date_modified
+            )
+            if not_modified_response is not None:
+                return not_modified_response
+
+            return Response(
+                asset_file.content.file.read().decode(),
+                headers=get_conditional_headers(
+                    asset_file.md5_hash, asset_file.date_modified
+                ),
             )
 
-        filename = paired_data.filename
-        parsed_submissions_to_str = ''.join(parsed_submissions)
-        root_tag_name = SubmissionXMLRenderer.root_tag_name
-        xml_ = add_xml_declaration(
-            f'<{root_tag_name}>'
-            f'{parsed_submissions_to_str}'
-            f'</{root_tag_name}>'
-        )
-
-        if not parsed_submissions:
-            # We do not want to cache an empty file
-            return Response(xml_)
+        # If the content of `asset_file' has expired, let's regenerate the XML.
+        # It is written to a temporary file, then streamed to storage.
+        with tempfile.TemporaryFile() as xml_file, \
+                tempfile.TemporaryFile() as chunk_file:
+            md5_hash, indexed = self._write_external_xml(
+                paired_data, source_asset, asset_file, xml_file, chunk_file
+            )
 
-        # We need to delete the current file (if it exists) when filename
-        # has changed. Otherwise, it would leave an orphan file on storage
-        if asset_file.pk and asset_file.content.name != filename:
-            asset_file.content.delete()
+            if md5_hash is None:
+                # We do not want to cache an empty file
+                root_tag_name = SubmissionXMLRenderer.root_tag_name
+                return Response(
+                    add_xml_declaration(
+                        f'<{root_tag_name}></{root_tag_name}>'
+                    )
+                )
 
-        asset_file.content = ContentFile(xml_.encode(), name=filename)
+            # The previous file (if it exists) must be deleted. Otherwise, it
+            # would leave an orphan file on storage
+            if asset_file.pk and asset_file.content:
+                asset_file.delete_index()
+                asset_file.content.delete(save=False)
+
+            xml_file.seek(0)
+            asset_file.content = File(xml_file, name=paired_data.filename)
+            asset_file.set_md5_hash(md5_hash)
+            asset_file.save()
+
+            if indexed:
+                storage = asset_file.content.storage
+                index_file_name = asset_file.index_file_name
+                with storage.open(index_file_name, 'wb') as index_file:
+                    write_index(
+                        index_file, self._get_index_metadata(paired_data), []
+                    )
+                    chunk_file.seek(0)
+                    shutil.copyfileobj(chunk_file, index_file)
+
+            # The content may not have changed since the client got it
+            not_modified_response = get_not_modified_response(
+                request, asset_file.md5_hash, asset_file.date_modified
+            )
+            if not_modified_response is None:
+                xml_file.seek(0)
+                xml_ = xml_file.read().decode()
 
-        # `xml_` is already there in memory, let's use its content to get its
-        # hash and store it within `asset_file` metadata
-        asset_file.set_md5_hash(calculate_hash(xml_, prefix=True))
-        asset_file.save()
         if old_hash != asset_file.md5_hash:
             # resync paired data to the deployment backend
             self.asset.deployment.sync_media_files(AssetFile.PAIRED_DATA)
 
-        return Response(xml_)
+        if not_modified_response is not None:
+            return not_modified_response
+
+        return Response(
+            xml_,
+            headers=get_conditional_headers(
+                asset_file.md5_hash, asset_file.date_modified
+            ),
+        )
 
     def get_object(self):
         obj = self.get_queryset(as_list=False).get(
@@ -319,6 +359,200 @@ class PairedDataViewset(AssetNestedObjectViewsetMixin,
             return list(queryset.values())
         return queryset
 
+    def _get_index_metadata(self, paired_data: PairedData) -> dict:
+        """
+        Return what the XML of `paired_data` depends on, besides submissions.
+        An index written with different metadata cannot be reused.
+        """
+        return {'fields': sorted(paired_data.allowed_fields)}
+
+    def _get_previous_chunks(
+        self,
+        paired_data: PairedData,
+        asset_file: AssetFile,
+        current_fingerprints: list,
+        kept_chunk_file: BinaryIO,
+    ) -> (list, Optional[int]):
+        """
+        Compare the submissions written in the current XML of `asset_file`
+        with `current_fingerprints`. See `diff_submissions()`.
+
+        Return `([], None)` if the XML cannot be reused.
+        """
+        if not asset_file.pk or not asset_file.content:
+            return [], None
+
+        storage = asset_file.content.storage
+        if not storage.exists(asset_file.index_file_name):
+            return [], None
+
+        with storage.open(asset_file.index_file_name, 'rb') as index_file:
+            metadata, previous_chunks = read_index(index_file)
+            if metadata != self._get_index_metadata(paired_data):
+                return [], None
+
+            return diff_submissions(
+                previous_chunks, current_fingerprints, kept_chunk_file
+            )
+
+    def _write_external_xml(
+        self,
+        paired_data: PairedData,
+        source_asset: Asset,
+        asset_file: AssetFile,
+        xml_file: BinaryIO,
+        chunk_file: BinaryIO,
+    ) -> (Optional[str], bool):
+        """
+        Write the XML of the submissions of `source_asset` to `xml_file`, and
+        where each submission is written in it to `chunk_file` (see
+        `write_chunks()`).
+
+        Only submissions added or edited since the current XML of `asset_file`
+        was written are retrieved and stripped, the others are copied from it.
+        The MD5 hash of the XML is updated as it is written.
+
+        Return a tuple of
+            - the hash, or `None` if there are no submissions;
+            - whether `chunk_file` can be used to index the XML.
+        """
+        deployment = source_asset.deployment
+        user = self.asset.owner
+        allowed_fields = paired_data.allowed_fields
+        # `(_id, fingerprint)` of every submission, sorted by `_id`
+        current_fingerprints = [
+            (
+                submission['_id'],
+                get_fingerprint(submission, self.XML_FINGERPRINT_FIELDS),
+            )
+            for submission in deployment.get_submissions(
+                user,
+                fields=['_id', *self.XML_FINGERPRINT_FIELDS],
+                sort={'_id': 1},
+            )
+        ]
+        if not current_fingerprints:
+            return None, False
+
+        max_current_id = current_fingerprints[-1][0]
+
+        with tempfile.TemporaryFile() as kept_chunk_file, \
+                tempfile.TemporaryFile() as new_file, \
+                tempfile.TemporaryFile() as new_chunk_file:
+
+            changed_ids, max_previous_id = self._get_previous_chunks(
+                paired_data, asset_file, current_fingerprints, kept_chunk_file
+            )
+            if (
+                max_previous_id is None
+                or len(changed_ids) > self.MAX_CHANGED_SUBMISSIONS
+            ):
+                # Nothing to reuse, every submission is written again.
+                # Submissions received in the meantime are left out, their
+                # fingerprint is unknown.
+                kept_chunk_file.truncate(0)
+                changed_ids = set()
+                max_previous_id = None
+                query = {'_id': {'$lte': max_current_id}}
+            else:
+                changed_ids = set(changed_ids)
+                query = {
+                    '$or': [
+                        {'_id': {'$in': list(changed_ids)}},
+                        {
+                            '_id': {
+                                '$gt': max_previous_id,
+                                '$lte': max_current_id,
+                            }
+                        },
+                    ]
+                }
+
+            new_fingerprints = {
+                id_: fingerprint
+                for id_, fingerprint in current_fingerprints
+                if id_ in changed_ids
+                or max_previous_id is None
+                or id_ > max_previous_id
+            }
+
+            # Submissions are returned sorted by `_id`. Some of them may have
+            # been deleted in the meantime.
+            submission_count = 0
+            offset = 0
+            if new_fingerprints:
+                submissions = deployment.get_xml_submissions_with_ids(
+                    user, query=query
+                )
+                for id_, submission in submissions:
+                    try:
+                        fingerprint = new_fingerprints[id_]
+                    except KeyError:
+                        continue
+                    submission_count += 1
+                    # Use `rename_root_node_to='item'` to rename the root node
+                    # of each submission to `item` so that form authors do not
+                    # have to rewrite their `xml-external` formulas any time
+                    # the asset UID changes, and most importantly to integrate
+                    # well with all pyxform xpath evaluations that are always
+                    # prefixed by root/item e.g. when cloning a form or
+                    # creating a project from a template.
+                    # Set `use_xpath=True` because `paired_data.fields` uses
+                    # full group hierarchies, not just question names.
+                    data = strip_nodes(
+                        submission,
+                        allowed_fields,
+                        use_xpath=True,
+                        rename_root_node_to='item',
+                    ).encode()
+                    new_file.write(data)
+                    write_chunks(
+                        new_chunk_file, [[id_, fingerprint, offset, len(data)]]
+                    )
+                    offset += len(data)
+
+            # Otherwise, the XML is still complete but cannot be indexed
+            indexed = submission_count == len(new_fingerprints)
+
+            md5_hash = hashlib.md5()
+
+            def write(data_: bytes):
+                xml_file.write(data_)
+                md5_hash.update(data_)
+
+            root_tag_name = SubmissionXMLRenderer.root_tag_name
+            write(add_xml_declaration(f'<{root_tag_name}>').encode())
+            offset = xml_file.tell()
+
+            kept_chunk_file.seek(0)
+            new_chunk_file.seek(0)
+            merged_chunks = merge_sorted_chunks(
+                read_chunks(kept_chunk_file), read_chunks(new_chunk_file)
+            )
+            storage = asset_file.content.storage
+            previous_file = (
+                storage.open(asset_file.content.name, 'rb')
+                if max_previous_id is not None
+                else None
+            )
+            try:
+                for is_new, chunk in merged_chunks:
+                    id_, fingerprint, chunk_offset, length = chunk
+                    source_file = new_file if is_new else previous_file
+                    source_file.seek(chunk_offset)
+                    write(source_file.read(length))
+                    write_chunks(
+                        chunk_file, [[id_, fingerprint, offset, length]]
+                    )
+                    offset += length
+            finally:
+                if previous_file:
+                    previous_file.close()
+
+            write(f'</{root_tag_name}>'.encode())
+
+        return f'md5:{md5_hash.hexdigest()}', indexed
+
     def get_serializer_context(self):
         context_ = super().get_serializer_context()
         context_['asset'] = self.asset